@@ -0,0 +1,365 @@
+"""
+API JSON para los quioscos y los puestos de escáner del mostrador.
+
+Las vistas HTML responden a cada préstamo o devolución con una redirección
+y un mensaje flash. Un mostrador que escanea un carro de libros hacía así una
+petición (y una página) por libro. Aquí los lotes van en una sola petición y
+pasan por loan_service.checkout_batch() y return_batch(), con un número fijo
+de sentencias por lote:
+
+- ``POST /api/session``: inicia sesión con ``{"username", "password"}``; la
+  cookie de sesión autentica las demás peticiones. ``DELETE`` la cierra.
+- ``GET /api/books?cursor=&q=&category=&available=1``: catálogo paginado por
+  cursor, con ETag/304 (response_cache).
+- ``GET /api/books/<id>``.
+- ``GET /api/loans?cursor=&status=&user_id=``: los préstamos propios; los
+  administradores ven todos y pueden filtrar por usuario.
+- ``POST /api/loans:batch``: ``{"loans": [{"user_id": 1, "book_id": 2}, ...]}``.
+  Los alumnos solo piden para sí mismos y pueden omitir ``user_id``.
+- ``POST /api/returns:batch``: ``{"loan_ids": [...]}``. Los alumnos solo
+  devuelven sus préstamos.
+- ``GET /api/lookup/books?q=&available=1`` y ``GET /api/lookup/users?q=``
+  (solo administradores): typeahead para los select2 de admin_add_loan y
+  my_loans, en el formato ``{"results": [{"id", "text"}]}`` de select2.
+  Devuelven las TYPEAHEAD_LIMIT primeras coincidencias por prefijo: los
+  libros con el índice de búsqueda, los usuarios con los índices sobre
+  ``lower(first_name)``, ``lower(last_name)``, ``lower(username)`` y
+  ``lower(email)``, sin distinguir mayúsculas.
+
+Todos los errores bajo ``/api/`` son JSON ``{"error", "message"}``, también
+los 404 y 405 de rutas que no existen.
+
+Los lotes devuelven un resultado por elemento, en el mismo orden, con
+``loan_id`` o ``error`` (el código de loan_service; ``message`` lo explica).
+Un elemento rechazado no impide procesar los demás. Los lotes están
+limitados a API_BATCH_MAX elementos.
+"""
+
+import sys
+from functools import wraps
+
+from flask import Blueprint, abort, jsonify, request
+from flask_login import current_user, login_user, logout_user
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import load_only
+from werkzeug.exceptions import HTTPException
+
+import audit
+import loan_archive
+import loan_service
+import passwords
+from app import app
+from models import OUTSTANDING_STATUSES, Book, Loan, User
+from pagination import keyset_paginate
+from response_cache import cached_page
+from search import search_books, search_rank
+
+blueprint = Blueprint('api', __name__, url_prefix='/api')
+
+# Columnas del listado; la descripción solo va en el detalle
+BOOK_LIST_COLUMNS = (Book.id, Book.title, Book.author, Book.isbn, Book.category,
+                     Book.total_copies, Book.available_copies)
+
+LOGIN_ERROR_STATUS = {passwords.INVALID: 401, passwords.THROTTLED: 429, passwords.BUSY: 503}
+
+LOAN_STATUSES = ('active', 'overdue', 'returned', 'outstanding')
+
+# Rechazos propios de la API en /loans:batch; el resto son de loan_service
+INVALID_ITEM = 'invalid_item'
+CHECKOUT_MESSAGES = {
+    INVALID_ITEM: 'Cada elemento necesita "book_id" (y "user_id") enteros.',
+    loan_service.FORBIDDEN: 'Solo puedes pedir préstamos a tu nombre.',
+}
+
+
+def error(status, code, message=None):
+    payload = {'error': code}
+    if message:
+        payload['message'] = message
+    return jsonify(payload), status
+
+
+@blueprint.errorhandler(HTTPException)
+def _http_error(e):
+    body, status = error(e.code, e.name.lower().replace(' ', '_'), e.description)
+    if getattr(e, 'valid_methods', None):
+        return body, status, {'Allow': ', '.join(e.valid_methods)}
+    return body, status
+
+
+# Los 404/405 de enrutado no llegan al errorhandler del blueprint: no hay vista
+@app.errorhandler(404)
+@app.errorhandler(405)
+def _routing_error(e):
+    if request.path == blueprint.url_prefix or request.path.startswith(f"{blueprint.url_prefix}/"):
+        return _http_error(e)
+    return e
+
+
+def _is_id(value):
+    # bool es subclase de int: true no es el id 1
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def api_login_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not current_user.is_authenticated:
+            return error(401, 'unauthorized', 'Inicia sesión en /api/session.')
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def _json_body():
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        abort(400, 'El cuerpo debe ser un objeto JSON.')
+    return body
+
+
+def _batch(body, key):
+    items = body.get(key)
+    if not isinstance(items, list):
+        abort(400, f"'{key}' debe ser una lista.")
+    if len(items) > app.config['API_BATCH_MAX']:
+        abort(413, f"Como máximo {app.config['API_BATCH_MAX']} elementos por lote.")
+    return items
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
+def book_json(book, detail=False):
+    data = {
+        'id': book.id,
+        'title': book.title,
+        'author': book.author,
+        'isbn': book.isbn,
+        'category': book.category,
+        'total': book.total_copies,
+        'available': book.available_copies,
+    }
+    if detail:
+        data.update(publisher=book.publisher, year=book.publication_year, description=book.description)
+    return data
+
+
+def loan_json(loan):
+    return {
+        'id': loan.id,
+        'user_id': loan.user_id,
+        'book_id': loan.book_id,
+        'status': loan.status,
+        'loan_date': _isoformat(loan.loan_date),
+        'due_date': _isoformat(loan.due_date),
+        'return_date': _isoformat(loan.return_date),
+    }
+
+
+def page_json(page, serialize):
+    return jsonify(items=[serialize(item) for item in page.items], next_cursor=page.next_cursor)
+
+
+@blueprint.route('/session', methods=['POST'])
+def login():
+    body = _json_body()
+    try:
+        user = passwords.authenticate(str(body.get('username') or ''), str(body.get('password') or ''),
+                                      request.remote_addr)
+    except passwords.LoginError as e:
+        return error(LOGIN_ERROR_STATUS[e.reason], e.reason, e.message)
+    login_user(user)
+    return jsonify(id=user.id, username=user.username, role=user.role)
+
+
+@blueprint.route('/session', methods=['DELETE'])
+def logout():
+    logout_user()
+    return '', 204
+
+
+@blueprint.route('/books')
+@api_login_required
+@cached_page
+def books():
+    search_query = request.args.get('q', '')
+    category = request.args.get('category', '')
+
+    query = Book.query.options(load_only(*BOOK_LIST_COLUMNS))
+    keys = [Book.title, Book.id]
+    if search_query:
+        query = search_books(query, search_query, ranked=False)
+        rank = search_rank(search_query)
+        if rank is not None:
+            keys = [rank, Book.id]
+    if category:
+        query = query.filter(Book.category == category)
+    if request.args.get('available') == '1':
+        query = query.filter(Book.available_copies > 0)
+
+    return page_json(keyset_paginate(query, keys, request.args.get('cursor')), book_json)
+
+
+@blueprint.route('/books/<int:book_id>')
+@api_login_required
+@cached_page
+def book(book_id):
+    return jsonify(book_json(Book.query.get_or_404(book_id), detail=True))
+
+
+@blueprint.route('/loans')
+@api_login_required
+def loans():
+    status = request.args.get('status')
+    if status and status not in LOAN_STATUSES:
+        abort(400, f"Estado no válido; usa uno de {', '.join(LOAN_STATUSES)}.")
+
+    query = Loan.query
+    user_id = request.args.get('user_id', type=int) if current_user.is_admin else current_user.id
+    if user_id is not None:
+        query = query.filter(Loan.user_id == user_id)
+    if status == 'outstanding':
+        query = query.filter(Loan.status.in_(OUTSTANDING_STATUSES))
+    elif status:
+        query = query.filter(Loan.status == status)
+
+    # Los devueltos antiguos están en loans_archive
+    union = [loan_archive.archived_history(user_id=user_id)] if status in (None, 'returned') else ()
+    page = keyset_paginate(query, [Loan.created_at, Loan.id], request.args.get('cursor'),
+                           descending=True, union=union)
+    return page_json(page, loan_json)
+
+
+def _typeahead_limit():
+    limit = app.config['TYPEAHEAD_LIMIT']
+    return max(1, min(request.args.get('limit', limit, type=int), limit))
+
+
+def _prefix(expression, prefix):
+    """``expression`` empieza por ``prefix``, escrito como rango para que use el índice."""
+    successor = ord(prefix[-1]) + 1
+    if successor > sys.maxunicode or 0xD800 <= successor <= 0xDFFF:
+        # Sin siguiente carácter codificable (U+10FFFF, o U+D7FF antes de los sustitutos): LIKE sin índice
+        return expression.startswith(prefix, autoescape=True)
+    return and_(expression >= prefix, expression < prefix[:-1] + chr(successor))
+
+
+@blueprint.route('/lookup/books')
+@api_login_required
+def lookup_books():
+    search_query = request.args.get('q', '').strip()
+    if not search_query:
+        return jsonify(results=[])
+
+    query = search_books(Book.query.options(load_only(*BOOK_LIST_COLUMNS)), search_query)
+    if request.args.get('available') == '1':
+        query = query.filter(Book.available_copies > 0)
+    return jsonify(results=[
+        {'id': book.id, 'title': book.title,
+         'text': f"{book.title} - {book.author} ({book.available_copies} disponibles)"}
+        for book in query.limit(_typeahead_limit())
+    ])
+
+
+def user_lookup_query(term):
+    """Alumnos cuyo nombre, apellido, usuario o email empieza por ``term`` (en minúsculas)."""
+    first_name = func.lower(User.first_name)
+    last_name = func.lower(User.last_name)
+    matches = [_prefix(first_name, term), _prefix(last_name, term),
+               _prefix(func.lower(User.username), term), _prefix(func.lower(User.email), term)]
+    words = term.split(maxsplit=1)
+    if len(words) == 2:
+        # "maría garc": nombre y apellidos
+        matches.append(and_(_prefix(first_name, words[0]), _prefix(last_name, words[1])))
+
+    return (
+        User.query.options(load_only(User.id, User.username, User.email, User.first_name, User.last_name))
+        .filter(or_(*matches), User.role == 'student')
+        .order_by(last_name, first_name, User.id)
+    )
+
+
+@blueprint.route('/lookup/users')
+@api_login_required
+def lookup_users():
+    if not current_user.is_admin:
+        abort(403)
+    term = request.args.get('q', '').strip().lower()
+    if not term:
+        return jsonify(results=[])
+
+    return jsonify(results=[
+        {'id': user.id, 'text': f"{user.full_name} - {user.username} - {user.email}"}
+        for user in user_lookup_query(term).limit(_typeahead_limit())
+    ])
+
+
+def _checkout_pair(item):
+    """``(user_id, book_id)`` de un elemento del lote, o el código de error."""
+    if not isinstance(item, dict):
+        return None, INVALID_ITEM
+    user_id = item.get('user_id')
+    book_id = item.get('book_id')
+    if not current_user.is_admin:
+        if user_id is not None and user_id != current_user.id:
+            return None, loan_service.FORBIDDEN
+        user_id = current_user.id
+    if not _is_id(user_id) or not _is_id(book_id):
+        return None, INVALID_ITEM
+    return (user_id, book_id), None
+
+
+@blueprint.route('/loans:batch', methods=['POST'])
+@api_login_required
+def checkout_batch():
+    items = _batch(_json_body(), 'loans')
+
+    parsed = [_checkout_pair(item) for item in items]
+    results = iter(loan_service.checkout_batch([pair for pair, reason in parsed if reason is None]))
+
+    payload = []
+    for item, (pair, reason) in zip(items, parsed):
+        if reason is None:
+            result = next(results)
+            entry = {'user_id': result.user_id, 'book_id': result.book_id}
+            if result.ok:
+                entry['loan_id'] = result.loan_id
+            reason = result.error
+        else:
+            entry = {'user_id': item.get('user_id') if isinstance(item, dict) else None,
+                     'book_id': item.get('book_id') if isinstance(item, dict) else None}
+        if reason is not None:
+            entry.update(error=reason, message=CHECKOUT_MESSAGES.get(reason) or loan_service.MESSAGES[reason])
+        payload.append(entry)
+
+    granted = sum(1 for entry in payload if 'loan_id' in entry)
+    if granted and current_user.is_admin:
+        audit.record(current_user.id, f"Agregó {granted} préstamos desde la API")
+    return jsonify(results=payload, ok=granted, failed=len(payload) - granted)
+
+
+@blueprint.route('/returns:batch', methods=['POST'])
+@api_login_required
+def return_batch():
+    items = _batch(_json_body(), 'loan_ids')
+    if not all(_is_id(loan_id) for loan_id in items):
+        abort(400, "'loan_ids' debe ser una lista de enteros.")
+
+    owner_id = None if current_user.is_admin else current_user.id
+    results = loan_service.return_batch(items, user_id=owner_id)
+
+    payload = []
+    for result in results:
+        entry = {'loan_id': result.loan_id}
+        if result.ok:
+            entry['book_id'] = result.book_id
+        else:
+            entry.update(error=result.error, message=loan_service.MESSAGES[result.error])
+        payload.append(entry)
+
+    returned = sum(1 for result in results if result.ok)
+    return jsonify(results=payload, ok=returned, failed=len(results) - returned)
+
+
+app.register_blueprint(blueprint)
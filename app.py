@@ -5,8 +5,13 @@ from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
 
+import sqlite_profile
+import instrumentation
+import server_session
+import assets
+
 # Configure logging
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "DEBUG").upper())
 
 class Base(DeclarativeBase):
     pass
@@ -17,7 +22,9 @@ def create_app():
     # Create the app
     app = Flask(__name__)
     app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key")
-    app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
+    # Reverse proxies in front of gunicorn whose X-Forwarded-For is trusted for the client IP (Replit: 1);
+    # the per-IP login limit counts remote_addr, so without it every login shares the proxy's address
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=int(os.environ.get("TRUSTED_PROXY_HOPS", 1)), x_proto=1, x_host=1)
 
     # Configure the database with SQLite fallback
     database_url = os.environ.get("DATABASE_URL")
@@ -33,37 +40,128 @@ def create_app():
     app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
         "pool_recycle": 300,
         "pool_pre_ping": True,
+        # Connections per process; at least GUNICORN_THREADS so threaded workers never wait for one
+        "pool_size": int(os.environ.get("SQLALCHEMY_POOL_SIZE", 10)),
     }
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
+    # Listings: rows per page, upper bound for ?per_page=, rows fetched per batch when streaming
+    app.config["PAGE_SIZE"] = int(os.environ.get("PAGE_SIZE", 50))
+    app.config["MAX_PAGE_SIZE"] = int(os.environ.get("MAX_PAGE_SIZE", 500))
+    app.config["STREAM_BATCH_SIZE"] = int(os.environ.get("STREAM_BATCH_SIZE", 500))
+
+    # Action log writes: "async" (queued, batched by a background thread) or "sync" (commit per call)
+    app.config["AUDIT_LOG_MODE"] = os.environ.get("AUDIT_LOG_MODE", "async")
+    app.config["AUDIT_LOG_QUEUE_SIZE"] = int(os.environ.get("AUDIT_LOG_QUEUE_SIZE", 10000))
+    app.config["AUDIT_LOG_BATCH_SIZE"] = int(os.environ.get("AUDIT_LOG_BATCH_SIZE", 200))
+    app.config["AUDIT_LOG_FLUSH_INTERVAL"] = float(os.environ.get("AUDIT_LOG_FLUSH_INTERVAL", 0.5))
+
+    # Action log retention: entries older than AUDIT_RETENTION_DAYS leave action_logs in chunks of AUDIT_PRUNE_CHUNK
+    # rows, one short transaction each, sleeping AUDIT_PRUNE_PAUSE seconds in between so request writes get the lock;
+    # "thread" prunes every AUDIT_RETENTION_INTERVAL seconds inside the web workers, "off" leaves it to `flask prune-audit-log`
+    app.config["AUDIT_RETENTION_DAYS"] = int(os.environ.get("AUDIT_RETENTION_DAYS", 365))
+    app.config["AUDIT_RETENTION_SCHEDULER"] = os.environ.get("AUDIT_RETENTION_SCHEDULER", "thread")
+    app.config["AUDIT_RETENTION_INTERVAL"] = int(os.environ.get("AUDIT_RETENTION_INTERVAL", 86400))
+    app.config["AUDIT_PRUNE_CHUNK"] = int(os.environ.get("AUDIT_PRUNE_CHUNK", 500))
+    app.config["AUDIT_PRUNE_PAUSE"] = float(os.environ.get("AUDIT_PRUNE_PAUSE", 0.05))
+    # Before pruning, count entries per day, user and action in action_log_daily ("on"/"off") and append them to
+    # gzipped JSONL segments (one per batch and month) in AUDIT_ARCHIVE_DIR (empty = keep no cold copy)
+    app.config["AUDIT_ROLLUP"] = os.environ.get("AUDIT_ROLLUP", "on")
+    app.config["AUDIT_ARCHIVE_DIR"] = os.environ.get("AUDIT_ARCHIVE_DIR", os.path.join(app.instance_path, "audit_archive"))
+
+    # Flask-Login user_loader cache: "memory" (per process), "sqlite" (shared file) or "none"
+    app.config["USER_CACHE_BACKEND"] = os.environ.get("USER_CACHE_BACKEND", "memory")
+    app.config["USER_CACHE_TTL"] = int(os.environ.get("USER_CACHE_TTL", 60))
+    app.config["USER_CACHE_SIZE"] = int(os.environ.get("USER_CACHE_SIZE", 10000))
+    app.config["USER_CACHE_PATH"] = os.environ.get("USER_CACHE_PATH")
+
+    # Seconds the category facet list may be reused while the catalog version is unchanged
+    app.config["FACET_CACHE_TTL"] = int(os.environ.get("FACET_CACHE_TTL", 300))
+
+    # Records written per transaction by the catalog import
+    app.config["IMPORT_BATCH_SIZE"] = int(os.environ.get("IMPORT_BATCH_SIZE", 1000))
+
+    # Eager-loading strategy per loan listing: "joined", "selectin" or "lazy"
+    app.config["LOAN_LOADING"] = {
+        "manage_loans": os.environ.get("LOAN_LOADING_MANAGE_LOANS", "joined"),
+        "my_loans": os.environ.get("LOAN_LOADING_MY_LOANS", "joined"),
+        "student_dashboard": os.environ.get("LOAN_LOADING_STUDENT_DASHBOARD", "joined"),
+    }
+
+    # SQLite connection profile: "production" (WAL, busy_timeout, mmap...) or "none"
+    app.config["SQLITE_PROFILE"] = os.environ.get("SQLITE_PROFILE", "production")
+
+    # Overdue scheduler: "thread" (runs inside each web worker) or "off" (use `flask overdue-worker` or cron)
+    app.config["OVERDUE_SCHEDULER"] = os.environ.get("OVERDUE_SCHEDULER", "thread")
+    app.config["OVERDUE_INTERVAL"] = int(os.environ.get("OVERDUE_INTERVAL", 300))
+    app.config["OVERDUE_FINE_CENTS_PER_DAY"] = int(os.environ.get("OVERDUE_FINE_CENTS_PER_DAY", 50))
+
+    # Loan archival: returned loans older than LOAN_ARCHIVE_AFTER_DAYS move to loans_archive in batches;
+    # "thread" runs it every LOAN_ARCHIVE_INTERVAL seconds inside the web workers, "off" leaves it to `flask archive-loans`
+    app.config["LOAN_ARCHIVE_SCHEDULER"] = os.environ.get("LOAN_ARCHIVE_SCHEDULER", "thread")
+    app.config["LOAN_ARCHIVE_INTERVAL"] = int(os.environ.get("LOAN_ARCHIVE_INTERVAL", 86400))
+    app.config["LOAN_ARCHIVE_AFTER_DAYS"] = int(os.environ.get("LOAN_ARCHIVE_AFTER_DAYS", 180))
+    app.config["LOAN_ARCHIVE_BATCH_SIZE"] = int(os.environ.get("LOAN_ARCHIVE_BATCH_SIZE", 1000))
+
+    # Session store: "sqlite", "filesystem", "redis", "memory" or "cookie" (Flask's signed cookie)
+    app.config["SESSION_BACKEND"] = os.environ.get("SESSION_BACKEND", "sqlite")
+    app.config["SESSION_PATH"] = os.environ.get("SESSION_PATH")
+    app.config["SESSION_REDIS_URL"] = os.environ.get("SESSION_REDIS_URL", "redis://localhost:6379/0")
+    app.config["SESSION_GC_INTERVAL"] = int(os.environ.get("SESSION_GC_INTERVAL", 300))
+    app.config["SESSION_GC_BATCH"] = int(os.environ.get("SESSION_GC_BATCH", 500))
+    server_session.install(app)
+
+    # Catalog page cache (ETag/304 plus in-memory HTML): "on" or "off"; LRU bounded by total body size
+    app.config["RESPONSE_CACHE"] = os.environ.get("RESPONSE_CACHE", "on")
+    app.config["RESPONSE_CACHE_MAX_BYTES"] = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+
+    # Fingerprinted static files built by `flask build-assets`: "on" or "off" (plain /static URLs)
+    app.config["ASSETS"] = os.environ.get("ASSETS", "on")
+    app.config["ASSETS_DIR"] = os.environ.get("ASSETS_DIR")
+    # Image widths (px) generated for srcset; 2x the displayed sizes of the logo and the cover animation
+    app.config["ASSET_IMAGE_WIDTHS"] = [int(width) for width in os.environ.get("ASSET_IMAGE_WIDTHS", "64,240").split(",")]
+    assets.install(app)
+
+    # Maximum checkouts or returns per /api/loans:batch or /api/returns:batch request
+    app.config["API_BATCH_MAX"] = int(os.environ.get("API_BATCH_MAX", 500))
+    # Matches returned per keystroke by the /api/lookup typeahead endpoints
+    app.config["TYPEAHEAD_LIMIT"] = int(os.environ.get("TYPEAHEAD_LIMIT", 20))
+
+    # Password hashing: Werkzeug method string with cost ("scrypt", "scrypt:16384:8:1", "pbkdf2:sha256:600000");
+    # older hashes are upgraded in the background after a successful login
+    app.config["PASSWORD_HASH_METHOD"] = os.environ.get("PASSWORD_HASH_METHOD", "scrypt")
+    # Concurrent hash verifications per process (0 = verify inline) and queued logins before answering "busy"
+    app.config["PASSWORD_HASH_WORKERS"] = int(os.environ.get("PASSWORD_HASH_WORKERS", os.cpu_count() or 2))
+    app.config["PASSWORD_HASH_QUEUE"] = int(os.environ.get("PASSWORD_HASH_QUEUE", 64))
+    # Failed logins allowed per username and per IP within the window (seconds) before rejecting without hashing;
+    # LOGIN_MAX_FAILURES_PER_IP=0 disables the per-IP limit (use it when no trusted proxy supplies the client IP)
+    app.config["LOGIN_MAX_FAILURES"] = int(os.environ.get("LOGIN_MAX_FAILURES", 5))
+    app.config["LOGIN_MAX_FAILURES_PER_IP"] = int(os.environ.get("LOGIN_MAX_FAILURES_PER_IP", 50))
+    app.config["LOGIN_FAILURE_WINDOW"] = int(os.environ.get("LOGIN_FAILURE_WINDOW", 300))
+
+    # Per-request instrumentation: "on" or "off"; statements slower than SLOW_QUERY_MS are logged with their plan
+    app.config["INSTRUMENTATION"] = os.environ.get("INSTRUMENTATION", "on")
+    app.config["SLOW_QUERY_MS"] = float(os.environ.get("SLOW_QUERY_MS", 200))
+    app.config["SLOW_QUERY_EXPLAIN"] = os.environ.get("SLOW_QUERY_EXPLAIN", "true").lower() == "true"
+    app.config["METRICS_SLOWEST"] = int(os.environ.get("METRICS_SLOWEST", 10))
+    # Bearer token accepted by /admin/metrics so Prometheus can scrape without a session
+    app.config["METRICS_TOKEN"] = os.environ.get("METRICS_TOKEN")
+
     # Initialize the app with the extension
     db.init_app(app)
 
+    # Register the pragma listener before the first connection is opened
+    with app.app_context():
+        sqlite_profile.install(db.engine, app.config["SQLITE_PROFILE"])
+        instrumentation.install(app, db.engine)
+
     return app
 
 # Create app instance
 app = create_app()
 
-# Import models and routes after app creation to avoid circular imports
-with app.app_context():
-    try:
-        # Import models first
-        import models  # noqa: F401
-        
-        # Test database connection and create tables
-        db.create_all()
-        logging.info("Database tables created successfully")
-        
-        # Import routes after successful database setup
-        import routes  # noqa: F401
-        
-    except Exception as e:
-        logging.error(f"Database initialization failed: {e}")
-        logging.info("Continuing with limited functionality - some features may not work")
-        
-        # Still import routes for basic functionality
-        try:
-            import routes  # noqa: F401
-        except Exception as route_error:
-            logging.error(f"Failed to import routes: {route_error}")
-            pass
+# Models and views register on the module-level app. Importing them runs no SQL:
+# tables, indexes and the search index are created by `flask --app main upgrade-db`
+import models  # noqa: E402,F401
+import migrations  # noqa: E402,F401
+import routes  # noqa: E402,F401
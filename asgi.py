@@ -0,0 +1,24 @@
+"""
+Punto de entrada ASGI.
+
+    uvicorn asgi:application --workers 4
+    gunicorn -k uvicorn.workers.UvicornWorker asgi:application
+
+Usa ``a2wsgi`` (en requirements.txt) y necesita un servidor ASGI como
+``uvicorn``, que no se instala por defecto. Las vistas siguen
+siendo síncronas: el adaptador las ejecuta en un pool de ASGI_THREADS hilos
+por proceso, así que cada proceso atiende varias peticiones a la vez, como un
+worker ``gthread`` (ver gunicorn.conf.py). Sirve para desplegar detrás de un
+servidor ASGI o junto a otras aplicaciones ASGI.
+
+No se usa ``asgiref.wsgi.WsgiToAsgi``: ejecuta todas las peticiones en un
+único hilo compartido y el proceso volvería a atender una petición a la vez.
+"""
+
+import os
+
+from a2wsgi import WSGIMiddleware
+
+from app import app
+
+application = WSGIMiddleware(app, workers=int(os.environ.get("ASGI_THREADS", 8)))
@@ -0,0 +1,253 @@
+"""
+Ficheros estáticos con huella, precomprimidos y con caché larga.
+
+Flask servía ``static/`` sin compresión y sin forma de invalidar la caché
+del navegador, de modo que cada visita volvía a validar (o descargar) el CSS,
+el JS y las imágenes, entre ellas ``book3d.gif`` (670 KB mostrado a 120 px).
+
+``flask --app main build-assets`` copia cada fichero de ``static/`` a
+ASSETS_DIR (por defecto ``static/dist``) con el hash de su contenido en el
+nombre (``css/style.3f9a1c0b7d2e.css``) y genera:
+
+- variantes ``.gz`` y ``.br`` de CSS, JS, SVG y JSON (``.br`` requiere el
+  paquete ``brotli``);
+- para las imágenes, versiones reducidas a cada ancho de ASSET_IMAGE_WIDTHS
+  menor que el original y variantes WebP (requiere ``Pillow``);
+- ``manifest.json``, que relaciona cada nombre lógico con sus ficheros.
+
+Las plantillas usan ``asset_url('css/style.css')`` en lugar de
+``url_for('static', ...)``. Con manifiesto, la URL apunta a ``/assets/...``,
+que responde con ``Cache-Control: immutable`` de un año y elige ``.br`` o
+``.gz`` según ``Accept-Encoding``. Un cambio en el fichero cambia su hash y
+por tanto su URL. Sin manifiesto (desarrollo) o con ASSETS=off se usa el
+manejador estático de Flask como antes.
+"""
+
+import gzip
+import hashlib
+import io
+import json
+import logging
+import mimetypes
+import os
+import shutil
+
+from flask import abort, request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    from PIL import Image, ImageSequence
+except ImportError:
+    Image = None
+
+MANIFEST = 'manifest.json'
+
+COMPRESSIBLE = {'.css', '.js', '.svg', '.json', '.txt', '.map'}
+IMAGES = {'.png', '.jpg', '.jpeg', '.gif'}
+
+# Un año: los ficheros con huella nunca cambian de contenido
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+# Codificaciones que se sirven precomprimidas, por orden de preferencia
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def fingerprint(data):
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def _hashed_name(logical, data):
+    """``images/logo.png`` -> ``images/logo.<hash>.png``."""
+    root, ext = os.path.splitext(logical)
+    return f"{root}.{fingerprint(data)}{ext}"
+
+
+def _write(output_dir, name, data):
+    path = os.path.join(output_dir, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+
+def _compress(output_dir, name, data):
+    """Escribe ``.gz`` y ``.br`` junto al fichero si ocupan menos que el original."""
+    variants = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', brotli.compress(data, quality=11)))
+    for suffix, compressed in variants:
+        if len(compressed) < len(data):
+            _write(output_dir, name + suffix, compressed)
+
+
+def _encode_image(image, fmt, frames=None, duration=None):
+    buffer = io.BytesIO()
+    options = {'optimize': True} if fmt in ('PNG', 'GIF') else {'quality': 80, 'method': 6}
+    if frames and len(frames) > 1:
+        options.update(save_all=True, append_images=frames[1:], loop=0)
+        if duration:
+            options['duration'] = duration
+    image.save(buffer, fmt, **options)
+    return buffer.getvalue()
+
+
+def _image_variants(logical, data, widths):
+    """``{variante: (nombre lógico, bytes)}``: anchos reducidos y WebP."""
+    if Image is None:
+        return {}
+    source = Image.open(io.BytesIO(data))
+    fmt = source.format
+    duration = source.info.get('duration')
+    frames = [frame.copy() for frame in ImageSequence.Iterator(source)]
+    root, ext = os.path.splitext(logical)
+
+    # Con paleta (GIF) el filtro LANCZOS inventa colores y rompe las diferencias
+    # entre fotogramas: el GIF reducido pesaba casi lo mismo que el original
+    resample = Image.NEAREST if fmt == 'GIF' else Image.LANCZOS
+
+    def resized(width):
+        height = max(1, round(source.height * width / source.width))
+        return [frame.resize((width, height), resample) for frame in frames]
+
+    variants = {}
+    sizes = [(None, frames)] + [(width, resized(width)) for width in widths if width < source.width]
+    for width, scaled in sizes:
+        suffix = f"{width}w" if width else ''
+        if width:
+            # Mismo formato, más pequeño
+            variants[suffix] = (f"{root}.{suffix}{ext}", _encode_image(scaled[0], fmt, scaled, duration))
+        webp_frames = [frame.convert('RGBA') for frame in scaled]
+        webp = _encode_image(webp_frames[0], 'WEBP', webp_frames, duration)
+        variants[f"{suffix}.webp" if suffix else 'webp'] = (f"{root}.{suffix or 'full'}.webp", webp)
+    return variants
+
+
+def build(static_dir, output_dir, widths=()):
+    """
+    Genera los ficheros con huella y el manifiesto.
+
+    Devuelve el manifiesto: ``{nombre lógico: {'file': ..., 'variants': {...}}}``.
+    """
+    if os.path.isdir(output_dir):
+        shutil.rmtree(output_dir)
+    os.makedirs(output_dir)
+    output_root = os.path.abspath(output_dir)
+
+    manifest = {}
+    for directory, subdirs, files in os.walk(static_dir):
+        # No volver a procesar la salida si está dentro de static/
+        subdirs[:] = [d for d in subdirs if os.path.abspath(os.path.join(directory, d)) != output_root]
+        for filename in sorted(files):
+            source = os.path.join(directory, filename)
+            logical = os.path.relpath(source, static_dir).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                data = f.read()
+            ext = os.path.splitext(filename)[1].lower()
+
+            name = _hashed_name(logical, data)
+            _write(output_dir, name, data)
+            if ext in COMPRESSIBLE:
+                _compress(output_dir, name, data)
+            entry = {'file': name, 'variants': {}}
+
+            if ext in IMAGES:
+                try:
+                    variants = _image_variants(logical, data, widths)
+                except Exception:
+                    logging.exception(f"Could not build image variants for {logical}")
+                    variants = {}
+                for variant, (variant_logical, variant_data) in variants.items():
+                    # La variante solo vale la pena si pesa menos que el original
+                    if len(variant_data) < len(data):
+                        variant_name = _hashed_name(variant_logical, variant_data)
+                        _write(output_dir, variant_name, variant_data)
+                        entry['variants'][variant] = variant_name
+
+            manifest[logical] = entry
+
+    with open(os.path.join(output_dir, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    return manifest
+
+
+class Assets:
+    def __init__(self, output_dir, enabled=True):
+        self.output_dir = output_dir
+        self.enabled = enabled
+        self.manifest = {}
+        self.files = set()
+        self.load()
+
+    def load(self):
+        path = os.path.join(self.output_dir, MANIFEST)
+        try:
+            with open(path, encoding='utf-8') as f:
+                self.manifest = json.load(f)
+        except FileNotFoundError:
+            self.manifest = {}
+        self.files = {entry['file'] for entry in self.manifest.values()}
+        self.files.update(name for entry in self.manifest.values() for name in entry['variants'].values())
+
+    def url(self, filename, variant=None):
+        """URL con huella de ``filename`` (o de su variante, si existe)."""
+        entry = self.manifest.get(filename) if self.enabled else None
+        if entry is None:
+            return url_for('static', filename=filename)
+        name = entry['variants'].get(variant, entry['file']) if variant else entry['file']
+        return url_for('asset', filename=name)
+
+    def variant(self, filename, variant):
+        """URL de la variante o None si no se generó (sin Pillow, o no era más pequeña)."""
+        entry = self.manifest.get(filename) if self.enabled else None
+        if entry is None or variant not in entry['variants']:
+            return None
+        return url_for('asset', filename=entry['variants'][variant])
+
+    def serve(self, filename):
+        if filename not in self.files:
+            abort(404)
+
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        send_name, encoding = filename, None
+        if os.path.splitext(filename)[1].lower() in COMPRESSIBLE:
+            for candidate, suffix in ENCODINGS:
+                if candidate in request.accept_encodings and \
+                        os.path.exists(os.path.join(self.output_dir, filename + suffix)):
+                    send_name, encoding = filename + suffix, candidate
+                    break
+
+        response = send_from_directory(self.output_dir, send_name, mimetype=mimetype)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if os.path.splitext(filename)[1].lower() in COMPRESSIBLE:
+            response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = IMMUTABLE
+        return response
+
+
+def install(flask_app):
+    """Registra /assets, los helpers de plantilla y el comando build-assets."""
+    output_dir = flask_app.config['ASSETS_DIR'] or os.path.join(flask_app.static_folder, 'dist')
+    assets = Assets(output_dir, enabled=flask_app.config['ASSETS'] == 'on')
+
+    flask_app.add_url_rule('/assets/<path:filename>', 'asset', assets.serve)
+    flask_app.add_template_global(assets.url, 'asset_url')
+    flask_app.add_template_global(assets.variant, 'asset_variant')
+
+    @flask_app.cli.command('build-assets')
+    def build_assets_command():
+        """Genera los estáticos con huella, comprimidos y las variantes de imagen."""
+        manifest = build(flask_app.static_folder, output_dir, flask_app.config['ASSET_IMAGE_WIDTHS'])
+        variants = sum(len(entry['variants']) for entry in manifest.values())
+        print(f"{len(manifest)} ficheros y {variants} variantes de imagen en {output_dir}")
+        if brotli is None:
+            print("Aviso: sin el paquete 'brotli' no se generan variantes .br")
+        if Image is None:
+            print("Aviso: sin el paquete 'Pillow' no se generan variantes de imagen")
+        assets.load()
+
+    return assets
@@ -0,0 +1,136 @@
+"""
+Escritura del historial de acciones (ActionLog).
+
+Cada acción de administración hacía dos commits: el de la acción y el del
+registro. En modo ``async`` (AUDIT_LOG_MODE) los registros van a una cola en
+memoria acotada y un hilo en segundo plano los inserta por lotes con un solo
+``executemany``. La cola se vacía al cerrar el proceso. Si la cola está
+llena, el registro se escribe en el momento.
+
+Si un lote no se puede escribir (p.ej. la base de datos sigue bloqueada), el
+hilo lo reintenta ``retries`` veces con una espera creciente. Si aun así
+falla, cada registro se vuelca al log de la aplicación con nivel ERROR
+(``Lost audit log entry: ...``) para poder recuperarlo a mano.
+
+En modo ``sync`` se escribe y se hace commit en la misma petición, como
+antes. Es el modo más durable: con ``async`` un corte abrupto del proceso
+puede perder los registros que aún estén en la cola.
+"""
+
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from app import app, db
+from models import ActionLog
+
+action_log_table = ActionLog.__table__
+
+
+class AuditLogWriter:
+    def __init__(self, flask_app, max_queue=10000, batch_size=200, flush_interval=0.5, retries=3, retry_delay=0.5):
+        self.app = flask_app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def _ensure_thread(self):
+        # Tras el fork de gunicorn el hilo del proceso padre no existe en el hijo
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='audit-log-writer', daemon=True)
+            self._thread.start()
+
+    def submit(self, user_id, action, timestamp=None):
+        row = {'user_id': user_id, 'action': action, 'timestamp': timestamp or datetime.utcnow()}
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            logging.warning("Audit log queue full, writing synchronously")
+            self._write([row])
+
+    def _write(self, rows):
+        with self.app.app_context():
+            with db.engine.begin() as connection:
+                connection.execute(action_log_table.insert(), rows)
+
+    def _write_batch(self, batch):
+        for attempt in range(1, self.retries + 1):
+            try:
+                self._write(batch)
+                return
+            except Exception:
+                if attempt == self.retries:
+                    logging.exception(f"Failed to write {len(batch)} audit log entries after {attempt} attempts")
+                    break
+                logging.warning(f"Failed to write {len(batch)} audit log entries (attempt {attempt}), retrying")
+                time.sleep(self.retry_delay * attempt)
+        for row in batch:
+            logging.error(f"Lost audit log entry: {row}")
+
+    def _take_batch(self, timeout):
+        try:
+            batch = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            batch = self._take_batch(self.flush_interval)
+            if not batch:
+                continue
+            try:
+                self._write_batch(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def flush(self):
+        """Espera a que se escriban todos los registros encolados."""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.join()
+
+    def stop(self, timeout=5):
+        """Vacía la cola y detiene el hilo (se llama al salir del proceso)."""
+        self._stopping.set()
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            self._thread.join(timeout)
+
+
+writer = AuditLogWriter(
+    app,
+    max_queue=app.config['AUDIT_LOG_QUEUE_SIZE'],
+    batch_size=app.config['AUDIT_LOG_BATCH_SIZE'],
+    flush_interval=app.config['AUDIT_LOG_FLUSH_INTERVAL'],
+)
+atexit.register(writer.stop)
+
+
+def record(user_id, action):
+    if app.config['AUDIT_LOG_MODE'] == 'async':
+        writer.submit(user_id, action)
+    else:
+        db.session.add(ActionLog(user_id=user_id, action=action))
+        db.session.commit()
@@ -0,0 +1,278 @@
+"""
+Retención del historial de acciones (ActionLog).
+
+``action_logs`` crecía con cada log_action() y nunca se purgaba. prune()
+aplica la política de retención a las entradas con más de
+AUDIT_RETENTION_DAYS días:
+
+- Las borra en lotes de AUDIT_PRUNE_CHUNK filas, cada uno en su propia
+  transacción corta. Entre lotes espera AUDIT_PRUNE_PAUSE segundos para que
+  las peticiones que escriben no esperen al bloqueo de escritura de SQLite
+  todo lo que dure la purga.
+- Con AUDIT_ROLLUP=on las suma en ``action_log_daily``
+  (models.ActionLogDaily), con una fila por día, usuario y tipo de acción. Se
+  suman solo las filas que este proceso ha borrado (``DELETE ... RETURNING``),
+  en la misma transacción que el borrado. Así dos purgas simultáneas (cron y
+  el hilo) no cuentan dos veces la misma entrada.
+- Si AUDIT_ARCHIVE_DIR no está vacío, antes de borrarlas las copia a
+  segmentos JSONL comprimidos, particionados por mes: un fichero por lote y
+  mes (``action_logs-AAAA-MM.<primer id>.jsonl.gz``). Cada segmento se
+  escribe en un fichero temporal, se sincroniza con fsync y se renombra, así
+  que nunca queda a medias. Si el proceso muere antes del borrado, la
+  siguiente pasada vuelve a copiar esas filas, y read_archive() descarta los
+  ids repetidos. Los ``*.tmp`` que deje un proceso muerto se ignoran y se
+  pueden borrar.
+
+La vista reciente (admin_dashboard) hace ``ORDER BY timestamp DESC LIMIT n``
+sobre ix_action_logs_timestamp. Recorre n entradas del índice, haya el
+historial que haya.
+
+Modos (AUDIT_RETENTION_SCHEDULER), como en overdue.py:
+
+- ``thread``: un hilo en cada worker web purga cada AUDIT_RETENTION_INTERVAL
+  segundos; claim_run() garantiza que solo trabaje un proceso por intervalo.
+- ``off``: ``flask --app main prune-audit-log`` desde cron.
+"""
+
+import glob
+import gzip
+import json
+import logging
+import os
+import sys
+import time
+import zlib
+from collections import Counter
+from datetime import datetime, timedelta
+
+import click
+from sqlalchemy import bindparam, delete, insert, select
+from sqlalchemy.exc import IntegrityError
+
+from app import app, db
+from models import ActionLog, ActionLogDaily
+from scheduler import IntervalScheduler, claim_run
+
+# Fila de stat_counters con la hora (epoch) de la última pasada
+LAST_RUN = 'audit_retention_last_run'
+
+SEGMENT_PATTERN = 'action_logs-*.jsonl.gz'
+
+daily_table = ActionLogDaily.__table__
+
+
+def retention_horizon(now=None):
+    """Las entradas anteriores a esta fecha salen de ``action_logs``."""
+    return (now or datetime.utcnow()) - timedelta(days=app.config['AUDIT_RETENTION_DAYS'])
+
+
+def action_kind(action):
+    """Tipo de acción para el resumen diario: el texto antes de la primera comilla."""
+    return (action.split("'", 1)[0].strip() or action)[:100]
+
+
+# =======================
+# Segmentos JSONL
+# =======================
+
+def segment_path(directory, month, first_id):
+    return os.path.join(directory, SEGMENT_PATTERN.replace('*', f"{month}.{first_id:010d}"))
+
+
+def segment_month(path):
+    return os.path.basename(path)[len('action_logs-'):][:7]
+
+
+def write_segments(directory, rows):
+    """Escribe ``rows`` en un segmento nuevo por mes, sincronizado con el disco antes de aparecer."""
+    by_month = {}
+    for row in rows:
+        by_month.setdefault(row.timestamp.strftime('%Y-%m'), []).append(row)
+
+    os.makedirs(directory, exist_ok=True)
+    for month, month_rows in sorted(by_month.items()):
+        path = segment_path(directory, month, min(row.id for row in month_rows))
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb') as segment:
+                for row in month_rows:
+                    entry = {'id': row.id, 'user_id': row.user_id, 'action': row.action,
+                             'timestamp': row.timestamp.isoformat()}
+                    segment.write(json.dumps(entry, ensure_ascii=False).encode('utf-8') + b'\n')
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(tmp_path, path)
+    # El renombrado también debe llegar al disco antes del DELETE
+    directory_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(directory_fd)
+    finally:
+        os.close(directory_fd)
+
+
+def _segment_lines(path):
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as segment:
+            yield from segment
+    except (EOFError, OSError, zlib.error) as e:
+        # Segmento dañado (p.ej. uno antiguo que quedó a medias): lo leído hasta ahí vale
+        logging.warning(f"Skipping the rest of damaged audit segment {path}: {e}")
+
+
+def read_archive(directory, since=None, until=None):
+    """Entradas archivadas entre ``since`` y ``until`` (datetimes), en orden de mes."""
+    since_month = since.strftime('%Y-%m') if since else None
+    until_month = until.strftime('%Y-%m') if until else None
+    seen, current_month = set(), None
+    for path in sorted(glob.glob(os.path.join(directory, SEGMENT_PATTERN))):
+        month = segment_month(path)
+        if (since_month and month < since_month) or (until_month and month > until_month):
+            continue
+        if month != current_month:
+            # Un id solo puede repetirse dentro de su mes
+            seen, current_month = set(), month
+        for line in _segment_lines(path):
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            timestamp = datetime.fromisoformat(entry['timestamp'])
+            if entry['id'] in seen or (since and timestamp < since) or (until and timestamp >= until):
+                continue
+            seen.add(entry['id'])
+            yield entry
+
+
+# =======================
+# Resumen diario
+# =======================
+
+def rollup(rows):
+    """Suma ``rows`` a ``action_log_daily`` en la sesión actual (sin commit)."""
+    if not rows:
+        return
+    counts = Counter((row.timestamp.date(), row.user_id, action_kind(row.action)) for row in rows)
+    days = [day for day, _, _ in counts]
+    # Los lotes van por fecha: un lote abarca pocos días, así que basta un SELECT por rango
+    existing = {
+        (day, user_id, kind): daily_id
+        for daily_id, day, user_id, kind in db.session.query(
+            ActionLogDaily.id, ActionLogDaily.day, ActionLogDaily.user_id, ActionLogDaily.kind
+        ).filter(ActionLogDaily.day.between(min(days), max(days)))
+    }
+
+    updates = [{'daily_id': existing[key], 'delta': count} for key, count in counts.items() if key in existing]
+    if updates:
+        db.session.connection().execute(
+            daily_table.update()
+            .where(daily_table.c.id == bindparam('daily_id'))
+            .values(count=daily_table.c.count + bindparam('delta')),
+            updates
+        )
+    inserts = [{'day': day, 'user_id': user_id, 'kind': kind, 'count': count}
+               for (day, user_id, kind), count in counts.items() if (day, user_id, kind) not in existing]
+    if inserts:
+        # Si otra purga inserta a la vez la misma clave, uq_action_log_daily_day_user_kind
+        # lo rechaza con IntegrityError y prune() repite el lote
+        db.session.execute(insert(ActionLogDaily), inserts)
+
+
+# =======================
+# Purga
+# =======================
+
+def _delete(ids):
+    """Borra las entradas ``ids`` que sigan existiendo y devuelve las que ha borrado esta sesión."""
+    table = ActionLog.__table__
+    statement = delete(table).where(table.c.id.in_(ids))
+    if db.engine.dialect.delete_returning:
+        return set(db.session.execute(statement.returning(table.c.id)).scalars())
+    present = set(db.session.scalars(select(table.c.id).where(table.c.id.in_(ids))))
+    db.session.execute(statement)
+    return present
+
+
+def prune(before=None, chunk_size=None, pause=None):
+    """Aplica la política de retención a las entradas anteriores a ``before``. Hace commit por lote."""
+    before = before or retention_horizon()
+    chunk_size = chunk_size or app.config['AUDIT_PRUNE_CHUNK']
+    pause = app.config['AUDIT_PRUNE_PAUSE'] if pause is None else pause
+    directory = app.config['AUDIT_ARCHIVE_DIR']
+    rollup_enabled = app.config['AUDIT_ROLLUP'] == 'on'
+
+    pruned = 0
+    retried = False
+    while True:
+        # Por ix_action_logs_timestamp, las más antiguas primero
+        rows = db.session.query(ActionLog.id, ActionLog.user_id, ActionLog.action, ActionLog.timestamp).filter(
+            ActionLog.timestamp < before
+        ).order_by(ActionLog.timestamp, ActionLog.id).limit(chunk_size).all()
+        # Cierra la lectura: en SQLite, convertirla después en escritura falla si otro proceso escribió entretanto
+        db.session.commit()
+        if not rows:
+            break
+
+        if directory:
+            write_segments(directory, rows)
+        try:
+            deleted = _delete([row.id for row in rows])
+            # Otra purga simultánea puede haber borrado ya parte del lote: esas no se suman
+            if rollup_enabled:
+                rollup([row for row in rows if row.id in deleted])
+            db.session.commit()
+        except IntegrityError:
+            # Otra purga creó a la vez la misma fila del resumen: se repite el lote una vez
+            db.session.rollback()
+            if retried:
+                raise
+            retried = True
+            continue
+        retried = False
+        pruned += len(deleted)
+
+        if len(rows) < chunk_size:
+            break
+        if pause:
+            time.sleep(pause)
+
+    if pruned:
+        logging.info(f"Pruned {pruned} action log entries older than {before:%Y-%m-%d}")
+    return pruned
+
+
+def run_once(interval=None):
+    """Una pasada del planificador: reclama el intervalo y purga."""
+    interval = interval if interval is not None else app.config['AUDIT_RETENTION_INTERVAL']
+    if not claim_run(interval, LAST_RUN):
+        return 0
+    return prune()
+
+
+scheduler = IntervalScheduler(app, app.config['AUDIT_RETENTION_INTERVAL'], run_once, name='audit-retention')
+
+
+@app.before_request
+def _start_scheduler():
+    if app.config['AUDIT_RETENTION_SCHEDULER'] == 'thread':
+        scheduler.ensure_started()
+
+
+@app.cli.command('prune-audit-log')
+@click.option('--days', type=int, help='Antigüedad mínima de las entradas (AUDIT_RETENTION_DAYS).')
+@click.option('--chunk-size', type=int, help='Entradas por transacción (AUDIT_PRUNE_CHUNK).')
+def prune_audit_log_command(days, chunk_size):
+    """Aplica ahora la política de retención del historial de acciones (para cron)."""
+    before = datetime.utcnow() - timedelta(days=days) if days is not None else None
+    print(f"{prune(before, chunk_size)} entradas purgadas del historial.")
+
+
+@app.cli.command('audit-archive')
+@click.option('--since', type=click.DateTime(), help='Desde esta fecha (incluida).')
+@click.option('--until', type=click.DateTime(), help='Hasta esta fecha (excluida).')
+def audit_archive_command(since, until):
+    """Escribe en la salida estándar, como JSONL, las entradas archivadas en AUDIT_ARCHIVE_DIR."""
+    directory = app.config['AUDIT_ARCHIVE_DIR']
+    if not directory:
+        raise click.ClickException("AUDIT_ARCHIVE_DIR está vacío: no hay segmentos archivados.")
+    for entry in read_archive(directory, since, until):
+        sys.stdout.write(json.dumps(entry, ensure_ascii=False) + '\n')
@@ -0,0 +1,8 @@
+"""
+Benchmarks del sistema de biblioteca.
+
+Cada módulo se ejecuta con ``python -m benchmarks.<modulo>`` desde la raíz del
+proyecto y usa su propia base de datos temporal, nunca ``library.db``.
+``datagen`` y ``load_test`` aceptan además ``BENCH_DATABASE_URL`` para
+trabajar con un conjunto de datos grande que se reutiliza entre ejecuciones.
+"""
@@ -0,0 +1,131 @@
+"""
+Consultas de préstamos activos antes y después de archivar el historial.
+
+    python -m benchmarks.archive_bench [--loans 200000] [--days 180] [--repeats 50]
+
+Genera un conjunto de datos con benchmarks.datagen (dos años de préstamos,
+~88 % devueltos) en una SQLite temporal y mide, con ``loans`` completa y
+tras loan_archive.archive_loans(), la mediana de cada consulta caliente:
+
+- préstamos activos de un usuario (student_dashboard, my_loans);
+- primera página de manage_loans?status=active y de ?status=returned
+  (esta última intercala ``loans_archive``);
+- últimos devueltos de un usuario (my_loans, mezcla ambas tablas);
+- pasada del planificador de vencidos.
+
+Informa también del tamaño de cada tabla y del ritmo de archivado.
+"""
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'archive_bench.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{DB_PATH}'
+os.environ['BENCH_DATABASE_URL'] = os.environ['DATABASE_URL']
+os.environ.setdefault('OVERDUE_SCHEDULER', 'off')
+os.environ.setdefault('LOAN_ARCHIVE_SCHEDULER', 'off')
+
+from datetime import datetime, timedelta  # noqa: E402
+
+from app import app, db  # noqa: E402
+from benchmarks import datagen  # noqa: E402
+from loading import loan_options  # noqa: E402
+from models import OUTSTANDING_STATUSES, Loan, LoanArchive, User  # noqa: E402
+from pagination import keyset_paginate  # noqa: E402
+import loan_archive  # noqa: E402
+import migrations  # noqa: E402
+
+logging.disable(logging.WARNING)
+
+
+def hot_queries(user_ids):
+    def user_active():
+        for user_id in user_ids:
+            Loan.query.options(*loan_options('my_loans')).filter(
+                Loan.user_id == user_id, Loan.status.in_(OUTSTANDING_STATUSES)).all()
+
+    def manage_active():
+        query = Loan.query.options(*loan_options('manage_loans')).filter(Loan.status.in_(OUTSTANDING_STATUSES))
+        keyset_paginate(query, [Loan.created_at, Loan.id], per_page=50, descending=True)
+
+    def manage_returned():
+        query = Loan.query.options(*loan_options('manage_loans')).filter(Loan.status == 'returned')
+        keyset_paginate(query, [Loan.created_at, Loan.id], per_page=50, descending=True,
+                        union=[loan_archive.archived_history('manage_loans')])
+
+    def recent_returns():
+        for user_id in user_ids:
+            loan_archive.recent_returns(user_id, 10, 'my_loans')
+
+    def overdue_scan():
+        Loan.query.filter(Loan.status == 'active', Loan.due_date < datetime.utcnow()).count()
+
+    return {
+        f'activos de {len(user_ids)} usuarios': user_active,
+        'manage_loans?status=active': manage_active,
+        'manage_loans?status=returned': manage_returned,
+        f'últimos devueltos de {len(user_ids)} usuarios': recent_returns,
+        'planificador de vencidos': overdue_scan,
+    }
+
+
+def measure(queries, repeats):
+    results = {}
+    for name, run in queries.items():
+        samples = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            run()
+            samples.append((time.perf_counter() - started) * 1000)
+            db.session.expunge_all()
+        results[name] = round(statistics.median(samples), 2)
+    return results
+
+
+def table_sizes():
+    return {'loans': Loan.query.count(), 'loans_archive': LoanArchive.query.count()}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Consultas de préstamos antes y después de archivar.')
+    parser.add_argument('--loans', type=int, default=200000)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--books', type=int, default=10000)
+    parser.add_argument('--days', type=int, default=180, help='LOAN_ARCHIVE_AFTER_DAYS.')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--repeats', type=int, default=50)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    with app.app_context(), app.test_request_context():
+        migrations.upgrade_schema()
+        print("  generando datos...", file=sys.stderr)
+        datagen.generate(args.books, args.users, args.loans)
+        db.session.execute(db.text('ANALYZE'))
+        user_ids = [user_id for user_id, in db.session.query(User.id).filter(User.role == 'student').limit(20)]
+        queries = hot_queries(user_ids)
+
+        report = {'before': {'tables': table_sizes(), 'ms': measure(queries, args.repeats)}}
+
+        print("  archivando...", file=sys.stderr)
+        started = time.perf_counter()
+        archived = loan_archive.archive_loans(datetime.utcnow() - timedelta(days=args.days), args.batch_size)
+        elapsed = time.perf_counter() - started
+        report['archive'] = {'loans': archived, 'seconds': round(elapsed, 2),
+                             'loans_per_s': round(archived / elapsed) if elapsed else None}
+        db.session.execute(db.text('ANALYZE'))
+
+        report['after'] = {'tables': table_sizes(), 'ms': measure(queries, args.repeats)}
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
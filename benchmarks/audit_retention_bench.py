@@ -0,0 +1,153 @@
+"""
+Purga del historial de acciones: bloqueo de escritura y vista reciente.
+
+    python -m benchmarks.audit_retention_bench [--entries 300000] [--days 365] [--chunks 500,0]
+
+Llena ``action_logs`` con ``--entries`` acciones repartidas en dos años y,
+para cada tamaño de lote de ``--chunks`` (0 = todo en una transacción),
+ejecuta audit_retention.prune() mientras otro hilo registra una acción cada
+pocos milisegundos, como harían las peticiones. Informa de:
+
+- duración de la purga y entradas por segundo;
+- latencia p99 y máxima de esas escrituras concurrentes (cuánto esperan al
+  bloqueo de escritura de SQLite);
+- tamaño de los segmentos JSONL comprimidos y filas del resumen diario;
+- mediana de la consulta de admin_dashboard antes y después de purgar.
+"""
+
+import argparse
+import glob
+import json
+import logging
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+WORKDIR = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(WORKDIR, 'audit_bench.db')}"
+os.environ['AUDIT_ARCHIVE_DIR'] = os.path.join(WORKDIR, 'audit_archive')
+os.environ.setdefault('OVERDUE_SCHEDULER', 'off')
+os.environ.setdefault('AUDIT_RETENTION_SCHEDULER', 'off')
+
+from sqlalchemy import insert  # noqa: E402
+from sqlalchemy.orm import joinedload  # noqa: E402
+
+from app import app, db  # noqa: E402
+from models import ActionLog, ActionLogDaily, User  # noqa: E402
+import audit_retention  # noqa: E402
+import migrations  # noqa: E402
+
+logging.disable(logging.WARNING)
+
+ACTIONS = ["Agregó el libro 'Libro {}'", "Editó el libro 'Libro {}'", "Eliminó el libro 'Libro {}'",
+           "Agregó un préstamo para el usuario 'Alumno {}' y el libro 'Libro {}'"]
+
+
+def populate(entries, user_ids, batch_size=10000):
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    db.session.execute(ActionLog.__table__.delete())
+    db.session.execute(ActionLogDaily.__table__.delete())
+    db.session.commit()
+    shutil.rmtree(app.config['AUDIT_ARCHIVE_DIR'], ignore_errors=True)
+    rows = []
+    for i in range(entries):
+        n = rng.randrange(1000)
+        rows.append({'user_id': rng.choice(user_ids), 'action': rng.choice(ACTIONS).format(n, n),
+                     'timestamp': now - timedelta(minutes=rng.randrange(730 * 24 * 60))})
+        if len(rows) == batch_size:
+            db.session.execute(insert(ActionLog), rows)
+            rows = []
+    if rows:
+        db.session.execute(insert(ActionLog), rows)
+    db.session.commit()
+
+
+def dashboard_query_ms(repeats=50):
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        ActionLog.query.options(joinedload(ActionLog.user)).order_by(ActionLog.timestamp.desc()).limit(5).all()
+        samples.append((time.perf_counter() - started) * 1000)
+        db.session.expunge_all()
+    return round(statistics.median(samples), 2)
+
+
+def concurrent_writes(stop, latencies, user_id, interval=0.005):
+    with app.app_context():
+        while not stop.is_set():
+            started = time.perf_counter()
+            with db.engine.begin() as connection:
+                connection.execute(ActionLog.__table__.insert(), {
+                    'user_id': user_id, 'action': 'Escritura concurrente', 'timestamp': datetime.utcnow()})
+            latencies.append((time.perf_counter() - started) * 1000)
+            time.sleep(interval)
+
+
+def run_scenario(chunk, args, user_ids):
+    populate(args.entries, user_ids)
+    before_ms = dashboard_query_ms()
+
+    stop, latencies = threading.Event(), []
+    writer = threading.Thread(target=concurrent_writes, args=(stop, latencies, user_ids[0]))
+    writer.start()
+    started = time.perf_counter()
+    pruned = audit_retention.prune(datetime.utcnow() - timedelta(days=args.days),
+                                   chunk_size=chunk or args.entries, pause=args.pause if chunk else 0)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    writer.join()
+
+    latencies.sort()
+    segments = glob.glob(os.path.join(app.config['AUDIT_ARCHIVE_DIR'], audit_retention.SEGMENT_PATTERN))
+    return {
+        'pruned': pruned,
+        'seconds': round(elapsed, 2),
+        'entries_per_s': round(pruned / elapsed) if elapsed else None,
+        'concurrent_writes': len(latencies),
+        'write_p99_ms': round(latencies[int(len(latencies) * 0.99) - 1], 1) if latencies else None,
+        'write_max_ms': round(latencies[-1], 1) if latencies else None,
+        'segments': len(segments),
+        'segment_bytes': sum(os.path.getsize(path) for path in segments),
+        'daily_rows': ActionLogDaily.query.count(),
+        'remaining': ActionLog.query.count(),
+        'dashboard_ms_before': before_ms,
+        'dashboard_ms_after': dashboard_query_ms(),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Purga del historial de acciones por lotes.')
+    parser.add_argument('--entries', type=int, default=300000)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--days', type=int, default=365, help='AUDIT_RETENTION_DAYS.')
+    parser.add_argument('--chunks', default='500,0', type=lambda value: [int(chunk) for chunk in value.split(',')],
+                        help='Tamaños de lote; 0 = una sola transacción.')
+    parser.add_argument('--pause', type=float, default=0.05, help='AUDIT_PRUNE_PAUSE entre lotes.')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = {'entries': args.entries, 'retention_days': args.days, 'pause': args.pause, 'chunks': {}}
+    with app.app_context():
+        migrations.upgrade_schema()
+        db.session.add_all([User(username=f'admin{i}', email=f'admin{i}@biblioteca.test', role='admin')
+                            for i in range(args.users)])
+        db.session.commit()
+        user_ids = [user_id for user_id, in db.session.query(User.id)]
+        for chunk in args.chunks:
+            label = str(chunk) if chunk else 'todo'
+            print(f"  lote {label}...", file=sys.stderr)
+            report['chunks'][label] = run_scenario(chunk, args, user_ids)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Comprueba que reimportar el catálogo no pierde copias de los libros existentes.
+
+    python -m benchmarks.catalog_reimport
+
+Importa un libro con 5 copias, presta 2 y lo vuelve a importar: sin columna
+de copias (deben quedar 5 y 3 disponibles) y con 7 copias (7 y 5). Lo hace
+con el upsert (``ON CONFLICT``) y con la ruta de UPDATE por libro de los
+demás dialectos. Un libro nuevo sin copias debe tener una. Sale con código 1 si algún caso no cuadra.
+"""
+
+import io
+import logging
+import os
+import sys
+import tempfile
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'catalog_reimport.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{DB_PATH}'
+os.environ.setdefault('OVERDUE_SCHEDULER', 'off')
+
+from app import app, db  # noqa: E402
+from models import Book  # noqa: E402
+import catalog_io  # noqa: E402
+import migrations  # noqa: E402
+
+logging.disable(logging.INFO)
+
+ISBN = '9780000000001'
+
+# (descripción, formato, fichero, copias totales y disponibles esperadas tras prestar 2)
+STEPS = [
+    ('csv con 5 copias', 'csv',
+     f"isbn,title,author,total_copies\n{ISBN},Rayuela,Julio Cortázar,5\n", (5, 3)),
+    ('csv sin columna de copias', 'csv',
+     f"isbn,title,author,category\n{ISBN},Rayuela,Julio Cortázar,Novela\n", (5, 3)),
+    ('jsonl sin copias', 'jsonl',
+     f'{{"isbn": "{ISBN}", "title": "Rayuela", "author": "Julio Cortázar"}}\n', (5, 3)),
+    ('mrk sin 999', 'mrk',
+     f"=020  \\\\$a{ISBN}\n=100  1\\$aJulio Cortázar\n=245  10$aRayuela\n", (5, 3)),
+    ('csv con 7 copias', 'csv',
+     f"isbn,title,author,total_copies\n{ISBN},Rayuela,Julio Cortázar,7\n", (7, 5)),
+]
+
+
+def run(path_name):
+    failures = 0
+    db.session.execute(Book.__table__.delete())
+    db.session.commit()
+    for number, (name, fmt, content, expected) in enumerate(STEPS):
+        catalog_io.import_books(io.StringIO(content), fmt)
+        if number == 0:
+            # Dos copias prestadas
+            Book.query.filter_by(isbn=ISBN).update({'available_copies': Book.available_copies - 2})
+            db.session.commit()
+        book = db.session.query(Book.total_copies, Book.available_copies).filter_by(isbn=ISBN).one()
+        ok = tuple(book) == expected and Book.query.filter_by(isbn=ISBN).count() == 1
+        failures += not ok
+        print(f"{'OK  ' if ok else 'FAIL'} {path_name}, {name}: {tuple(book)} (esperado {expected})")
+
+    catalog_io.import_books(io.StringIO("isbn,title,author\n9780000000002,Ficciones,Jorge Luis Borges\n"), 'csv')
+    book = tuple(db.session.query(Book.total_copies, Book.available_copies).filter_by(isbn='9780000000002').one())
+    ok = book == (1, 1)
+    failures += not ok
+    print(f"{'OK  ' if ok else 'FAIL'} {path_name}, libro nuevo sin copias: {book} (esperado (1, 1))")
+    return failures
+
+
+def main():
+    failures = 0
+    with app.app_context():
+        migrations.upgrade_schema()
+        failures += run('upsert')
+        upsert_statement = catalog_io._upsert_statement
+        catalog_io._upsert_statement = lambda dialect_name, copies=True: None
+        try:
+            failures += run('UPDATE por libro')
+        finally:
+            catalog_io._upsert_statement = upsert_statement
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Prueba de estrés del préstamo concurrente de un mismo libro.
+
+    python -m benchmarks.checkout_stress [workers] [copias]
+
+Lanza ``workers`` hilos que intentan a la vez llevarse un libro con
+``copias`` ejemplares (un usuario distinto por hilo) y comprueba que nunca se
+prestan más copias de las que hay ni queda ``available_copies`` negativo.
+Sale con código 1 si se vende de más.
+"""
+
+import logging
+import os
+import sys
+import tempfile
+import threading
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'checkout_stress.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{DB_PATH}'
+
+from app import app, db  # noqa: E402
+from models import Book, Loan, User  # noqa: E402
+import loan_service  # noqa: E402
+import migrations  # noqa: E402
+
+logging.disable(logging.WARNING)
+
+
+def setup(workers, copies):
+    users = [User(username=f'alumno{i}', email=f'alumno{i}@biblioteca.com', role='student')
+             for i in range(workers)]
+    book = Book(title='Libro disputado', author='Autor', total_copies=copies, available_copies=copies)
+    db.session.add_all(users + [book])
+    db.session.commit()
+    return [user.id for user in users], book.id
+
+
+def worker(user_id, book_id, barrier, results):
+    with app.app_context():
+        barrier.wait()
+        try:
+            result = loan_service.checkout_batch([(user_id, book_id)])[0]
+            results.append(result.ok)
+        except Exception as e:
+            db.session.rollback()
+            results.append(e)
+
+
+def main(workers=32, copies=3):
+    with app.app_context():
+        migrations.upgrade_schema()
+        user_ids, book_id = setup(workers, copies)
+
+    barrier = threading.Barrier(workers)
+    results = []
+    threads = [threading.Thread(target=worker, args=(user_id, book_id, barrier, results))
+               for user_id in user_ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with app.app_context():
+        book = db.session.get(Book, book_id)
+        loans = Loan.query.filter_by(book_id=book_id).count()
+
+    errors = [r for r in results if isinstance(r, Exception)]
+    granted = sum(1 for r in results if r is True)
+    print(f"workers={workers} copies={copies} granted={granted} loans={loans} "
+          f"available={book.available_copies} errors={len(errors)}")
+    for error in errors[:5]:
+        print(f"  {type(error).__name__}: {error}")
+
+    oversold = loans > book.total_copies or book.available_copies < 0
+    consistent = loans + book.available_copies == book.total_copies
+    if oversold or not consistent:
+        print("FAIL: se prestaron más copias de las disponibles")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,188 @@
+"""
+Concurrencia por proceso: worker ``sync`` frente a ``gthread`` y ASGI.
+
+    python -m benchmarks.concurrency [--modes sync,gthread,asgi] [--concurrency 1,8,32]
+                                     [--requests 200] [--threads 8] [--output informe.json]
+
+Para cada modo lanza un único proceso servidor sobre la misma base de datos:
+
+- ``sync``: ``gunicorn -k sync --workers 1``, una petición a la vez;
+- ``gthread``: ``gunicorn -k gthread --workers 1 --threads N``;
+- ``asgi``: ``uvicorn asgi:application`` con ASGI_THREADS=N (requiere
+  ``uvicorn`` y ``a2wsgi``; si faltan, el modo se omite).
+
+Contra cada servidor ejecuta benchmarks.load_test con ``--url`` a cada nivel
+de concurrencia, sobre las rutas de lectura book_search, book_details y
+my_loans. Informa de peticiones por segundo y p95 por ruta.
+
+Los servidores arrancan con RESPONSE_CACHE=off para medir el camino hasta la
+base de datos (``--response-cache`` la deja activa). La base de datos es
+``BENCH_DATABASE_URL`` o una SQLite temporal generada con benchmarks.datagen.
+Con SQLite las consultas no esperan a la red. Con PostgreSQL cada consulta
+es un viaje de ida y vuelta, y es ahí donde los hilos aportan más.
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+ROUTES = 'book_search,book_details,my_loans'
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def git_commit():
+    # No se importa de load_test: importarlo carga la aplicación en este proceso
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True, cwd=ROOT).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def server_command(mode, port, threads):
+    bind = f"127.0.0.1:{port}"
+    if mode == 'sync':
+        return [sys.executable, '-m', 'gunicorn', '-k', 'sync', '--workers', '1', '--bind', bind, 'main:app']
+    if mode == 'gthread':
+        return [sys.executable, '-m', 'gunicorn', '-k', 'gthread', '--workers', '1',
+                '--threads', str(threads), '--bind', bind, 'main:app']
+    if mode == 'asgi':
+        return [sys.executable, '-m', 'uvicorn', 'asgi:application', '--host', '127.0.0.1',
+                '--port', str(port), '--log-level', 'warning']
+    raise ValueError(f"Unknown mode {mode!r}")
+
+
+def available(mode):
+    if mode == 'asgi':
+        return all(importlib.util.find_spec(name) for name in ('uvicorn', 'a2wsgi'))
+    return importlib.util.find_spec('gunicorn') is not None
+
+
+def wait_until_ready(url, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"El servidor terminó con código {process.returncode}")
+        try:
+            # El master de gunicorn acepta conexiones antes de que un worker pueda responder
+            with urllib.request.urlopen(url + '/login', timeout=max(deadline - time.monotonic(), 0.1)):
+                return
+        except (urllib.error.URLError, ConnectionError, TimeoutError):
+            time.sleep(0.05)
+    raise RuntimeError(f"El servidor no respondió en {timeout}s")
+
+
+def run_load_test(env, url, concurrency, args):
+    with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+        output = f.name
+    try:
+        subprocess.run(
+            [sys.executable, '-m', 'benchmarks.load_test', '--url', url, '--routes', args.routes,
+             '--requests', str(args.requests), '--concurrency', str(concurrency), '--output', output],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, check=False,
+        )
+        with open(output, encoding='utf-8') as f:
+            return json.load(f)
+    finally:
+        os.remove(output)
+
+
+def measure(mode, args, env, workdir):
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    server_env = dict(
+        env,
+        DATABASE_URL=env['BENCH_DATABASE_URL'],
+        LOG_LEVEL='WARNING',
+        OVERDUE_SCHEDULER='off',
+        RESPONSE_CACHE='on' if args.response_cache else 'off',
+        SESSION_PATH=os.path.join(workdir, f'sessions-{mode}.db'),
+        ASGI_THREADS=str(args.threads),
+        SQLALCHEMY_POOL_SIZE=str(max(args.threads, 5)),
+    )
+    process = subprocess.Popen(server_command(mode, port, args.threads), cwd=ROOT, env=server_env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_ready(url, process)
+        results = {}
+        for concurrency in args.concurrency:
+            print(f"  {mode} x{concurrency}...", file=sys.stderr)
+            report = run_load_test(env, url, concurrency, args)
+            results[concurrency] = {
+                route: {key: stats[key] for key in ('throughput_rps', 'p50_ms', 'p95_ms', 'errors')}
+                for route, stats in report['routes'].items()
+            }
+        return results
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Compara la concurrencia por proceso de sync, gthread y ASGI.')
+    parser.add_argument('--modes', default='sync,gthread,asgi')
+    parser.add_argument('--concurrency', default='1,8,32',
+                        type=lambda value: [int(level) for level in value.split(',')])
+    parser.add_argument('--requests', type=int, default=200, help='Peticiones por ruta y nivel.')
+    parser.add_argument('--threads', type=int, default=8, help='Hilos por proceso en gthread y ASGI.')
+    parser.add_argument('--routes', default=ROUTES)
+    parser.add_argument('--response-cache', action='store_true')
+    parser.add_argument('--output', help='Fichero JSON del informe; por defecto, la salida estándar.')
+    parser.add_argument('--books', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--loans', type=int, default=50000)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = tempfile.mkdtemp()
+    env = dict(os.environ)
+    env.setdefault('BENCH_DATABASE_URL', f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+
+    # Devuelve 1 si la base de datos ya tiene datos; en ese caso se reutilizan
+    subprocess.run(
+        [sys.executable, '-m', 'benchmarks.datagen', '--books', str(args.books),
+         '--users', str(args.users), '--loans', str(args.loans)],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, check=False,
+    )
+
+    modes = {}
+    for mode in args.modes.split(','):
+        if not available(mode):
+            print(f"  {mode}: omitido, faltan dependencias", file=sys.stderr)
+            continue
+        modes[mode] = measure(mode, args, env, workdir)
+
+    report = {
+        'commit': git_commit(),
+        'database': env['BENCH_DATABASE_URL'].split('://')[0],
+        'threads': args.threads,
+        'requests_per_route': args.requests,
+        'response_cache': args.response_cache,
+        'modes': modes,
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,257 @@
+"""
+Generador de datos sintéticos para pruebas de carga.
+
+    python -m benchmarks.datagen [--books N] [--users N] [--loans N] [--seed N]
+
+Crea libros, usuarios y préstamos con texto en español (con tildes y eñes)
+mediante INSERT masivos (``executemany``) en lotes de ``--batch-size``. Los
+préstamos son coherentes con el catálogo: nunca hay más préstamos activos de
+un libro que copias, ni dos préstamos activos del mismo par usuario/libro, y
+``available_copies`` queda ajustado al final. Aproximadamente un 12 % de los
+préstamos siguen sin devolver y una cuarta parte de ellos están vencidos
+(``status = 'overdue'``, como los dejaría el planificador de overdue.py).
+
+Escribe en ``BENCH_DATABASE_URL`` o, si no está definida, en una base de datos
+SQLite temporal. Nunca usa ``DATABASE_URL``, para no tocar la base de datos
+real por accidente. Credenciales: ``admin``/``admin123`` y
+``alumno<N>``/``alumno123``.
+"""
+
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['DATABASE_URL'] = os.environ.get('BENCH_DATABASE_URL') or f'sqlite:///{DB_PATH}'
+
+from sqlalchemy import bindparam, insert, update  # noqa: E402
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+from app import app, db  # noqa: E402
+from models import OUTSTANDING_STATUSES, Book, Loan, User  # noqa: E402
+from stats import reconcile_counters  # noqa: E402
+import migrations  # noqa: E402
+
+logging.disable(logging.WARNING)
+
+ADMIN_PASSWORD = 'admin123'
+STUDENT_PASSWORD = 'alumno123'
+
+FIRST_NAMES = [
+    'María', 'José', 'Lucía', 'Martín', 'Sofía', 'Andrés', 'Valentina', 'Íñigo',
+    'Núria', 'Raúl', 'Inés', 'Joaquín', 'Ángela', 'Tomás', 'Belén', 'Sebastián',
+    'Olga', 'Rubén', 'Begoña', 'Adrián', 'Mónica', 'Héctor', 'Elena', 'Germán',
+]
+LAST_NAMES = [
+    'García', 'Fernández', 'González', 'Rodríguez', 'López', 'Martínez', 'Sánchez',
+    'Pérez', 'Gómez', 'Martín', 'Jiménez', 'Ruiz', 'Hernández', 'Díaz', 'Muñoz',
+    'Álvarez', 'Romero', 'Alonso', 'Gutiérrez', 'Navarro', 'Torres', 'Domínguez',
+    'Vázquez', 'Ramos', 'Gil', 'Ramírez', 'Serrano', 'Blanco', 'Suárez', 'Molina',
+    'Castaño', 'Ibáñez', 'Peña', 'Núñez',
+]
+TITLE_NOUNS = [
+    'soledad', 'memoria', 'noche', 'ciudad', 'guerra', 'corazón', 'río', 'jardín',
+    'silencio', 'viaje', 'camino', 'isla', 'sombra', 'canción', 'señal', 'algoritmo',
+    'océano', 'pájaro', 'música', 'historia', 'ecuación', 'montaña', 'invierno',
+    'árbol', 'lámpara', 'frontera', 'pasión', 'razón', 'niñez', 'órbita',
+]
+TITLE_ADJECTIVES = [
+    'perdida', 'última', 'secreta', 'infinita', 'dormida', 'antigua', 'breve',
+    'extraña', 'pública', 'eléctrica', 'lejana', 'pequeña', 'crónica', 'política',
+    'fantástica', 'íntima', 'mágica', 'oscura', 'clásica', 'única',
+]
+TITLE_PATTERNS = [
+    'La {noun} {adjective}',
+    '{Noun} y {noun2}',
+    'Cien años de {noun}',
+    'Crónica de una {noun} {adjective}',
+    'El libro de la {noun}',
+    'Introducción a la {noun}',
+    'Historia {adjective} de la {noun}',
+    'Los días de {noun}',
+]
+CATEGORIES = [
+    'Literatura', 'Clásicos', 'Historia', 'Informática', 'Ciencias', 'Filosofía',
+    'Poesía', 'Ensayo', 'Arte', 'Matemáticas', 'Economía', 'Psicología',
+    'Biografía', 'Educación', 'Derecho', 'Geografía',
+]
+PUBLISHERS = [
+    'Editorial Sudamericana', 'Alfaguara', 'Anagrama', 'Cátedra', 'Tusquets',
+    'Siruela', 'Planeta', 'Akal', 'Ediciones Cátedra', 'Reverté', 'Alianza Editorial',
+]
+
+
+def book_row(rng, number, now):
+    noun, noun2 = rng.sample(TITLE_NOUNS, 2)
+    title = rng.choice(TITLE_PATTERNS).format(
+        noun=noun, Noun=noun.capitalize(), noun2=noun2, adjective=rng.choice(TITLE_ADJECTIVES)
+    )
+    copies = rng.choices([1, 2, 3, 5, 10], weights=[40, 25, 20, 10, 5])[0]
+    return {
+        'title': f"{title} ({number})",
+        'author': f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {rng.choice(LAST_NAMES)}",
+        'isbn': f"978{number:010d}",
+        'publisher': rng.choice(PUBLISHERS),
+        'publication_year': rng.randint(1850, 2024),
+        'category': rng.choice(CATEGORIES),
+        'description': f"Una obra sobre la {noun} y el {rng.choice(TITLE_NOUNS)}, "
+                       f"edición {rng.choice(TITLE_ADJECTIVES)}.",
+        'total_copies': copies,
+        'available_copies': copies,
+        'created_at': now,
+        'updated_at': now,
+    }
+
+
+def user_row(rng, number, password_hash, now):
+    return {
+        'username': f"alumno{number}",
+        'email': f"alumno{number}@biblioteca.test",
+        'password_hash': password_hash,
+        'first_name': rng.choice(FIRST_NAMES),
+        'last_name': f"{rng.choice(LAST_NAMES)} {rng.choice(LAST_NAMES)}",
+        'role': 'student',
+        'active': True,
+        'created_at': now,
+        'updated_at': now,
+    }
+
+
+def _insert_batches(model, rows, batch_size, label):
+    started = time.perf_counter()
+    batch = []
+    count = 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            db.session.execute(insert(model), batch)
+            db.session.commit()
+            count += len(batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(model), batch)
+        db.session.commit()
+        count += len(batch)
+    print(f"  {label}: {count} filas en {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    return count
+
+
+def _loan_rows(rng, loans, book_ids, copies, user_ids, now, active_per_book, active_pairs):
+    for _ in range(loans):
+        user_id = rng.choice(user_ids)
+        book_index = rng.randrange(len(book_ids))
+        book_id = book_ids[book_index]
+        loan_date = now - timedelta(days=rng.randint(0, 730), minutes=rng.randint(0, 1440))
+        due_date = loan_date + timedelta(days=14)
+
+        active = (rng.random() < 0.12
+                  and active_per_book[book_id] < copies[book_index]
+                  and (user_id, book_id) not in active_pairs)
+        if active:
+            active_per_book[book_id] += 1
+            active_pairs.add((user_id, book_id))
+            if rng.random() < 0.75:
+                # Activo y al día: prestado hace menos de 14 días
+                loan_date = now - timedelta(days=rng.randint(0, 13), minutes=rng.randint(0, 1440))
+                due_date = loan_date + timedelta(days=14)
+            return_date = None
+            status = 'active' if due_date >= now else 'overdue'
+        else:
+            return_date = loan_date + timedelta(days=rng.randint(1, 20))
+            status = 'returned'
+
+        yield {
+            'user_id': user_id,
+            'book_id': book_id,
+            'loan_date': loan_date,
+            'due_date': due_date,
+            'return_date': return_date,
+            'status': status,
+            'created_at': loan_date,
+            'updated_at': return_date or loan_date,
+        }
+
+
+def generate(books=10000, users=1000, loans=50000, seed=42, batch_size=5000):
+    """Inserta el conjunto de datos en la base de datos de la aplicación."""
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+
+    admin = User(username='admin', email='admin@biblioteca.test', first_name='Administrador',
+                 last_name='Sistema', role='admin')
+    admin.set_password(ADMIN_PASSWORD)
+    db.session.add(admin)
+    db.session.commit()
+
+    # Todos los alumnos comparten contraseña: un solo hash (scrypt es lento a propósito)
+    password_hash = generate_password_hash(STUDENT_PASSWORD)
+    _insert_batches(User, (user_row(rng, i, password_hash, now) for i in range(1, users + 1)),
+                    batch_size, 'usuarios')
+    _insert_batches(Book, (book_row(rng, i, now) for i in range(1, books + 1)), batch_size, 'libros')
+
+    user_ids = [user_id for user_id, in db.session.query(User.id).filter(User.role == 'student')]
+    book_rows = db.session.query(Book.id, Book.total_copies).order_by(Book.id).all()
+    book_ids = [book_id for book_id, _ in book_rows]
+    copies = [total for _, total in book_rows]
+
+    active_per_book = Counter()
+    if loans and user_ids and book_ids:
+        _insert_batches(Loan, _loan_rows(rng, loans, book_ids, copies, user_ids, now,
+                                         active_per_book, set()), batch_size, 'préstamos')
+
+    # available_copies = total - préstamos activos, solo para los libros prestados
+    statement = (
+        update(Book)
+        .where(Book.id == bindparam('book_id'))
+        .values(available_copies=Book.total_copies - bindparam('active'))
+        .execution_options(synchronize_session=False)
+    )
+    active_rows = [{'book_id': book_id, 'active': count} for book_id, count in active_per_book.items()]
+    for start in range(0, len(active_rows), batch_size):
+        db.session.connection().execute(statement, active_rows[start:start + batch_size])
+    db.session.commit()
+
+    reconcile_counters()
+    return {'books': books, 'users': users + 1, 'loans': loans,
+            'active_loans': sum(active_per_book.values())}
+
+
+def dataset_size():
+    return {
+        'books': Book.query.count(),
+        'users': User.query.count(),
+        'loans': Loan.query.count(),
+        'active_loans': Loan.query.filter(Loan.status.in_(OUTSTANDING_STATUSES)).count(),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Genera datos sintéticos para pruebas de carga.')
+    parser.add_argument('--books', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--loans', type=int, default=50000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    with app.app_context():
+        migrations.upgrade_schema()
+        if User.query.count():
+            print(f"La base de datos ya tiene datos: {db.engine.url}", file=sys.stderr)
+            sys.exit(1)
+        print(f"Generando datos en {db.engine.url}", file=sys.stderr)
+        size = generate(args.books, args.users, args.loans, args.seed, args.batch_size)
+    print(size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Comprueba con EXPLAIN que las consultas calientes usan un índice.
+
+    python -m benchmarks.explain_indexes
+
+Construye las mismas consultas que routes.py y falla (código 1) si el plan de
+alguna recorre la tabla completa. Usa SQLite; en PostgreSQL conviene revisar
+los planes con EXPLAIN ANALYZE sobre datos reales.
+"""
+
+import logging
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'explain_indexes.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{DB_PATH}'
+
+from sqlalchemy.orm import joinedload  # noqa: E402
+
+from app import app, db  # noqa: E402
+from api import user_lookup_query  # noqa: E402
+from models import ActionLog, Loan, LoanArchive  # noqa: E402
+import migrations  # noqa: E402
+
+logging.disable(logging.INFO)
+
+
+def hot_queries():
+    now = datetime.utcnow()
+    return {
+        'loans por usuario activos': (
+            Loan.query.filter_by(user_id=1, status='active'), 'ix_loans_user_status'),
+        'loan existente usuario/libro': (
+            Loan.query.filter_by(user_id=1, book_id=1, status='active'),
+            ('ix_loans_user_status', 'ix_loans_book_status')),
+        'loans por libro activos': (
+            Loan.query.filter_by(book_id=1, status='active'), 'ix_loans_book_status'),
+        'planificador de vencidos': (
+            Loan.query.filter(Loan.status == 'active', Loan.due_date < now), 'ix_loans_status_due_date'),
+        'loans vencidos': (
+            Loan.query.filter(Loan.status == 'overdue'), ('ix_loans_status_due_date', 'ix_loans_status_return_date')),
+        'últimas acciones': (
+            ActionLog.query.options(joinedload(ActionLog.user)).order_by(ActionLog.timestamp.desc()).limit(5),
+            'ix_action_logs_timestamp'),
+        'purga del historial': (
+            ActionLog.query.filter(ActionLog.timestamp < now).order_by(ActionLog.timestamp, ActionLog.id).limit(500),
+            'ix_action_logs_timestamp'),
+        'typeahead de usuarios': (
+            user_lookup_query('mar').limit(20),
+            ('ix_users_first_name_lower', 'ix_users_last_name_lower', 'ix_users_username_lower', 'ix_users_email_lower')),
+        'manage_loans por fecha': (
+            Loan.query.order_by(Loan.created_at.desc(), Loan.id.desc()).limit(50), 'ix_loans_created_at_id'),
+        'archivado de devueltos': (
+            Loan.query.filter(Loan.status == 'returned', Loan.return_date < now)
+            .order_by(Loan.return_date, Loan.id).limit(1000), 'ix_loans_status_return_date'),
+        'historial archivado de usuario': (
+            LoanArchive.query.filter_by(user_id=1).order_by(LoanArchive.return_date.desc()).limit(10),
+            'ix_loans_archive_user_return_date'),
+        'manage_loans archivados por fecha': (
+            LoanArchive.query.order_by(LoanArchive.created_at.desc(), LoanArchive.id.desc()).limit(50),
+            'ix_loans_archive_created_at_id'),
+    }
+
+
+def query_plan(query):
+    compiled = query.statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+    rows = db.session.execute(db.text(f'EXPLAIN QUERY PLAN {compiled}')).all()
+    return [row[-1] for row in rows]
+
+
+def main():
+    failures = 0
+    with app.app_context():
+        migrations.upgrade_schema()
+        for name, (query, index_names) in hot_queries().items():
+            if isinstance(index_names, str):
+                index_names = (index_names,)
+            plan = query_plan(query)
+            ok = any(index_name in step for step in plan for index_name in index_names)
+            failures += not ok
+            print(f"{'OK  ' if ok else 'FAIL'} {name}: {' | '.join(plan)}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
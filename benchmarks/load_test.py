@@ -0,0 +1,263 @@
+"""
+Prueba de carga de las rutas más usadas, con informe en JSON.
+
+    python -m benchmarks.load_test [--requests N] [--concurrency N] [--output informe.json]
+    python -m benchmarks.load_test --url http://127.0.0.1:8000 ...
+
+Sin ``--url`` usa el cliente de pruebas de Flask dentro del proceso. Con
+``--url`` lanza peticiones HTTP reales contra un servidor (p.ej. gunicorn).
+En ese caso ``BENCH_DATABASE_URL`` debe apuntar a la misma base de datos que
+usa el servidor, porque de ella se leen los préstamos que se van a devolver.
+Si la base de datos está vacía, se genera con benchmarks.datagen
+(``--books``, ``--users``, ``--loans``).
+
+Para cada ruta se informa de latencia p50/p95/p99 y media en milisegundos,
+peticiones por segundo, errores (respuestas 5xx o excepciones) y, con el
+cliente de pruebas, el número de consultas SQL de una petición. El informe
+incluye el commit de git, así que dos informes se pueden comparar entre
+versiones.
+"""
+
+import argparse
+import http.cookiejar
+import itertools
+import json
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime
+
+# datagen fija DATABASE_URL antes de que se importe la aplicación
+from benchmarks import datagen
+from benchmarks.datagen import ADMIN_PASSWORD, STUDENT_PASSWORD
+
+from app import app, db  # noqa: E402
+from models import OUTSTANDING_STATUSES, Book, Loan, User  # noqa: E402
+from query_counter import count_queries  # noqa: E402
+import migrations  # noqa: E402
+
+SEARCH_TERMS = ['soledad', 'garcía', 'historia', 'canción', 'algoritmo', 'núñez', 'río', 'invierno']
+
+
+class TestClientSession:
+    """Cliente de Flask con sesión iniciada; devuelve el código de estado."""
+
+    def __init__(self, username, password):
+        self.client = app.test_client()
+        self.request('POST', '/login', {'username': username, 'password': password})
+
+    def request(self, method, path, data=None):
+        return self.client.open(path, method=method, data=data).status_code
+
+
+class HttpSession:
+    """Sesión HTTP contra un servidor real, sin seguir redirecciones."""
+
+    class _NoRedirect(urllib.request.HTTPRedirectHandler):
+        def redirect_request(self, *args, **kwargs):
+            return None
+
+    def __init__(self, base_url, username, password):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), self._NoRedirect()
+        )
+        self.request('POST', '/login', {'username': username, 'password': password})
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data or {}).encode() if method == 'POST' else None
+        try:
+            with self.opener.open(urllib.request.Request(self.base_url + path, data=body, method=method)) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+
+class Scenario:
+    """Una ruta a medir: quién la llama y cómo se construye cada petición."""
+
+    def __init__(self, name, role, method, make_path):
+        self.name = name
+        self.role = role
+        self.method = method
+        self.make_path = make_path
+
+
+def build_scenarios(rng, book_ids, loan_ids, categories):
+    next_loan = itertools.count()
+    lock = threading.Lock()
+
+    def return_path():
+        with lock:
+            index = next(next_loan)
+        return f"/loans/{loan_ids[index % len(loan_ids)]}/return"
+
+    return [
+        Scenario('book_search', 'student', 'GET',
+                 lambda: f"/books/search?q={urllib.parse.quote(rng.choice(SEARCH_TERMS))}"),
+        Scenario('book_search_category', 'student', 'GET',
+                 lambda: f"/books/search?category={urllib.parse.quote(rng.choice(categories))}"),
+        Scenario('api_books', 'student', 'GET',
+                 lambda: f"/api/books?q={urllib.parse.quote(rng.choice(SEARCH_TERMS))}"),
+        Scenario('book_details', 'student', 'GET', lambda: f"/books/{rng.choice(book_ids)}"),
+        Scenario('my_loans', 'student', 'GET', lambda: '/loans/my'),
+        Scenario('manage_loans', 'admin', 'GET', lambda: '/admin/loans'),
+        Scenario('admin_dashboard', 'admin', 'GET', lambda: '/admin/dashboard'),
+        Scenario('loan_book', 'student', 'POST', lambda: f"/books/{rng.choice(book_ids)}/loan"),
+        Scenario('return_book', 'admin', 'POST', return_path),
+    ]
+
+
+def percentile(samples, pct):
+    if len(samples) == 1:
+        return samples[0]
+    return statistics.quantiles(samples, n=100, method='inclusive')[pct - 1]
+
+
+def summarize(latencies, errors, elapsed):
+    latencies_ms = sorted(latency * 1000 for latency in latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': round(percentile(latencies_ms, 50), 2),
+        'p95_ms': round(percentile(latencies_ms, 95), 2),
+        'p99_ms': round(percentile(latencies_ms, 99), 2),
+        'mean_ms': round(statistics.fmean(latencies_ms), 2),
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+    }
+
+
+def run_scenario(scenario, sessions, requests):
+    """Reparte ``requests`` peticiones entre las sesiones, una por hilo."""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    remaining = itertools.count()
+
+    def worker(session):
+        own_latencies = []
+        own_errors = 0
+        while next(remaining) < requests:
+            path = scenario.make_path()
+            started = time.perf_counter()
+            try:
+                status = session.request(scenario.method, path)
+            except Exception:
+                status = None
+            own_latencies.append(time.perf_counter() - started)
+            if status is None or status >= 500:
+                own_errors += 1
+        with lock:
+            latencies.extend(own_latencies)
+            errors.append(own_errors)
+
+    threads = [threading.Thread(target=worker, args=(session,)) for session in sessions]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, sum(errors), time.perf_counter() - started)
+
+
+def count_scenario_queries(scenario, session):
+    with app.app_context():
+        with count_queries() as counter:
+            session.request(scenario.method, scenario.make_path())
+    return counter.count
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Prueba de carga de las rutas principales.')
+    parser.add_argument('--url', help='Servidor a probar; por defecto, el cliente de pruebas de Flask.')
+    parser.add_argument('--requests', type=int, default=200, help='Peticiones por ruta.')
+    parser.add_argument('--concurrency', type=int, default=4, help='Sesiones simultáneas.')
+    parser.add_argument('--routes', help='Rutas a medir, separadas por comas.')
+    parser.add_argument('--output', help='Fichero JSON del informe; por defecto, la salida estándar.')
+    parser.add_argument('--books', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--loans', type=int, default=50000)
+    parser.add_argument('--seed', type=int, default=42)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    rng = random.Random(args.seed)
+
+    with app.app_context():
+        migrations.upgrade_schema()
+        if not User.query.count():
+            print(f"Generando datos en {db.engine.url}", file=sys.stderr)
+            datagen.generate(args.books, args.users, args.loans, args.seed)
+        dataset = datagen.dataset_size()
+        book_ids = [book_id for book_id, in db.session.query(Book.id)]
+        categories = [category for category, in db.session.query(Book.category).distinct() if category]
+        students = [username for username, in db.session.query(User.username)
+                    .filter(User.role == 'student').order_by(User.id).limit(args.concurrency)]
+        loan_ids = [loan_id for loan_id, in db.session.query(Loan.id)
+                    .filter(Loan.status.in_(OUTSTANDING_STATUSES)).limit(args.requests)]
+
+    if args.url:
+        def open_session(username, password):
+            return HttpSession(args.url, username, password)
+    else:
+        open_session = TestClientSession
+
+    sessions = {
+        'admin': [open_session('admin', ADMIN_PASSWORD) for _ in range(args.concurrency)],
+        'student': [open_session(students[i % len(students)], STUDENT_PASSWORD)
+                    for i in range(args.concurrency)],
+    }
+
+    scenarios = build_scenarios(rng, book_ids, loan_ids, categories)
+    if args.routes:
+        wanted = set(args.routes.split(','))
+        scenarios = [scenario for scenario in scenarios if scenario.name in wanted]
+
+    routes = {}
+    for scenario in scenarios:
+        if scenario.name == 'return_book' and not loan_ids:
+            continue
+        queries = None if args.url else count_scenario_queries(scenario, sessions[scenario.role][0])
+        print(f"  {scenario.name}...", file=sys.stderr)
+        routes[scenario.name] = run_scenario(scenario, sessions[scenario.role], args.requests)
+        routes[scenario.name]['queries'] = queries
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'target': args.url or 'test_client',
+        'database': app.config['SQLALCHEMY_DATABASE_URI'].split('://')[0],
+        'concurrency': args.concurrency,
+        'requests_per_route': args.requests,
+        'dataset': dataset,
+        'routes': routes,
+    }
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    sys.exit(1 if any(route['errors'] for route in routes.values()) else 0)
+
+
+if __name__ == '__main__':
+    main()
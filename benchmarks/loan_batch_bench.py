@@ -0,0 +1,81 @@
+"""
+Préstamos y devoluciones en lote frente a uno por uno.
+
+    python -m benchmarks.loan_batch_bench [tamaño_lote]
+
+Mide tiempo y número de sentencias SQL de checkout_batch()/return_batch()
+con un lote de N pares y con N llamadas de un solo par.
+"""
+
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'loan_batch_bench.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{DB_PATH}'
+
+from app import app, db  # noqa: E402
+from models import Book, Loan, User  # noqa: E402
+from query_counter import count_queries  # noqa: E402
+import loan_service  # noqa: E402
+import migrations  # noqa: E402
+
+logging.disable(logging.INFO)
+
+
+def setup(size):
+    users = [User(username=f'lector{i}', email=f'lector{i}@biblioteca.com', role='student')
+             for i in range(size * 2)]
+    books = [Book(title=f'Libro {i}', author='Autor', total_copies=2, available_copies=2)
+             for i in range(size)]
+    db.session.add_all(users + books)
+    db.session.commit()
+    return [user.id for user in users], [book.id for book in books]
+
+
+def run(label, operation):
+    with count_queries() as counter:
+        start = time.perf_counter()
+        results = operation()
+        elapsed = time.perf_counter() - start
+    return label, {
+        'ms': round(elapsed * 1000, 2),
+        'statements': counter.count,
+        'ok': sum(1 for result in results if result.ok),
+    }
+
+
+def main(size=200):
+    report = {'batch_size': size}
+    with app.app_context():
+        migrations.upgrade_schema()
+        user_ids, book_ids = setup(size)
+        batch_pairs = list(zip(user_ids[:size], book_ids))
+        single_pairs = list(zip(user_ids[size:], book_ids))
+
+        label, stats = run('checkout_batch', lambda: loan_service.checkout_batch(batch_pairs))
+        report[label] = stats
+
+        label, stats = run('checkout_one_by_one', lambda: [
+            loan_service.checkout_batch([pair])[0] for pair in single_pairs
+        ])
+        report[label] = stats
+
+        loan_ids = [loan_id for (loan_id,) in db.session.query(Loan.id).order_by(Loan.id)]
+        batch_loans, single_loans = loan_ids[:size], loan_ids[size:]
+
+        label, stats = run('return_batch', lambda: loan_service.return_batch(batch_loans))
+        report[label] = stats
+        label, stats = run('return_one_by_one', lambda: [
+            loan_service.return_batch([loan_id])[0] for loan_id in single_loans
+        ])
+        report[label] = stats
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:2]))
@@ -0,0 +1,101 @@
+"""
+Comprueba que los listados de préstamos ejecutan un número fijo de
+consultas SQL, sin importar cuántos préstamos muestren (regresiones N+1).
+
+    python -m benchmarks.loan_queries
+
+Sale con código 1 si alguna vista cambia su número de consultas al pasar de
+pocos a muchos préstamos.
+"""
+
+import logging
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'loan_queries.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{DB_PATH}'
+# El hilo del planificador ejecutaría SQL en mitad de las mediciones
+os.environ['OVERDUE_SCHEDULER'] = 'off'
+
+from app import app, db  # noqa: E402
+from models import Book, Loan, User  # noqa: E402
+from query_counter import count_queries  # noqa: E402
+import migrations  # noqa: E402
+
+logging.disable(logging.INFO)
+
+VIEWS = {
+    'student': ['/student/dashboard', '/loans/my'],
+    'admin': ['/admin/loans?per_page=200', '/admin/loans?status=active&per_page=200'],
+}
+
+
+def make_user(username, role):
+    user = User(username=username, email=f'{username}@biblioteca.com',
+                first_name=username.capitalize(), last_name='Prueba', role=role)
+    user.set_password(username)
+    db.session.add(user)
+    return user
+
+
+def add_loans(student, count):
+    now = datetime.utcnow()
+    for i in range(count):
+        book = Book(title=f'Libro {i} {student.username}', author=f'Autor {i}',
+                    total_copies=1, available_copies=0)
+        db.session.add(book)
+        db.session.add(Loan(user=student, book=book, loan_date=now,
+                            due_date=now + timedelta(days=14)))
+    db.session.commit()
+
+
+def measure(client, username):
+    client.get('/logout')
+    client.post('/login', data={'username': username, 'password': username})
+    counts = {}
+    for url in VIEWS['admin' if username == 'admin' else 'student']:
+        # La primera visita puede inicializar contadores y cachés
+        client.get(url)
+        with app.app_context(), count_queries() as counter:
+            response = client.get(url)
+        assert response.status_code == 200, (url, response.status_code)
+        counts[url] = counter.count
+    return counts
+
+
+def main():
+    with app.app_context():
+        migrations.upgrade_schema()
+        make_user('admin', 'admin')
+        few = make_user('pocos', 'student')
+        many = make_user('muchos', 'student')
+        db.session.commit()
+        add_loans(few, 1)
+        add_loans(many, 30)
+
+    client = app.test_client()
+    failures = 0
+    small_counts = measure(client, 'pocos')
+    large_counts = measure(client, 'muchos')
+    for url in small_counts:
+        ok = small_counts[url] == large_counts[url]
+        failures += not ok
+        print(f"{'OK ' if ok else 'N+1'} {url}: {small_counts[url]} vs {large_counts[url]} queries")
+
+    # manage_loans lista los préstamos de todos los usuarios
+    before = measure(client, 'admin')
+    with app.app_context():
+        add_loans(User.query.filter_by(username='muchos').one(), 40)
+    after = measure(client, 'admin')
+    for url in before:
+        ok = before[url] == after[url]
+        failures += not ok
+        print(f"{'OK ' if ok else 'N+1'} {url}: {before[url]} vs {after[url]} queries")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""
+Rendimiento del login con cada opción de passwords.py.
+
+    python -m benchmarks.login_bench [--logins N] [--concurrency N]
+
+Lanza ráfagas de POST /login con el cliente de pruebas desde varios hilos y
+mide logins por segundo y latencia p95 en cuatro escenarios:
+
+- ``hash_cost``: logins correctos con cada PASSWORD_HASH_METHOD de
+  ``--methods``.
+- ``pool``: logins correctos con PASSWORD_HASH_WORKERS = 0 (en línea), 1 y
+  el número de CPUs. A la vez, un hilo pide GET /login sin parar para medir
+  cuánto esperan las demás peticiones durante la ráfaga.
+- ``throttle``: la misma contraseña incorrecta contra un usuario, con y sin
+  límite de fallos. Informa de cuántos intentos llegaron a calcular un hash.
+- ``rehash``: los usuarios tienen hashes del primer método y la política
+  pide el último. Primera ronda (recalcula en segundo plano) y segunda ronda
+  (ya con el hash nuevo).
+"""
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'login_bench.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{DB_PATH}'
+os.environ.setdefault('SESSION_BACKEND', 'memory')
+os.environ.setdefault('OVERDUE_SCHEDULER', 'off')
+
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+from app import app, db  # noqa: E402
+from models import User  # noqa: E402
+import passwords  # noqa: E402
+import migrations  # noqa: E402
+
+logging.disable(logging.WARNING)
+
+PASSWORD = 'alumno123'
+
+
+def setup(users, method):
+    password_hash = generate_password_hash(PASSWORD, method=method)
+    db.session.query(User).delete()
+    db.session.add_all([
+        User(username=f'alumno{i}', email=f'alumno{i}@biblioteca.test', role='student', password_hash=password_hash)
+        for i in range(users)
+    ])
+    db.session.commit()
+
+
+def login(username, password):
+    started = time.perf_counter()
+    status = app.test_client().post('/login', data={'username': username, 'password': password}).status_code
+    return time.perf_counter() - started, status
+
+
+def burst(attempts, concurrency):
+    """Ejecuta los logins ``attempts`` (pares usuario/contraseña) y resume."""
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda attempt: login(*attempt), attempts))
+    elapsed = time.perf_counter() - started
+    latencies = sorted(latency * 1000 for latency, _ in results)
+    statuses = {}
+    for _, status in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    return {
+        'logins_per_s': round(len(results) / elapsed, 1),
+        'p50_ms': round(statistics.median(latencies), 1),
+        'p95_ms': round(latencies[int(len(latencies) * 0.95) - 1], 1),
+        'statuses': statuses,
+    }
+
+
+def configure(**config):
+    app.config.update(config)
+    passwords.get_tracker().clear()
+
+
+def good_logins(count, users):
+    return [(f'alumno{i % users}', PASSWORD) for i in range(count)]
+
+
+def bench_hash_cost(args):
+    report = {}
+    for method in args.methods:
+        setup(args.users, method)
+        configure(PASSWORD_HASH_METHOD=method)
+        report[method] = burst(good_logins(args.logins, args.users), args.concurrency)
+    return report
+
+
+def bench_pool(args):
+    setup(args.users, args.methods[0])
+    configure(PASSWORD_HASH_METHOD=args.methods[0])
+    report = {}
+    for workers in sorted({0, 1, os.cpu_count() or 2}):
+        configure(PASSWORD_HASH_WORKERS=workers)
+        stop = threading.Event()
+        other = []
+
+        def other_requests():
+            client = app.test_client()
+            while not stop.is_set():
+                started = time.perf_counter()
+                client.get('/login')
+                other.append((time.perf_counter() - started) * 1000)
+
+        thread = threading.Thread(target=other_requests)
+        thread.start()
+        stats = burst(good_logins(args.logins, args.users), args.concurrency)
+        stop.set()
+        thread.join()
+        other.sort()
+        stats['other_requests_p95_ms'] = round(other[int(len(other) * 0.95) - 1], 1) if other else None
+        report[f'workers={workers}'] = stats
+    configure(PASSWORD_HASH_WORKERS=os.cpu_count() or 2)
+    return report
+
+
+def bench_throttle(args):
+    setup(args.users, args.methods[0])
+    report = {}
+    for label, limit in (('sin_limite', 10 ** 9), ('limite', app.config['LOGIN_MAX_FAILURES'])):
+        configure(PASSWORD_HASH_METHOD=args.methods[0], LOGIN_MAX_FAILURES=limit, LOGIN_MAX_FAILURES_PER_IP=10 ** 9)
+        stats = burst([('alumno0', 'incorrecta')] * args.logins, args.concurrency)
+        # 200 = contraseña comprobada (y rechazada); 429 = rechazado sin calcular el hash
+        stats['hashes_computed'] = stats['statuses'].get(200, 0)
+        report[label] = stats
+    return report
+
+
+def bench_rehash(args):
+    old, new = args.methods[0], args.methods[-1]
+    setup(args.users, old)
+    configure(PASSWORD_HASH_METHOD=new)
+    logins = good_logins(args.users, args.users)
+    first = burst(logins, args.concurrency)
+    # Esperar a que terminen los rehash en segundo plano
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline and User.query.filter(~User.password_hash.startswith(
+            passwords._method_prefix(new))).count():
+        time.sleep(0.1)
+    second = burst(logins, args.concurrency)
+    return {'from': old, 'to': new, 'first_round': first, 'second_round': second}
+
+
+SCENARIOS = {
+    'hash_cost': bench_hash_cost,
+    'pool': bench_pool,
+    'throttle': bench_throttle,
+    'rehash': bench_rehash,
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Rendimiento del login con cada opción de passwords.py.')
+    parser.add_argument('--logins', type=int, default=100, help='Logins por ráfaga.')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--methods', default='scrypt,scrypt:16384:8:1,pbkdf2:sha256:600000',
+                        type=lambda value: value.split(','))
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = {'concurrency': args.concurrency, 'logins': args.logins, 'cpus': os.cpu_count()}
+    with app.app_context():
+        migrations.upgrade_schema()
+        for name in args.scenarios.split(','):
+            print(f"  {name}...", file=sys.stderr)
+            report[name] = SCENARIOS[name](args)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Compara la búsqueda ILIKE con el índice de texto completo.
+
+    python -m benchmarks.search_bench [num_libros] [repeticiones]
+"""
+
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'search_bench.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{DB_PATH}'
+
+from app import app, db  # noqa: E402
+from models import Book  # noqa: E402
+from search import search_books, _like_filter  # noqa: E402
+import migrations  # noqa: E402
+
+logging.disable(logging.INFO)
+
+WORDS = ['historia', 'canción', 'mañana', 'corazón', 'ciudad', 'guerra', 'jardín',
+         'noche', 'río', 'árbol', 'mar', 'sueño', 'tiempo', 'amor', 'camino']
+AUTHORS = ['Gabriel García Márquez', 'Isabel Allende', 'Julio Cortázar',
+           'Mario Vargas Llosa', 'Jorge Luis Borges', 'Pablo Neruda', 'Elena Poniatowska']
+QUERIES = ['garcia', 'Cortázar', 'cancion', 'rio noche', '978-1-0004']
+
+
+def populate(num_books):
+    rng = random.Random(42)
+    rows = [
+        {
+            'title': ' '.join(rng.choice(WORDS) for _ in range(3)).capitalize(),
+            'author': rng.choice(AUTHORS),
+            'isbn': f'978-1-{i:07d}',
+            'total_copies': 1,
+            'available_copies': 1,
+        }
+        for i in range(num_books)
+    ]
+    db.session.execute(Book.__table__.insert(), rows)
+    db.session.commit()
+
+
+def timed(build_query, repeats):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        count = len(build_query().all())
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        'rows': count,
+        'p50_ms': round(samples[len(samples) // 2], 3),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+    }
+
+
+def main(num_books=100000, repeats=20):
+    with app.app_context():
+        migrations.upgrade_schema()
+        populate(num_books)
+        results = {'books': num_books, 'queries': {}}
+        for q in QUERIES:
+            results['queries'][q] = {
+                'ilike': timed(lambda: _like_filter(Book.query, q), repeats),
+                'fts': timed(lambda: search_books(Book.query, q), repeats),
+            }
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,121 @@
+"""
+Rendimiento de lectores y escritores concurrentes sobre SQLite, con y sin el
+perfil de producción (sqlite_profile).
+
+    python -m benchmarks.sqlite_concurrency [lectores] [escritores] [segundos]
+
+Cada proceso simula un worker de gunicorn: los lectores consultan préstamos
+activos de un usuario y los escritores insertan préstamos. Informa de las
+operaciones por segundo y los errores ``database is locked`` de cada perfil.
+"""
+
+import json
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+from sqlite_profile import apply_pragmas, profile_pragmas
+
+SCHEMA = """
+CREATE TABLE loans (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    book_id INTEGER NOT NULL,
+    status VARCHAR(20),
+    due_date DATETIME
+);
+CREATE INDEX ix_loans_user_status ON loans (user_id, status);
+"""
+
+
+def connect(path, profile):
+    # timeout=0: sin el perfil, SQLite falla al instante si hay bloqueo
+    connection = sqlite3.connect(path, timeout=0, isolation_level=None)
+    apply_pragmas(connection, profile_pragmas(profile))
+    return connection
+
+
+def reader(path, profile, deadline, results):
+    connection = connect(path, profile)
+    rng = random.Random()
+    ops = errors = 0
+    while time.time() < deadline:
+        try:
+            connection.execute(
+                "SELECT * FROM loans WHERE user_id = ? AND status = 'active'",
+                (rng.randrange(1000),)
+            ).fetchall()
+            ops += 1
+        except sqlite3.OperationalError:
+            errors += 1
+    results.put(('read', ops, errors))
+
+
+def writer(path, profile, deadline, results):
+    connection = connect(path, profile)
+    rng = random.Random()
+    ops = errors = 0
+    while time.time() < deadline:
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.execute(
+                "INSERT INTO loans (user_id, book_id, status, due_date) VALUES (?, ?, 'active', datetime('now'))",
+                (rng.randrange(1000), rng.randrange(10000))
+            )
+            connection.execute("COMMIT")
+            ops += 1
+        except sqlite3.OperationalError:
+            errors += 1
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+    results.put(('write', ops, errors))
+
+
+def run(profile, readers, writers, seconds):
+    path = os.path.join(tempfile.mkdtemp(), f'{profile}.db')
+    setup = sqlite3.connect(path)
+    setup.executescript(SCHEMA)
+    setup.executemany(
+        "INSERT INTO loans (user_id, book_id, status) VALUES (?, ?, 'active')",
+        [(i % 1000, i) for i in range(50000)]
+    )
+    setup.commit()
+    setup.close()
+
+    results = multiprocessing.Queue()
+    deadline = time.time() + seconds
+    processes = [multiprocessing.Process(target=reader, args=(path, profile, deadline, results))
+                 for _ in range(readers)]
+    processes += [multiprocessing.Process(target=writer, args=(path, profile, deadline, results))
+                  for _ in range(writers)]
+    for process in processes:
+        process.start()
+    totals = {'read': [0, 0], 'write': [0, 0]}
+    for _ in processes:
+        kind, ops, errors = results.get(timeout=seconds + 30)
+        totals[kind][0] += ops
+        totals[kind][1] += errors
+    for process in processes:
+        process.join()
+
+    return {
+        'reads_per_s': round(totals['read'][0] / seconds),
+        'writes_per_s': round(totals['write'][0] / seconds),
+        'read_lock_errors': totals['read'][1],
+        'write_lock_errors': totals['write'][1],
+    }
+
+
+def main(readers=4, writers=2, seconds=3):
+    report = {'readers': readers, 'writers': writers, 'seconds': seconds}
+    for profile in ('none', 'production'):
+        report[profile] = run(profile, readers, writers, seconds)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:4]))
@@ -0,0 +1,137 @@
+"""
+Tiempo de arranque: importación de la aplicación, comandos ``flask`` y
+arranque de un worker de gunicorn.
+
+    python -m benchmarks.startup [--repeats 5] [--workers 2] [--output informe.json]
+
+Cada medida se toma en un proceso nuevo sobre una SQLite temporal con el
+esquema ya creado por ``flask --app main upgrade-db`` (también se mide):
+
+- ``import``: ``import main`` en un intérprete nuevo. Incluye el número de
+  conexiones abiertas y sentencias SQL ejecutadas durante la importación,
+  que debe ser 0;
+- ``cli``: ``flask --app main routes`` completo, intérprete incluido;
+- ``gunicorn``: desde lanzar ``gunicorn main:app`` hasta la primera respuesta
+  de /login, con GUNICORN_PRELOAD activado y desactivado.
+
+Informa de la mediana y el máximo de ``--repeats`` repeticiones, en
+milisegundos.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.concurrency import ROOT, available, free_port, git_commit, wait_until_ready
+
+# Se ejecuta en un intérprete nuevo; cuenta conexiones y sentencias desde antes de importar
+IMPORT_PROBE = """
+import json, time
+started = time.perf_counter()
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool
+counts = {'connections': 0, 'statements': 0}
+event.listen(Pool, 'connect', lambda *args: counts.__setitem__('connections', counts['connections'] + 1))
+event.listen(Engine, 'before_cursor_execute',
+             lambda *args: counts.__setitem__('statements', counts['statements'] + 1))
+import main
+counts['ms'] = (time.perf_counter() - started) * 1000
+print(json.dumps(counts))
+"""
+
+
+def summarize(samples):
+    return {'median_ms': round(statistics.median(samples), 1), 'max_ms': round(max(samples), 1)}
+
+
+def timed_run(command, env):
+    started = time.perf_counter()
+    subprocess.run(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    return (time.perf_counter() - started) * 1000
+
+
+def measure_import(env, repeats):
+    samples, probe = [], None
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, '-c', IMPORT_PROBE], cwd=ROOT, env=env,
+                                capture_output=True, text=True, check=True).stdout
+        probe = json.loads(output.strip().splitlines()[-1])
+        samples.append(probe['ms'])
+    return dict(summarize(samples), connections=probe['connections'], statements=probe['statements'])
+
+
+def measure_gunicorn(env, repeats, workers, preload):
+    samples = []
+    for _ in range(repeats):
+        port = free_port()
+        url = f"http://127.0.0.1:{port}"
+        command = [sys.executable, '-m', 'gunicorn', '--workers', str(workers),
+                   '--bind', f'127.0.0.1:{port}', 'main:app']
+        server_env = dict(env, GUNICORN_PRELOAD='true' if preload else 'false')
+        started = time.perf_counter()
+        process = subprocess.Popen(command, cwd=ROOT, env=server_env,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_until_ready(url, process)
+            samples.append((time.perf_counter() - started) * 1000)
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+    return summarize(samples)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Mide el tiempo de arranque de la aplicación.')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=2, help='Workers de gunicorn.')
+    parser.add_argument('--output', help='Fichero JSON del informe; por defecto, la salida estándar.')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = tempfile.mkdtemp()
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'startup.db')}",
+        SESSION_PATH=os.path.join(workdir, 'sessions.db'),
+        LOG_LEVEL='WARNING',
+        OVERDUE_SCHEDULER='off',
+    )
+    flask = [sys.executable, '-m', 'flask', '--app', 'main']
+
+    print("  upgrade-db...", file=sys.stderr)
+    report = {
+        'commit': git_commit(),
+        'repeats': args.repeats,
+        'upgrade_db': summarize([timed_run(flask + ['upgrade-db'], env)]),
+    }
+    print("  import...", file=sys.stderr)
+    report['import'] = measure_import(env, args.repeats)
+    print("  cli...", file=sys.stderr)
+    report['cli'] = summarize([timed_run(flask + ['routes'], env) for _ in range(args.repeats)])
+    if available('gthread'):
+        report['gunicorn'] = {'workers': args.workers}
+        for preload in (False, True):
+            print(f"  gunicorn preload={preload}...", file=sys.stderr)
+            report['gunicorn']['preload' if preload else 'no_preload'] = \
+                measure_gunicorn(env, args.repeats, args.workers, preload)
+    else:
+        print("  gunicorn: omitido, no está instalado", file=sys.stderr)
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Comprueba que el typeahead de usuarios no distingue mayúsculas.
+
+    python -m benchmarks.user_lookup
+
+Crea alumnos con mayúsculas en el nombre, el usuario y el email y busca
+prefijos en minúsculas y en mayúsculas en ``/api/lookup/users``, también
+términos que acaban en U+10FFFF o U+D7FF (sin carácter siguiente para el
+rango). Sale con código 1 si alguna búsqueda no encuentra al alumno esperado.
+"""
+
+import logging
+import os
+import sys
+import tempfile
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'user_lookup.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{DB_PATH}'
+os.environ.setdefault('OVERDUE_SCHEDULER', 'off')
+
+from app import app, db  # noqa: E402
+from models import User  # noqa: E402
+import migrations  # noqa: E402
+
+logging.disable(logging.INFO)
+
+# (búsqueda, usuario que debe aparecer)
+LOOKUPS = [
+    ('stu', 'Stu'),
+    ('STU', 'Stu'),
+    ('stu@x', 'Stu'),
+    ('mcgr', 'JMcGregor'),
+    ('jmcg', 'JMcGregor'),
+    ('j.mc', 'JMcGregor'),
+    ('maría garc', 'mgarcia'),
+    ('nu\U0010ffff', 'Nu\U0010ffff'),
+    ('nu\ud7ff', 'Nu\U0010ffff'),
+]
+
+
+def main():
+    with app.app_context():
+        migrations.upgrade_schema()
+        admin = User(username='admin', email='admin@biblioteca.test', role='admin')
+        admin.set_password('admin')
+        db.session.add_all([
+            admin,
+            User(username='Stu', email='Stu@X.com', first_name='Stewart', last_name='Little', role='student'),
+            User(username='JMcGregor', email='J.McGregor@Example.org', first_name='James',
+                 last_name='McGregor', role='student'),
+            User(username='mgarcia', email='mgarcia@example.org', first_name='María',
+                 last_name='García', role='student'),
+            User(username='Nu\U0010ffff', email='nu\ud7ff@example.org', role='student'),
+        ])
+        db.session.commit()
+
+    client = app.test_client()
+    client.post('/api/session', json={'username': 'admin', 'password': 'admin'})
+    failures = 0
+    for term, username in LOOKUPS:
+        response = client.get('/api/lookup/users', query_string={'q': term})
+        results = response.get_json()['results'] if response.status_code == 200 else []
+        ok = any(f" - {username} - " in result['text'] for result in results)
+        failures += not ok
+        print(f"{'OK  ' if ok else 'FAIL'} {term!r} -> {username}: {[result['text'] for result in results]}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,480 @@
+"""
+Importación y exportación masiva del catálogo.
+
+Formatos (por extensión o ``--format``):
+
+- ``csv``: cabecera con los nombres de columna de EXPORT_FIELDS.
+- ``jsonl``: un objeto JSON por línea con las mismas claves.
+- ``mrk``: texto MARC al estilo MarcEdit (``=245  10$aTítulo``), un registro
+  por bloque separado por líneas en blanco. Se leen 020 (ISBN), 100 (autor),
+  245 (título), 260/264 (editorial y año), 650 (categoría), 520 (descripción)
+  y el campo local 999 $c (número de copias).
+
+El fichero se lee registro a registro y se escribe en lotes de
+IMPORT_BATCH_SIZE con un único ``executemany``. Los libros con ISBN se
+deduplican con ``INSERT ... ON CONFLICT (isbn) DO UPDATE``: un ISBN que ya
+existe actualiza el libro en lugar de duplicarlo. Los campos vacíos del
+fichero no borran los datos existentes. Al cambiar el número de copias se
+ajustan las disponibles igual que en edit_book. Un registro sin número de
+copias da una copia a un libro nuevo y deja las de uno existente como están.
+
+Cada lote hace commit por separado. Con un fichero de checkpoint, tras cada
+lote se guarda cuántos registros se han procesado. Si la importación se
+interrumpe, al repetirla con el mismo checkpoint continúa desde ahí. Repetir
+un lote ya escrito no duplica nada, porque la escritura es un upsert.
+
+La exportación recorre la tabla con ``yield_per`` y escribe fila a fila, sin
+cargar el catálogo en memoria.
+
+    flask --app main import-books catalogo.csv --checkpoint catalogo.ckpt
+    flask --app main export-books catalogo.jsonl
+"""
+
+import csv
+import io
+import json
+import logging
+import os
+import re
+from datetime import datetime
+
+import click
+from sqlalchemy import case, func, insert, select
+
+from app import app, db
+from models import Book
+from stats import adjust_counter
+import facets
+
+FORMATS = ('csv', 'jsonl', 'mrk')
+
+EXPORT_FIELDS = [
+    'isbn', 'title', 'author', 'publisher', 'publication_year', 'category',
+    'description', 'total_copies', 'available_copies',
+]
+
+# Campos que el fichero puede actualizar en un libro existente
+UPDATABLE_FIELDS = ['title', 'author', 'publisher', 'publication_year', 'category', 'description']
+
+MAX_REPORTED_ERRORS = 100
+
+# Tamaño aproximado de cada trozo de la exportación
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+_YEAR_RE = re.compile(r'\d{4}')
+_SUBFIELD_RE = re.compile(r'\$([a-z0-9])([^$]*)')
+
+
+class ImportStats:
+    def __init__(self):
+        self.read = 0
+        self.inserted = 0
+        self.updated = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.batches = 0
+        self.errors = []
+
+    def error(self, number, message):
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"registro {number}: {message}")
+
+    def as_dict(self):
+        return {
+            'read': self.read,
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'duplicates': self.duplicates,
+            'invalid': self.invalid,
+            'batches': self.batches,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        for key, value in data.items():
+            setattr(stats, key, value)
+        return stats
+
+    def __str__(self):
+        return (f"{self.read} leídos, {self.inserted} nuevos, {self.updated} actualizados, "
+                f"{self.duplicates} repetidos, {self.invalid} no válidos")
+
+
+class Checkpoint:
+    """Posición de una importación, guardada en un fichero JSON tras cada lote."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return 0, ImportStats()
+        with open(self.path, encoding='utf-8') as f:
+            data = json.load(f)
+        return data['records'], ImportStats.from_dict(data['stats'])
+
+    def save(self, records, stats):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'records': records, 'stats': stats.as_dict()}, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def detect_format(filename, default='csv'):
+    extension = os.path.splitext(filename or '')[1].lstrip('.').lower()
+    if extension == 'json':
+        return 'jsonl'
+    return extension if extension in FORMATS else default
+
+
+# =======================
+# Lectura
+# =======================
+
+def read_csv(stream):
+    yield from csv.DictReader(stream)
+
+
+def read_jsonl(stream):
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            # normalize_record() lo cuenta como registro no válido
+            yield None
+
+
+def _marc_subfields(value):
+    # Los indicadores (antes del primer $) se ignoran; si un subcampo se repite, vale el primero
+    return {code: text.strip() for code, text in reversed(_SUBFIELD_RE.findall(value))}
+
+
+def _marc_record(fields):
+    record = {}
+    for tag, value in fields:
+        subfields = _marc_subfields(value)
+        if tag == '020' and 'a' in subfields and 'isbn' not in record:
+            record['isbn'] = subfields['a'].split(' ')[0]
+        elif tag == '100':
+            record['author'] = subfields.get('a', '').rstrip(' ,.')
+        elif tag == '245':
+            title = subfields.get('a', '')
+            if subfields.get('b'):
+                title = f"{title.rstrip(' :')}: {subfields['b']}"
+            record['title'] = title.rstrip(' /:.')
+        elif tag in ('260', '264'):
+            if subfields.get('b'):
+                record['publisher'] = subfields['b'].rstrip(' ,;:')
+            year = _YEAR_RE.search(subfields.get('c', ''))
+            if year:
+                record['publication_year'] = year.group()
+        elif tag == '650' and 'category' not in record:
+            record['category'] = subfields.get('a', '').rstrip(' .')
+        elif tag == '520':
+            record['description'] = subfields.get('a')
+        elif tag == '999':
+            record['total_copies'] = subfields.get('c')
+    return record
+
+
+def read_mrk(stream):
+    fields = []
+    for line in stream:
+        line = line.rstrip('\r\n')
+        if not line.strip():
+            if fields:
+                yield _marc_record(fields)
+                fields = []
+            continue
+        if line.startswith('='):
+            fields.append((line[1:4], line[4:].lstrip()))
+        elif fields:
+            # Continuación del campo anterior
+            tag, value = fields[-1]
+            fields[-1] = (tag, value + line)
+    if fields:
+        yield _marc_record(fields)
+
+
+READERS = {'csv': read_csv, 'jsonl': read_jsonl, 'mrk': read_mrk}
+
+
+def _text(value, column):
+    if value is None:
+        return None
+    value = str(value).strip()
+    if not value:
+        return None
+    length = Book.__table__.c[column].type.length
+    return value[:length] if length else value
+
+
+def _integer(value):
+    if value is None or str(value).strip() == '':
+        return None
+    return int(str(value).strip())
+
+
+def normalize_record(record):
+    """Convierte un registro leído en columnas de Book. Lanza ValueError si no es válido."""
+    if not isinstance(record, dict):
+        raise ValueError('registro mal formado')
+    row = {column: _text(record.get(column), column)
+           for column in ('isbn', 'title', 'author', 'publisher', 'category', 'description')}
+    if not row['title'] or not row['author']:
+        raise ValueError('faltan el título o el autor')
+    try:
+        row['publication_year'] = _integer(record.get('publication_year'))
+        copies = _integer(record.get('total_copies'))
+    except ValueError:
+        raise ValueError('año o número de copias no numérico')
+    if copies is not None and copies < 1:
+        raise ValueError('el número de copias debe ser al menos 1')
+    # None si el fichero no lo trae: write_batch() no toca las copias de un libro existente
+    row['total_copies'] = copies
+    return row
+
+
+# =======================
+# Escritura
+# =======================
+
+def _upsert_statement(dialect_name, copies=True):
+    """Upsert por ISBN; con ``copies=False`` no cambia las copias de un libro existente."""
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return None
+
+    statement = dialect_insert(Book)
+    excluded = statement.excluded
+    values = {field: func.coalesce(getattr(excluded, field), getattr(Book, field)) for field in UPDATABLE_FIELDS}
+    values['updated_at'] = excluded.updated_at
+    if copies:
+        available = Book.available_copies + excluded.total_copies - Book.total_copies
+        values.update(
+            total_copies=excluded.total_copies,
+            available_copies=case((available < 0, 0), else_=available),
+        )
+    return statement.on_conflict_do_update(index_elements=[Book.isbn], set_=values)
+
+
+def _update_existing(rows):
+    # Sin ON CONFLICT: un UPDATE por libro, con la misma lógica que el upsert
+    for row in rows:
+        book = Book.query.filter_by(isbn=row['isbn']).one()
+        for field in UPDATABLE_FIELDS:
+            if row[field] is not None:
+                setattr(book, field, row[field])
+        if row['total_copies'] is None:
+            continue
+        difference = row['total_copies'] - book.total_copies
+        book.total_copies = row['total_copies']
+        book.available_copies = max(0, book.available_copies + difference)
+
+
+def _new_book(row):
+    # Valores de INSERT: un libro nuevo sin número de copias tiene una
+    copies = row['total_copies'] or 1
+    return dict(row, total_copies=copies, available_copies=copies)
+
+
+def write_batch(rows, stats):
+    """Escribe un lote de filas normalizadas y hace commit."""
+    now = datetime.utcnow()
+    by_isbn = {}
+    without_isbn = []
+    for row in rows:
+        row = dict(row, created_at=now, updated_at=now)
+        if row['isbn'] is None:
+            without_isbn.append(row)
+        else:
+            if row['isbn'] in by_isbn:
+                stats.duplicates += 1
+            by_isbn[row['isbn']] = row
+
+    existing = set()
+    if by_isbn:
+        existing = set(db.session.scalars(select(Book.isbn).where(Book.isbn.in_(list(by_isbn)))))
+
+    inserted = [row for isbn, row in by_isbn.items() if isbn not in existing] + without_isbn
+    updated = [row for isbn, row in by_isbn.items() if isbn in existing]
+
+    if _upsert_statement(db.engine.dialect.name) is not None:
+        # Dos sentencias: con y sin número de copias en el fichero
+        for copies in (True, False):
+            upsert_rows = [_new_book(row) for row in by_isbn.values() if (row['total_copies'] is not None) == copies]
+            if upsert_rows:
+                db.session.execute(_upsert_statement(db.engine.dialect.name, copies), upsert_rows)
+        if without_isbn:
+            db.session.execute(insert(Book), [_new_book(row) for row in without_isbn])
+    else:
+        if inserted:
+            db.session.execute(insert(Book), [_new_book(row) for row in inserted])
+        _update_existing(updated)
+
+    # El INSERT masivo no dispara los eventos del ORM
+    if inserted:
+        adjust_counter('total_books', len(inserted))
+    db.session.commit()
+
+    stats.inserted += len(inserted)
+    stats.updated += len(updated)
+    stats.batches += 1
+
+
+def import_books(stream, fmt, batch_size=None, checkpoint=None, progress=None):
+    """
+    Importa el catálogo desde ``stream`` (texto) en lotes.
+
+    ``checkpoint`` es la ruta del fichero de checkpoint (opcional) y
+    ``progress`` una función que recibe ImportStats tras cada lote.
+    """
+    batch_size = batch_size or app.config['IMPORT_BATCH_SIZE']
+    checkpoint = Checkpoint(checkpoint)
+    skip, stats = checkpoint.load()
+    if skip:
+        logging.info(f"Resuming catalog import after {skip} records")
+
+    batch = []
+    number = 0
+    for number, record in enumerate(READERS[fmt](stream), start=1):
+        if number <= skip:
+            continue
+        stats.read += 1
+        try:
+            batch.append(normalize_record(record))
+        except ValueError as e:
+            stats.error(number, e)
+        if len(batch) >= batch_size:
+            write_batch(batch, stats)
+            batch = []
+            checkpoint.save(number, stats)
+            if progress:
+                progress(stats)
+
+    if batch:
+        write_batch(batch, stats)
+        if progress:
+            progress(stats)
+    checkpoint.clear()
+
+    if stats.inserted or stats.updated:
+        facets.invalidate()
+    logging.info(f"Catalog import finished: {stats}")
+    return stats
+
+
+# =======================
+# Exportación
+# =======================
+
+def iter_books(batch_size=None):
+    """Recorre el catálogo por lotes como diccionarios, sin objetos del ORM."""
+    batch_size = batch_size or app.config['STREAM_BATCH_SIZE']
+    columns = [getattr(Book, field) for field in EXPORT_FIELDS]
+    result = db.session.execute(
+        select(*columns).order_by(Book.id).execution_options(yield_per=batch_size)
+    )
+    for row in result:
+        yield row._asdict()
+
+
+def _marc_lines(book):
+    lines = ['=LDR  00000nam a2200000 a 4500']
+    if book['isbn']:
+        lines.append(f"=020  \\\\$a{book['isbn']}")
+    lines.append(f"=100  1\\$a{book['author']}")
+    lines.append(f"=245  10$a{book['title']}")
+    if book['publisher'] or book['publication_year']:
+        imprint = f"$b{book['publisher']}" if book['publisher'] else ''
+        if book['publication_year']:
+            imprint += f"$c{book['publication_year']}"
+        lines.append(f"=264  \\1{imprint}")
+    if book['description']:
+        lines.append(f"=520  \\\\$a{' '.join(book['description'].split())}")
+    if book['category']:
+        lines.append(f"=650  \\4$a{book['category']}")
+    lines.append(f"=999  \\\\$c{book['total_copies']}")
+    return '\n'.join(lines) + '\n\n'
+
+
+def _csv_lines(books):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    for book in books:
+        writer.writerow(book)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def _jsonl_lines(books):
+    for book in books:
+        yield json.dumps(book, ensure_ascii=False) + '\n'
+
+
+def _mrk_lines(books):
+    for book in books:
+        yield _marc_lines(book)
+
+
+WRITERS = {'csv': _csv_lines, 'jsonl': _jsonl_lines, 'mrk': _mrk_lines}
+
+
+def export_books(fmt, batch_size=None):
+    """Genera el catálogo en ``fmt`` como trozos de texto de unos 64 KB."""
+    if fmt not in WRITERS:
+        raise ValueError(f"Unknown catalog format {fmt!r}")
+    chunk = []
+    size = 0
+    for line in WRITERS[fmt](iter_books(batch_size)):
+        chunk.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+            size = 0
+    if chunk:
+        yield ''.join(chunk)
+
+
+@app.cli.command('import-books')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), help='Por defecto, según la extensión.')
+@click.option('--batch-size', type=int, help='Registros por lote (IMPORT_BATCH_SIZE).')
+@click.option('--checkpoint', type=click.Path(dir_okay=False), help='Fichero para reanudar la importación.')
+def import_books_command(path, fmt, batch_size, checkpoint):
+    """Importa libros desde un fichero CSV, JSONL o MARC (.mrk)."""
+    fmt = fmt or detect_format(path)
+    with open(path, encoding='utf-8-sig', newline='') as stream:
+        stats = import_books(stream, fmt, batch_size, checkpoint,
+                             progress=lambda stats: click.echo(f"Lote {stats.batches}: {stats}", err=True))
+    for error in stats.errors:
+        click.echo(error, err=True)
+    print(f"Importación completada: {stats}")
+
+
+@app.cli.command('export-books')
+@click.argument('path', type=click.Path(dir_okay=False, writable=True), default='-')
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), help='Por defecto, según la extensión.')
+def export_books_command(path, fmt):
+    """Exporta el catálogo a CSV, JSONL o MARC (.mrk); '-' escribe en la salida estándar."""
+    fmt = fmt or detect_format(path)
+    with click.open_file(path, 'w', encoding='utf-8') as output:
+        for chunk in export_books(fmt):
+            output.write(chunk)
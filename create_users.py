@@ -5,13 +5,14 @@ Script to create initial users for the library management system
 
 from app import app, db
 from models import User, Book
+import migrations
 from datetime import datetime
 
 def create_initial_data():
     with app.app_context():
         # Eliminar y crear tablas (solo para pruebas o reinicio de base)
         db.drop_all()
-        db.create_all()
+        migrations.upgrade_schema()
 
         # Crear usuarios
         admin = User(
@@ -0,0 +1,83 @@
+"""
+Facetas de categoría para la búsqueda de libros.
+
+book_search ejecutaba ``SELECT DISTINCT category`` en cada visita solo para
+llenar el desplegable. Ahora la lista de categorías, con el número de libros
+y de copias disponibles de cada una, se calcula con un único GROUP BY. Se
+guarda en memoria mientras no cambie la versión del catálogo
+(stats.catalog_version(), que suben add_book, edit_book y delete_book) y
+como mucho FACET_CACHE_TTL segundos. Ese límite existe porque los préstamos
+cambian las copias disponibles sin cambiar el catálogo.
+
+Con una búsqueda activa, result_facets() cuenta los resultados por categoría
+sobre la misma consulta filtrada.
+"""
+
+import threading
+import time
+
+from app import app, db
+from models import Book
+from stats import bump_catalog_version, catalog_version
+
+
+class Facet:
+    def __init__(self, name, books, available):
+        self.name = name
+        self.books = books
+        self.available = available
+
+    def __repr__(self):
+        return f'<Facet {self.name} books={self.books} available={self.available}>'
+
+
+_lock = threading.Lock()
+_cache = {'version': None, 'expires_at': 0.0, 'facets': []}
+
+
+def _compute_facets():
+    rows = (
+        db.session.query(
+            Book.category,
+            db.func.count(Book.id),
+            db.func.coalesce(db.func.sum(Book.available_copies), 0)
+        )
+        .filter(Book.category.isnot(None), Book.category != '')
+        .group_by(Book.category)
+        .order_by(Book.category)
+        .all()
+    )
+    return [Facet(name, books, available) for name, books, available in rows]
+
+
+def category_facets():
+    """Categorías del catálogo con sus totales, desde caché si sigue vigente."""
+    version = catalog_version()
+    now = time.monotonic()
+    with _lock:
+        if _cache['version'] == version and _cache['expires_at'] > now:
+            return _cache['facets']
+
+    facets = _compute_facets()
+    with _lock:
+        _cache.update(version=version, expires_at=now + app.config['FACET_CACHE_TTL'], facets=facets)
+    return facets
+
+
+def result_facets(query):
+    """``{categoría: nº de libros}`` dentro de los resultados de ``query``."""
+    rows = (
+        query.order_by(None)
+        .with_entities(Book.category, db.func.count(Book.id))
+        .filter(Book.category.isnot(None), Book.category != '')
+        .group_by(Book.category)
+        .all()
+    )
+    return dict(rows)
+
+
+def invalidate():
+    """Invalida las facetas en todos los workers (llamar tras escribir en ``books``)."""
+    with _lock:
+        _cache['version'] = None
+    bump_catalog_version()
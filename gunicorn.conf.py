@@ -0,0 +1,27 @@
+"""
+Configuración de gunicorn (se lee sola al lanzar ``gunicorn main:app``).
+
+Con el worker ``sync`` cada proceso atiende una petición a la vez y se queda
+bloqueado mientras espera a la base de datos. Con ``gthread`` cada proceso
+atiende GUNICORN_THREADS peticiones a la vez: mientras un hilo espera una
+consulta o una petición HTTP saliente, los demás siguen trabajando. El
+benchmark ``python -m benchmarks.concurrency`` compara ambos modos (y el
+modo ASGI de asgi.py).
+"""
+
+import multiprocessing
+import os
+
+# Worker model: "gthread" (threads per process) or "sync" (one request per process, as before)
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+workers = int(os.environ.get("GUNICORN_WORKERS", min(multiprocessing.cpu_count() * 2 + 1, 8)))
+# Requests served concurrently by each gthread worker; keep SQLALCHEMY_POOL_SIZE at least this large
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+
+# Import the app once in the master and fork workers from it; safe because importing opens no
+# database connection and background threads, pools and sqlite handles are re-created per pid
+preload_app = os.environ.get("GUNICORN_PRELOAD", "true").lower() == "true"
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 5))
@@ -0,0 +1,298 @@
+"""
+Instrumentación por petición: latencia, sentencias SQL y consultas lentas.
+
+Los listeners ``before_cursor_execute``/``after_cursor_execute`` del engine
+miden cada sentencia. Los hooks ``before_request``/``teardown_request`` de
+Flask miden cada petición. Se usa ``teardown`` y no ``after_request`` para
+que las respuestas en streaming cuenten hasta el final. Por endpoint se
+acumulan:
+
+- un histograma de latencia y el número de peticiones por código de estado;
+- el número de sentencias y el tiempo total en la base de datos;
+- las sentencias más lentas (METRICS_SLOWEST).
+
+Las sentencias que tardan más de SLOW_QUERY_MS se registran como warning
+junto con su plan (``EXPLAIN QUERY PLAN`` en SQLite, ``EXPLAIN`` en
+PostgreSQL), que se obtiene en un cursor aparte de la misma conexión. Solo se
+explican los SELECT.
+
+``/admin/metrics`` expone todo en formato de texto de Prometheus. Acepta una
+sesión de administrador o la cabecera ``Authorization: Bearer <METRICS_TOKEN>``
+para el scraper. Las métricas son por proceso: con varios workers de
+gunicorn, cada scrape ve el worker que atiende la petición (etiqueta
+``pid``).
+
+Se desactiva con INSTRUMENTATION=off.
+"""
+
+import heapq
+import logging
+import os
+import threading
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+
+# Longitud máxima de una sentencia en el log y en las etiquetas de métricas
+MAX_STATEMENT_LENGTH = 300
+
+EXPLAIN_PREFIX = {
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'postgresql': 'EXPLAIN ',
+}
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield bound, total
+
+
+class EndpointStats:
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.statements = Histogram(STATEMENT_BUCKETS)
+        self.db_seconds = 0.0
+        self.status = {}
+
+
+class Metrics:
+    """Métricas acumuladas del proceso; todos los métodos son seguros entre hilos."""
+
+    def __init__(self, slowest=10):
+        self.slowest_size = slowest
+        self.endpoints = {}
+        self.slowest = []  # min-heap de (segundos, sentencia, endpoint)
+        self.slow_statements = 0
+        self._lock = threading.Lock()
+
+    def record_request(self, endpoint, method, status, seconds, statements, db_seconds):
+        with self._lock:
+            stats = self.endpoints.setdefault((endpoint, method), EndpointStats())
+            stats.latency.observe(seconds)
+            stats.statements.observe(statements)
+            stats.db_seconds += db_seconds
+            stats.status[status] = stats.status.get(status, 0) + 1
+
+    def record_statement(self, statement, seconds, endpoint, slow):
+        with self._lock:
+            if slow:
+                self.slow_statements += 1
+            entry = (seconds, statement[:MAX_STATEMENT_LENGTH], endpoint)
+            if len(self.slowest) < self.slowest_size:
+                heapq.heappush(self.slowest, entry)
+            elif seconds > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, entry)
+
+    def reset(self):
+        with self._lock:
+            self.endpoints.clear()
+            self.slowest.clear()
+            self.slow_statements = 0
+
+
+class RequestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.status = None
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', ' ').replace('"', '\\"')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+
+def _histogram_lines(name, histogram, **labels):
+    for bound, count in histogram.cumulative():
+        yield f"{name}_bucket{_labels(**labels, le=bound)} {count}"
+    yield f"{name}_bucket{_labels(**labels, le='+Inf')} {histogram.count}"
+    yield f"{name}_sum{_labels(**labels)} {histogram.sum}"
+    yield f"{name}_count{_labels(**labels)} {histogram.count}"
+
+
+def render_prometheus(metrics, counters=()):
+    """
+    Métricas en formato de texto de Prometheus (versión 0.0.4).
+
+    ``counters`` añade contadores de otros módulos como tuplas
+    ``(nombre, ayuda, valor)``, p.ej. los de user_cache.
+    """
+    pid = os.getpid()
+    with metrics._lock:
+        endpoints = sorted(metrics.endpoints.items())
+        slowest = sorted(metrics.slowest, reverse=True)
+        slow_statements = metrics.slow_statements
+
+        lines = [
+            '# HELP library_http_request_duration_seconds Request latency by endpoint.',
+            '# TYPE library_http_request_duration_seconds histogram',
+        ]
+        for (endpoint, method), stats in endpoints:
+            lines.extend(_histogram_lines('library_http_request_duration_seconds', stats.latency,
+                                          endpoint=endpoint, method=method, pid=pid))
+
+        lines += [
+            '# HELP library_http_requests_total Requests by endpoint and status code.',
+            '# TYPE library_http_requests_total counter',
+        ]
+        for (endpoint, method), stats in endpoints:
+            for status, count in sorted(stats.status.items()):
+                labels = _labels(endpoint=endpoint, method=method, status=status, pid=pid)
+                lines.append(f"library_http_requests_total{labels} {count}")
+
+        lines += [
+            '# HELP library_db_statements_per_request SQL statements executed per request.',
+            '# TYPE library_db_statements_per_request histogram',
+        ]
+        for (endpoint, method), stats in endpoints:
+            lines.extend(_histogram_lines('library_db_statements_per_request', stats.statements,
+                                          endpoint=endpoint, method=method, pid=pid))
+
+        lines += [
+            '# HELP library_db_seconds_total Time spent executing SQL by endpoint.',
+            '# TYPE library_db_seconds_total counter',
+        ]
+        for (endpoint, method), stats in endpoints:
+            labels = _labels(endpoint=endpoint, method=method, pid=pid)
+            lines.append(f"library_db_seconds_total{labels} {stats.db_seconds}")
+
+    lines += [
+        '# HELP library_db_slow_statements_total Statements slower than SLOW_QUERY_MS.',
+        '# TYPE library_db_slow_statements_total counter',
+        f"library_db_slow_statements_total{_labels(pid=pid)} {slow_statements}",
+        '# HELP library_db_slowest_statement_seconds Slowest statements seen by this process.',
+        '# TYPE library_db_slowest_statement_seconds gauge',
+    ]
+    for rank, (seconds, statement, endpoint) in enumerate(slowest, start=1):
+        labels = _labels(rank=rank, endpoint=endpoint, statement=statement, pid=pid)
+        lines.append(f"library_db_slowest_statement_seconds{labels} {seconds}")
+
+    for name, help_text, value in counters:
+        lines += [
+            f'# HELP {name} {help_text}',
+            f'# TYPE {name} counter',
+            f"{name}{_labels(pid=pid)} {value}",
+        ]
+
+    return '\n'.join(lines) + '\n'
+
+
+def explain(cursor, dialect_name, statement, parameters):
+    """Plan de ``statement`` usando otro cursor de la misma conexión DBAPI."""
+    prefix = EXPLAIN_PREFIX.get(dialect_name)
+    if prefix is None or not statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return None
+    explain_cursor = cursor.connection.cursor()
+    try:
+        explain_cursor.execute(prefix + statement, parameters)
+        return '\n'.join(str(row[-1]) for row in explain_cursor.fetchall())
+    finally:
+        explain_cursor.close()
+
+
+class Instrumentation:
+    def __init__(self, metrics, slow_query_seconds, explain_slow=True):
+        self.metrics = metrics
+        self.slow_query_seconds = slow_query_seconds
+        self.explain_slow = explain_slow
+
+    # --- SQLAlchemy ---
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        context._instrumentation_started = time.perf_counter()
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - context._instrumentation_started
+
+        endpoint = None
+        if has_request_context():
+            endpoint = request.endpoint or 'unmatched'
+            stats = g.get('_instrumentation')
+            if stats is not None:
+                stats.statements += 1
+                stats.db_seconds += seconds
+
+        slow = seconds >= self.slow_query_seconds
+        self.metrics.record_statement(statement, seconds, endpoint or '', slow)
+        if slow:
+            self.log_slow(cursor, conn.dialect.name, statement, parameters, seconds, endpoint, executemany)
+
+    def log_slow(self, cursor, dialect_name, statement, parameters, seconds, endpoint, executemany):
+        plan = None
+        if self.explain_slow and not executemany:
+            try:
+                plan = explain(cursor, dialect_name, statement, parameters)
+            except Exception as e:
+                plan = f"(EXPLAIN failed: {e})"
+        message = f"Slow query ({seconds * 1000:.1f} ms, endpoint={endpoint}): {statement[:MAX_STATEMENT_LENGTH]}"
+        if plan:
+            message += f"\nPlan:\n{plan}"
+        logging.warning(message)
+
+    # --- Flask ---
+
+    def before_request(self):
+        g._instrumentation = RequestStats()
+
+    def after_request(self, response):
+        stats = g.get('_instrumentation')
+        if stats is not None:
+            stats.status = response.status_code
+        return response
+
+    def teardown_request(self, exc):
+        stats = g.pop('_instrumentation', None)
+        if stats is None:
+            return
+        status = stats.status or 500
+        self.metrics.record_request(
+            request.endpoint or 'unmatched', request.method, status,
+            time.perf_counter() - stats.started, stats.statements, stats.db_seconds
+        )
+
+
+metrics = Metrics()
+
+
+def install(flask_app, engine):
+    """Registra los hooks de Flask y los listeners del engine según la configuración."""
+    if flask_app.config['INSTRUMENTATION'] != 'on':
+        return None
+
+    metrics.slowest_size = flask_app.config['METRICS_SLOWEST']
+    instrumentation = Instrumentation(
+        metrics,
+        slow_query_seconds=flask_app.config['SLOW_QUERY_MS'] / 1000,
+        explain_slow=flask_app.config['SLOW_QUERY_EXPLAIN'],
+    )
+    event.listen(engine, 'before_cursor_execute', instrumentation.before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', instrumentation.after_cursor_execute)
+    flask_app.before_request(instrumentation.before_request)
+    flask_app.after_request(instrumentation.after_request)
+    flask_app.teardown_request(instrumentation.teardown_request)
+    return instrumentation
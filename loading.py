@@ -0,0 +1,41 @@
+"""
+Estrategias de carga de relaciones para los listados de préstamos.
+
+Las relaciones ``Loan.book`` y ``Loan.user`` son perezosas, así que una
+plantilla que recorre N préstamos y lee ``loan.book.title`` lanza N consultas
+extra. Cada vista declara aquí qué relaciones usa y la estrategia se elige
+por configuración (``LOAN_LOADING``):
+
+- ``joined``: un único SELECT con JOIN (ideal para páginas acotadas).
+- ``selectin``: un SELECT adicional por relación con ``IN (...)``.
+- ``lazy``: sin precarga (comportamiento original).
+"""
+
+from flask import current_app
+from sqlalchemy.orm import joinedload, selectinload
+
+from models import Loan
+
+STRATEGIES = {
+    'joined': joinedload,
+    'selectin': selectinload,
+}
+
+# Relaciones que cada vista lee en su plantilla. Son backrefs, así que se
+# resuelven por nombre cuando los mappers ya están configurados.
+VIEW_RELATIONSHIPS = {
+    'manage_loans': ('book', 'user'),
+    'my_loans': ('book',),
+    'student_dashboard': ('book',),
+}
+
+DEFAULT_STRATEGY = 'joined'
+
+
+def loan_options(view, model=Loan):
+    """Opciones de carga para la consulta de préstamos de ``view`` (Loan o LoanArchive)."""
+    strategies = current_app.config.get('LOAN_LOADING', {})
+    loader = STRATEGIES.get(strategies.get(view, DEFAULT_STRATEGY))
+    if loader is None:
+        return []
+    return [loader(getattr(model, name)) for name in VIEW_RELATIONSHIPS.get(view, ())]
@@ -0,0 +1,144 @@
+"""
+Archivado del historial de préstamos.
+
+Los préstamos devueltos no se borraban nunca: se acumulaban en ``loans``, la
+tabla que recorren todas las consultas de préstamos activos (my_loans,
+manage_loans, student_dashboard, el planificador de vencidos).
+archive_loans() mueve los devueltos hace más de LOAN_ARCHIVE_AFTER_DAYS días
+a ``loans_archive`` (models.LoanArchive) conservando el id, que no se
+reutiliza: ``loans`` es AUTOINCREMENT en SQLite (ver migrations.py) y usa una
+secuencia en PostgreSQL. Trabaja en lotes
+de LOAN_ARCHIVE_BATCH_SIZE con un INSERT ... SELECT y un DELETE por lote, en
+la misma transacción.
+
+En PostgreSQL ``loans_archive`` está particionada por año de devolución. La
+partición de cada año (``loans_archive_<año>``) se crea al archivar su primer
+préstamo, y descartar el historial de un año es borrar esa tabla. En SQLite
+es una tabla normal.
+
+Las vistas de historial siguen viendo todos los préstamos:
+
+- archived_history() da la consulta equivalente sobre el archivo para el
+  ``union`` de keyset_paginate() y render_listing() (manage_loans, /api/loans);
+- recent_returns() mezcla los últimos devueltos de ambas tablas (my_loans).
+
+``total_loans`` (stats.py) cuenta las dos tablas, así que archivar no cambia
+los totales del panel.
+
+Modos (LOAN_ARCHIVE_SCHEDULER), como en overdue.py:
+
+- ``thread``: un hilo en cada worker web archiva cada LOAN_ARCHIVE_INTERVAL
+  segundos; claim_run() garantiza que solo trabaje un proceso por intervalo.
+- ``off``: ``flask --app main archive-loans`` desde cron.
+"""
+
+import logging
+from datetime import datetime, timedelta
+
+import click
+from sqlalchemy import delete, insert, literal, select, text
+
+from app import app, db
+from loading import loan_options
+from models import Loan, LoanArchive
+from scheduler import IntervalScheduler, claim_run
+
+# Fila de stat_counters con la hora (epoch) de la última pasada
+LAST_RUN = 'loan_archive_last_run'
+
+# Columnas que se copian de loans a loans_archive
+COLUMNS = ('id', 'user_id', 'book_id', 'loan_date', 'due_date', 'return_date', 'status', 'created_at', 'updated_at')
+
+
+def archive_horizon(now=None):
+    """Fecha de devolución a partir de la cual un préstamo sigue en ``loans``."""
+    return (now or datetime.utcnow()) - timedelta(days=app.config['LOAN_ARCHIVE_AFTER_DAYS'])
+
+
+def ensure_partitions(years):
+    """Crea las particiones anuales de ``loans_archive`` que falten (solo PostgreSQL)."""
+    for year in sorted(years):
+        db.session.execute(text(
+            f"CREATE TABLE IF NOT EXISTS loans_archive_{year:d} PARTITION OF loans_archive "
+            f"FOR VALUES FROM ('{year:d}-01-01') TO ('{year + 1:d}-01-01')"
+        ))
+
+
+def archive_loans(before=None, batch_size=None):
+    """Mueve a ``loans_archive`` los préstamos devueltos antes de ``before``. Hace commit por lote."""
+    before = before or archive_horizon()
+    batch_size = batch_size or app.config['LOAN_ARCHIVE_BATCH_SIZE']
+    partitioned = db.engine.dialect.name == 'postgresql'
+    source = [Loan.__table__.c[name] for name in COLUMNS]
+
+    archived = 0
+    while True:
+        # Por ix_loans_status_return_date, los más antiguos primero
+        batch = db.session.query(Loan.id, Loan.return_date).filter(
+            Loan.status == 'returned', Loan.return_date < before
+        ).order_by(Loan.return_date, Loan.id).limit(batch_size).all()
+        if not batch:
+            break
+
+        loan_ids = [loan_id for loan_id, _ in batch]
+        if partitioned:
+            ensure_partitions({return_date.year for _, return_date in batch})
+        db.session.execute(
+            insert(LoanArchive.__table__).from_select(
+                [*COLUMNS, 'archived_at'],
+                select(*source, literal(datetime.utcnow(), db.DateTime)).where(Loan.id.in_(loan_ids))
+            )
+        )
+        # Sin eventos del ORM: total_loans ya cuenta las dos tablas
+        db.session.execute(delete(Loan.__table__).where(Loan.id.in_(loan_ids)))
+        db.session.commit()
+        archived += len(loan_ids)
+
+    if archived:
+        logging.info(f"Archived {archived} loans returned before {before:%Y-%m-%d}")
+    return archived
+
+
+def archived_history(view=None, user_id=None):
+    """``(consulta, claves)`` de los préstamos archivados, para el ``union`` de keyset_paginate()."""
+    query = LoanArchive.query.options(*loan_options(view, LoanArchive))
+    if user_id is not None:
+        query = query.filter(LoanArchive.user_id == user_id)
+    return query, [LoanArchive.created_at, LoanArchive.id]
+
+
+def recent_returns(user_id, limit, view=None):
+    """Los ``limit`` préstamos devueltos más recientes de ``user_id``, archivados o no."""
+    live = Loan.query.options(*loan_options(view)).filter(
+        Loan.user_id == user_id, Loan.status == 'returned'
+    ).order_by(Loan.return_date.desc()).limit(limit).all()
+    archived = LoanArchive.query.options(*loan_options(view, LoanArchive)).filter(
+        LoanArchive.user_id == user_id
+    ).order_by(LoanArchive.return_date.desc()).limit(limit).all()
+    return sorted(live + archived, key=lambda loan: loan.return_date, reverse=True)[:limit]
+
+
+def run_once(interval=None):
+    """Una pasada del planificador: reclama el intervalo y archiva."""
+    interval = interval if interval is not None else app.config['LOAN_ARCHIVE_INTERVAL']
+    if not claim_run(interval, LAST_RUN):
+        return 0
+    return archive_loans()
+
+
+scheduler = IntervalScheduler(app, app.config['LOAN_ARCHIVE_INTERVAL'], run_once, name='loan-archiver')
+
+
+@app.before_request
+def _start_scheduler():
+    if app.config['LOAN_ARCHIVE_SCHEDULER'] == 'thread':
+        scheduler.ensure_started()
+
+
+@app.cli.command('archive-loans')
+@click.option('--days', type=int, help='Antigüedad mínima de la devolución (LOAN_ARCHIVE_AFTER_DAYS).')
+@click.option('--batch-size', type=int, help='Préstamos por lote (LOAN_ARCHIVE_BATCH_SIZE).')
+def archive_loans_command(days, batch_size):
+    """Archiva ahora los préstamos devueltos hace tiempo (para cron)."""
+    before = datetime.utcnow() - timedelta(days=days) if days is not None else None
+    print(f"{archive_loans(before, batch_size)} préstamos archivados.")
@@ -0,0 +1,340 @@
+"""
+Servicio de préstamos: único punto de entrada para prestar y devolver libros.
+
+loan_book, create_loan y admin_add_loan pasan por checkout_book(), que es un
+lote de un solo par. checkout_batch() procesa muchos pares
+(usuario, libro) en una única transacción con un número fijo de sentencias,
+sin importar el tamaño del lote. Está pensado para el mostrador de
+circulación:
+
+1. Un SELECT de los usuarios, otro de los libros y otro de los préstamos
+   activos que ya existan para esos pares.
+2. Un único UPDATE condicional que descuenta las copias de todos los libros
+   del lote (``available_copies >= pedidas``), con RETURNING de los libros
+   que sí tenían copias. La base de datos lo serializa, así que con varios
+   workers nunca se prestan más copias de las que hay. PostgreSQL vuelve a
+   evaluar el WHERE tras el bloqueo de fila, así que no hace falta
+   SELECT ... FOR UPDATE.
+3. Un INSERT (executemany) de todos los préstamos concedidos y un SELECT
+   de sus ids.
+
+Las devoluciones siguen el mismo patrón: el estado del préstamo cambia con
+``WHERE status = 'active'`` (o ``'overdue'``), así que un préstamo no se
+puede devolver dos veces. Devolver un préstamo vencido registra un evento de
+multa (LoanEvent) de OVERDUE_FINE_CENTS_PER_DAY por día de retraso.
+"""
+
+import math
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, insert, tuple_, update
+
+from app import app, db
+from models import OUTSTANDING_STATUSES, Book, Loan, LoanEvent, User
+from stats import adjust_counter
+
+LOAN_DAYS = 14
+
+# Motivos de rechazo de un par del lote
+BOOK_NOT_FOUND = 'book_not_found'
+USER_NOT_FOUND = 'user_not_found'
+ALREADY_LOANED = 'already_loaned'
+UNAVAILABLE = 'unavailable'
+DUPLICATE = 'duplicate'
+NOT_ACTIVE = 'not_active'
+FORBIDDEN = 'forbidden'
+LOAN_NOT_FOUND = 'loan_not_found'
+
+MESSAGES = {
+    BOOK_NOT_FOUND: 'El libro no fue encontrado.',
+    USER_NOT_FOUND: 'Usuario no válido.',
+    ALREADY_LOANED: 'El usuario ya tiene este libro en préstamo.',
+    UNAVAILABLE: 'Este libro no está disponible actualmente.',
+    DUPLICATE: 'El par usuario/libro está repetido en el lote.',
+    NOT_ACTIVE: 'Este libro ya fue devuelto.',
+    FORBIDDEN: 'Solo puedes devolver tus propios libros.',
+    LOAN_NOT_FOUND: 'El préstamo no fue encontrado.',
+}
+
+
+class LoanError(Exception):
+    def __init__(self, reason):
+        super().__init__(MESSAGES[reason])
+        self.reason = reason
+        self.message = MESSAGES[reason]
+
+
+class CheckoutResult:
+    """Resultado de un par del lote: ``loan_id`` si se prestó, ``error`` si no."""
+
+    def __init__(self, user_id, book_id, user=None, book=None, loan_id=None, error=None):
+        self.user_id = user_id
+        self.book_id = book_id
+        self.user = user
+        self.book = book
+        self.loan_id = loan_id
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class ReturnResult:
+    def __init__(self, loan_id, book_id=None, error=None):
+        self.loan_id = loan_id
+        self.book_id = book_id
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def _reserve_copies(needed):
+    """
+    Descuenta ``needed[book_id]`` copias de cada libro en un solo UPDATE.
+
+    Cada libro se reserva entero o nada. Devuelve los ids reservados.
+    """
+    amount = case(needed, value=Book.id)
+    statement = (
+        update(Book)
+        .where(Book.id.in_(list(needed)), Book.available_copies >= amount)
+        .values(available_copies=Book.available_copies - amount, updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+
+    if db.engine.dialect.update_returning:
+        reserved = set(db.session.execute(statement.returning(Book.id)).scalars())
+    else:
+        # Sin RETURNING: un UPDATE condicional por libro
+        reserved = set()
+        for book_id, count in needed.items():
+            result = db.session.execute(
+                update(Book)
+                .where(Book.id == book_id, Book.available_copies >= count)
+                .values(available_copies=Book.available_copies - count, updated_at=datetime.utcnow())
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount == 1:
+                reserved.add(book_id)
+
+    _expire_books(needed)
+    return reserved
+
+
+def _release_copies(released):
+    """Devuelve ``released[book_id]`` copias a cada libro en un solo UPDATE."""
+    amount = case(released, value=Book.id)
+    db.session.execute(
+        update(Book)
+        .where(Book.id.in_(list(released)))
+        .values(available_copies=Book.available_copies + amount, updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    _expire_books(released)
+
+
+def _expire_books(book_ids):
+    # Los UPDATE no pasan por el ORM: los Book cargados en la sesión quedan desfasados
+    for book_id in book_ids:
+        book = db.session.identity_map.get(db.session.identity_key(Book, book_id))
+        if book is not None:
+            db.session.expire(book, ['available_copies', 'updated_at'])
+
+
+def checkout_batch(pairs, loan_days=LOAN_DAYS):
+    """
+    Presta cada par ``(user_id, book_id)`` de ``pairs`` y hace commit.
+
+    Devuelve un CheckoutResult por par, en el mismo orden. Los pares
+    rechazados no impiden que se presten los demás.
+    """
+    pairs = [(int(user_id), int(book_id)) for user_id, book_id in pairs]
+    if not pairs:
+        return []
+
+    user_ids = {user_id for user_id, _ in pairs}
+    book_ids = {book_id for _, book_id in pairs}
+    users = {user.id: user for user in User.query.filter(User.id.in_(user_ids))}
+    books = {book.id: book for book in Book.query.filter(Book.id.in_(book_ids))}
+    existing = set(
+        db.session.query(Loan.user_id, Loan.book_id).filter(
+            Loan.status.in_(OUTSTANDING_STATUSES),
+            tuple_(Loan.user_id, Loan.book_id).in_(set(pairs))
+        )
+    )
+
+    results = []
+    seen = set()
+    for user_id, book_id in pairs:
+        result = CheckoutResult(user_id, book_id, users.get(user_id), books.get(book_id))
+        if result.user is None:
+            result.error = USER_NOT_FOUND
+        elif result.book is None:
+            result.error = BOOK_NOT_FOUND
+        elif (user_id, book_id) in existing:
+            result.error = ALREADY_LOANED
+        elif (user_id, book_id) in seen:
+            result.error = DUPLICATE
+        seen.add((user_id, book_id))
+        results.append(result)
+
+    pending = [result for result in results if result.ok]
+    if pending:
+        reserved = _reserve_copies(Counter(result.book_id for result in pending))
+        for result in pending:
+            if result.book_id not in reserved:
+                result.error = UNAVAILABLE
+
+    granted = [result for result in results if result.ok]
+    if granted:
+        now = datetime.utcnow()
+        rows = [
+            {
+                'user_id': result.user_id,
+                'book_id': result.book_id,
+                'loan_date': now,
+                'due_date': now + timedelta(days=loan_days),
+                'status': 'active',
+                'created_at': now,
+                'updated_at': now,
+            }
+            for result in granted
+        ]
+        # executemany: un solo viaje a la base de datos para todo el lote. Con
+        # RETURNING ordenado, SQLite insertaría fila a fila.
+        db.session.execute(insert(Loan), rows)
+        loan_ids = dict(
+            ((user_id, book_id), loan_id)
+            for loan_id, user_id, book_id in db.session.query(Loan.id, Loan.user_id, Loan.book_id).filter(
+                Loan.status == 'active',
+                tuple_(Loan.user_id, Loan.book_id).in_([(r.user_id, r.book_id) for r in granted])
+            )
+        )
+        for result in granted:
+            result.loan_id = loan_ids.get((result.user_id, result.book_id))
+
+        # El INSERT masivo no dispara los eventos del ORM
+        adjust_counter('total_loans', len(granted))
+        adjust_counter('active_loans', len(granted))
+
+    db.session.commit()
+    return results
+
+
+def checkout_book(user_id, book_id):
+    """Presta un libro y hace commit. Lanza LoanError si no es posible."""
+    result = checkout_batch([(user_id, book_id)])[0]
+    if not result.ok:
+        raise LoanError(result.error)
+    return result
+
+
+def fine_cents(due_date, returned_at):
+    """Multa por devolver en ``returned_at`` un préstamo que vencía en ``due_date``."""
+    late = returned_at - due_date
+    if late <= timedelta(0):
+        return 0
+    days = math.ceil(late / timedelta(days=1))
+    return days * app.config['OVERDUE_FINE_CENTS_PER_DAY']
+
+
+def return_batch(loan_ids, user_id=None):
+    """
+    Devuelve los préstamos ``loan_ids`` y hace commit.
+
+    Con ``user_id`` solo se aceptan préstamos de ese usuario. Devuelve un
+    ReturnResult por préstamo, en el mismo orden.
+    """
+    loan_ids = [int(loan_id) for loan_id in loan_ids]
+    if not loan_ids:
+        return []
+
+    loans = {
+        loan_id: (owner_id, status, due_date)
+        for loan_id, owner_id, status, due_date in db.session.query(Loan.id, Loan.user_id, Loan.status, Loan.due_date)
+        .filter(Loan.id.in_(set(loan_ids)))
+    }
+
+    results = []
+    candidates = set()
+    for loan_id in loan_ids:
+        result = ReturnResult(loan_id)
+        if loan_id not in loans:
+            result.error = LOAN_NOT_FOUND
+        elif user_id is not None and loans[loan_id][0] != user_id:
+            result.error = FORBIDDEN
+        elif loans[loan_id][1] not in OUTSTANDING_STATUSES or loan_id in candidates:
+            result.error = NOT_ACTIVE
+        else:
+            candidates.add(loan_id)
+        results.append(result)
+
+    if candidates:
+        now = datetime.utcnow()
+        # Un UPDATE por estado de origen, para saber cuántos estaban vencidos
+        returned = {}
+        returned_overdue = 0
+        for status in OUTSTANDING_STATUSES:
+            statement = (
+                update(Loan)
+                .where(Loan.id.in_(candidates), Loan.status == status)
+                .values(status='returned', return_date=now, updated_at=now)
+                .execution_options(synchronize_session=False)
+            )
+            if db.engine.dialect.update_returning:
+                rows = dict(db.session.execute(statement.returning(Loan.id, Loan.book_id)).all())
+                returned.update(rows)
+                count = len(rows)
+            else:
+                count = db.session.execute(statement).rowcount
+            if status == 'overdue':
+                returned_overdue = count
+
+        if not db.engine.dialect.update_returning:
+            returned = dict(
+                db.session.query(Loan.id, Loan.book_id).filter(
+                    Loan.id.in_(candidates), Loan.status == 'returned', Loan.return_date == now
+                )
+            )
+
+        for result in results:
+            if result.ok and result.loan_id in candidates:
+                if result.loan_id in returned:
+                    result.book_id = returned[result.loan_id]
+                else:
+                    # Otra petición lo devolvió entre la lectura y el UPDATE
+                    result.error = NOT_ACTIVE
+
+        if returned:
+            _release_copies(Counter(returned.values()))
+            adjust_counter('active_loans', -len(returned))
+            if returned_overdue:
+                adjust_counter('overdue_loans', -returned_overdue)
+
+            fines = [
+                {'loan_id': loan_id, 'user_id': loans[loan_id][0], 'kind': 'fine',
+                 'amount_cents': fine_cents(loans[loan_id][2], now), 'created_at': now}
+                for loan_id in returned
+            ]
+            fines = [fine for fine in fines if fine['amount_cents'] > 0]
+            if fines:
+                db.session.execute(insert(LoanEvent), fines)
+            for loan_id in returned:
+                loan = db.session.identity_map.get(db.session.identity_key(Loan, loan_id))
+                if loan is not None:
+                    db.session.expire(loan, ['status', 'return_date', 'updated_at'])
+
+    db.session.commit()
+    return results
+
+
+def return_book(loan_id, user_id=None):
+    """Devuelve un préstamo y hace commit. Lanza LoanError si no es posible."""
+    result = return_batch([loan_id], user_id=user_id)[0]
+    if not result.ok:
+        raise LoanError(result.error)
+    return result
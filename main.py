@@ -1,4 +1,8 @@
 from app import app
+import migrations
 
 if __name__ == "__main__":
+    # Development server only; deployments run `flask --app main upgrade-db` instead
+    with app.app_context():
+        migrations.upgrade_schema()
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,148 @@
+"""
+Creación y actualización del esquema.
+
+Importar la aplicación no ejecuta DDL: los workers de gunicorn, los comandos
+``flask`` y los scripts arrancan sin consultar el esquema. upgrade_schema()
+se ejecuta de forma explícita al desplegar, con
+``flask --app main upgrade-db``, y al arrancar el servidor de desarrollo
+(``python main.py``).
+
+upgrade_schema() también crea las filas de ``stat_counters`` que falten
+(stats.seed_counters()), así que ninguna petición tiene que recalcular los
+contadores del panel ni del estado del catálogo.
+
+En SQLite, ``loans`` debe ser AUTOINCREMENT: sin él, un préstamo nuevo
+recibe el mayor id libre, que puede ser el de uno ya archivado en
+``loans_archive``. upgrade_schema() reconstruye una tabla ``loans`` antigua
+creada sin AUTOINCREMENT y sube su contador por encima de los ids archivados.
+
+``action_log_daily`` tiene una fila por día, usuario y tipo de acción
+(índice único ``uq_action_log_daily_day_user_kind``). Antes de crear ese
+índice en una base existente, upgrade_schema() suma las filas repetidas y
+borra el índice no único al que sustituye.
+
+``create_all()`` solo crea las tablas que faltan: no añade índices nuevos a
+tablas que ya existen (p.ej. un ``library.db`` antiguo). upgrade_schema()
+crea además los índices declarados en los modelos que aún no estén en la base
+de datos y el índice de búsqueda. Es idempotente.
+"""
+
+import logging
+
+from sqlalchemy import func, inspect, select
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from app import app, db
+from models import Loan, LoanArchive
+import search
+import stats
+
+
+def existing_index_names(connection, inspector, table_name):
+    if connection.dialect.name == 'sqlite':
+        # El inspector de SQLite omite los índices sobre expresiones (lower(...))
+        return {name for name, in connection.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ?", (table_name,)
+        )}
+    return {index['name'] for index in inspector.get_indexes(table_name)}
+
+
+def missing_indexes(connection):
+    inspector = inspect(connection)
+    existing_tables = set(inspector.get_table_names())
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = existing_index_names(connection, inspector, table.name)
+        for index in table.indexes:
+            # Omite los índices con ddl_if() de otro dialecto
+            if index.name not in existing and CreateIndex(index)._should_execute(index, connection):
+                yield index
+
+
+def rebuild_with_autoincrement(connection, table):
+    """
+    Reconstruye en SQLite una tabla ``sqlite_autoincrement`` creada sin AUTOINCREMENT.
+
+    Copia las filas conservando los ids. Los índices se pierden con la tabla
+    antigua; upgrade_schema() los vuelve a crear a continuación.
+    """
+    if connection.dialect.name != 'sqlite' or not table.dialect_options['sqlite']['autoincrement']:
+        return False
+    sql = connection.exec_driver_sql(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table.name,)
+    ).scalar()
+    if sql is None or 'AUTOINCREMENT' in sql.upper():
+        return False
+
+    logging.info(f"Rebuilding table {table.name} with AUTOINCREMENT")
+    rebuild = f"{table.name}_rebuild"
+    create = str(CreateTable(table).compile(connection)).strip()
+    connection.exec_driver_sql(create.replace(f"CREATE TABLE {table.name} ", f"CREATE TABLE {rebuild} ", 1))
+    existing = {row[1] for row in connection.exec_driver_sql(f"PRAGMA table_info({table.name})")}
+    columns = ', '.join(column.name for column in table.columns if column.name in existing)
+    connection.exec_driver_sql(f"INSERT INTO {rebuild} ({columns}) SELECT {columns} FROM {table.name}")
+    connection.exec_driver_sql(f"DROP TABLE {table.name}")
+    connection.exec_driver_sql(f"ALTER TABLE {rebuild} RENAME TO {table.name}")
+    return True
+
+
+def raise_sqlite_sequence(connection, table, floor):
+    """Sube el contador AUTOINCREMENT de ``table`` hasta ``floor`` si está por debajo."""
+    current = connection.exec_driver_sql(
+        "SELECT seq FROM sqlite_sequence WHERE name = ?", (table.name,)
+    ).scalar()
+    if current is None:
+        connection.exec_driver_sql("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table.name, floor))
+    elif current < floor:
+        connection.exec_driver_sql("UPDATE sqlite_sequence SET seq = ? WHERE name = ?", (floor, table.name))
+
+
+# Índices sustituidos por otros; upgrade_schema() los borra si existen
+OBSOLETE_INDEXES = ('ix_action_log_daily_day_user_kind',)
+
+
+def merge_daily_duplicates(connection):
+    """Suma en una sola fila las filas de ``action_log_daily`` con el mismo día, usuario y tipo."""
+    key = "day, coalesce(user_id, 0), kind"
+    merged = connection.exec_driver_sql(
+        f"UPDATE action_log_daily SET count = (SELECT SUM(d.count) FROM action_log_daily d "
+        f"WHERE d.day = action_log_daily.day AND coalesce(d.user_id, 0) = coalesce(action_log_daily.user_id, 0) "
+        f"AND d.kind = action_log_daily.kind) "
+        f"WHERE id IN (SELECT MIN(id) FROM action_log_daily GROUP BY {key} HAVING COUNT(*) > 1)"
+    ).rowcount
+    if merged:
+        connection.exec_driver_sql(
+            f"DELETE FROM action_log_daily WHERE id NOT IN (SELECT MIN(id) FROM action_log_daily GROUP BY {key})"
+        )
+        logging.warning(f"Merged duplicate action_log_daily rows into {merged} rows")
+
+
+def upgrade_schema():
+    with db.engine.begin() as connection:
+        db.metadata.create_all(connection)
+        if connection.dialect.name == 'sqlite':
+            rebuild_with_autoincrement(connection, Loan.__table__)
+            # Los ids archivados tampoco se reutilizan
+            archived_max = connection.execute(select(func.max(LoanArchive.id))).scalar()
+            if archived_max:
+                raise_sqlite_sequence(connection, Loan.__table__, archived_max)
+        pending = list(missing_indexes(connection))
+        if any(index.name == 'uq_action_log_daily_day_user_kind' for index in pending):
+            merge_daily_duplicates(connection)
+        for name in OBSOLETE_INDEXES:
+            connection.exec_driver_sql(f"DROP INDEX IF EXISTS {name}")
+        for index in pending:
+            logging.info(f"Creating index {index.name} on {index.table.name}")
+            index.create(connection)
+        search.install_search_index(connection)
+    seeded = stats.seed_counters()
+    if seeded:
+        logging.info(f"Seeded stat counters: {', '.join(sorted(seeded))}")
+
+
+@app.cli.command('upgrade-db')
+def upgrade_db_command():
+    """Crea las tablas, índices y estructuras que falten en la base de datos."""
+    upgrade_schema()
+    print("Esquema actualizado.")
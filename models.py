@@ -1,13 +1,22 @@
 from datetime import datetime
 from app import db
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import check_password_hash
+
+import passwords
 
 # =======================
 # Modelo de Usuario
 # =======================
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
+    __table_args__ = (
+        # Búsqueda por prefijo sin distinguir mayúsculas (typeahead de admin_add_loan)
+        db.Index('ix_users_first_name_lower', db.text('lower(first_name)')),
+        db.Index('ix_users_last_name_lower', db.text('lower(last_name)')),
+        db.Index('ix_users_username_lower', db.text('lower(username)')),
+        db.Index('ix_users_email_lower', db.text('lower(email)')),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=True)
@@ -26,7 +35,8 @@ class User(UserMixin, db.Model):
     action_logs = db.relationship('ActionLog', backref='user', lazy=True)  # 👈 Nombre único
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        # Algoritmo y coste según PASSWORD_HASH_METHOD
+        self.password_hash = passwords.hash_password(password)
 
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
@@ -53,6 +63,10 @@ class User(UserMixin, db.Model):
 # =======================
 class Book(db.Model):
     __tablename__ = 'books'
+    __table_args__ = (
+        # Orden de manage_books / book_search (paginación por título)
+        db.Index('ix_books_title_id', 'title', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
@@ -80,8 +94,52 @@ class Book(db.Model):
 # =======================
 # Modelo de Préstamos
 # =======================
-class Loan(db.Model):
+
+# Estados de un préstamo que aún no se ha devuelto. 'overdue' lo asigna el
+# planificador de overdue.py cuando pasa la fecha de vencimiento.
+OUTSTANDING_STATUSES = ('active', 'overdue')
+
+class LoanMixin:
+    """Propiedades comunes a Loan y LoanArchive, que comparten plantillas."""
+
+    @property
+    def is_outstanding(self):
+        return self.status in OUTSTANDING_STATUSES
+
+    @property
+    def is_overdue(self):
+        return self.status == 'overdue'
+
+    @property
+    def days_remaining(self):
+        if self.status == 'active':
+            # Hasta que el planificador lo marque, un préstamo recién vencido muestra 0
+            delta = self.due_date - datetime.utcnow()
+            return max(delta.days, 0)
+        return 0
+
+class Loan(LoanMixin, db.Model):
     __tablename__ = 'loans'
+    __table_args__ = (
+        # Préstamos activos de un usuario (student_dashboard, my_loans, book_details, loan_book)
+        db.Index('ix_loans_user_status', 'user_id', 'status'),
+        # Préstamos activos de un libro (delete_book)
+        db.Index('ix_loans_book_status', 'book_id', 'status'),
+        # Planificador: status = 'active' AND due_date < ahora; listados: status = 'overdue'
+        db.Index('ix_loans_status_due_date', 'status', 'due_date'),
+        # Variante parcial, solo en PostgreSQL: SQLite no usa índices parciales
+        # cuando 'active' llega como parámetro enlazado.
+        db.Index(
+            'ix_loans_active_due_date', 'due_date',
+            postgresql_where=db.text("status = 'active'")
+        ).ddl_if(dialect='postgresql'),
+        # Orden de manage_loans (paginación por fecha de creación)
+        db.Index('ix_loans_created_at_id', 'created_at', 'id'),
+        # Archivado: devueltos antes del horizonte (loan_archive.py)
+        db.Index('ix_loans_status_return_date', 'status', 'return_date'),
+        # Sin AUTOINCREMENT, SQLite reutilizaría los ids de los préstamos archivados
+        {'sqlite_autoincrement': True},
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -94,19 +152,67 @@ class Loan(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
-    @property
-    def is_overdue(self):
-        return self.status == 'active' and self.due_date < datetime.utcnow()
+    def __repr__(self):
+        return f'<Loan {self.user_id} - Book {self.book_id}>'
 
-    @property
-    def days_remaining(self):
-        if self.status == 'active':
-            delta = self.due_date - datetime.utcnow()
-            return delta.days
-        return 0
+# =======================
+# Préstamos archivados
+# =======================
+class LoanArchive(LoanMixin, db.Model):
+    """
+    Préstamos devueltos hace más de LOAN_ARCHIVE_AFTER_DAYS, movidos desde
+    ``loans`` por loan_archive.py con el mismo id. En PostgreSQL la tabla está
+    particionada por año de devolución; la clave primaria incluye
+    ``return_date`` porque PostgreSQL lo exige en tablas particionadas.
+    """
+    __tablename__ = 'loans_archive'
+    __table_args__ = (
+        # Historial de un usuario (my_loans)
+        db.Index('ix_loans_archive_user_return_date', 'user_id', 'return_date'),
+        # Orden de manage_loans (paginación por fecha de creación)
+        db.Index('ix_loans_archive_created_at_id', 'created_at', 'id'),
+        {'postgresql_partition_by': 'RANGE (return_date)'},
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    return_date = db.Column(db.DateTime, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id'), nullable=False)
+    loan_date = db.Column(db.DateTime)
+    due_date = db.Column(db.DateTime, nullable=False)
+    status = db.Column(db.String(20), default='returned')
+
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    user = db.relationship('User')
+    book = db.relationship('Book')
 
     def __repr__(self):
-        return f'<Loan {self.user_id} - Book {self.book_id}>'
+        return f'<LoanArchive {self.user_id} - Book {self.book_id}>'
+
+# =======================
+# Eventos de préstamos (avisos de vencimiento y multas)
+# =======================
+class LoanEvent(db.Model):
+    __tablename__ = 'loan_events'
+    __table_args__ = (
+        # Eventos pendientes de procesar, en orden
+        db.Index('ix_loan_events_processed_at_id', 'processed_at', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    # Sin claves foráneas: el evento se conserva aunque el préstamo se archive
+    loan_id = db.Column(db.Integer, nullable=False, index=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # 'overdue' | 'fine'
+    amount_cents = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<LoanEvent {self.kind} loan={self.loan_id}>'
 
 # =======================
 # Modelo para OAuth
@@ -129,6 +235,10 @@ class OAuth(db.Model):
 # =======================
 class ActionLog(db.Model):
     __tablename__ = 'action_logs'
+    __table_args__ = (
+        # Últimas acciones en admin_dashboard
+        db.Index('ix_action_logs_timestamp', 'timestamp'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
@@ -137,3 +247,37 @@ class ActionLog(db.Model):
 
     def __repr__(self):
         return f"<ActionLog {self.user_id} - {self.action}>"
+
+# =======================
+# Resumen diario del historial (audit_retention.py)
+# =======================
+class ActionLogDaily(db.Model):
+    __tablename__ = 'action_log_daily'
+    __table_args__ = (
+        # Una fila por día, usuario y tipo; coalesce porque dos NULL nunca chocan en un índice único
+        db.Index('uq_action_log_daily_day_user_kind', 'day', db.text('coalesce(user_id, 0)'), 'kind', unique=True),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    # Sin clave foránea: el resumen se conserva aunque se borre el usuario
+    user_id = db.Column(db.Integer, nullable=True)
+    # Texto de la acción hasta la primera comilla, p.ej. "Eliminó el libro"
+    kind = db.Column(db.String(100), nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<ActionLogDaily {self.day} {self.user_id} {self.kind}={self.count}>"
+
+# =======================
+# Contadores agregados (panel de administración)
+# =======================
+class StatCounter(db.Model):
+    __tablename__ = 'stat_counters'
+
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<StatCounter {self.name}={self.value}>'
@@ -0,0 +1,123 @@
+"""
+Planificador de préstamos vencidos.
+
+Antes, "vencido" se calculaba en cada sitio: ``Loan.is_overdue`` por fila en
+las plantillas, y admin_dashboard y manage_loans con
+``due_date < datetime.now()``, que es hora local cuando ``due_date`` está en
+UTC. Ahora un único proceso pasa los préstamos en bloque de ``active`` a
+``overdue``. Lo hace con un UPDATE condicional
+(``status = 'active' AND due_date < ahora``) sobre ``ix_loans_status_due_date``,
+y los listados filtran por ``status = 'overdue'``.
+
+Cada préstamo que vence genera un LoanEvent ``overdue`` (aviso al usuario)
+en la misma transacción. La devolución de un préstamo vencido genera el
+evento ``fine`` (ver loan_service). Quien envíe avisos o cobre multas lee los
+eventos pendientes con pending_events() y los marca con mark_processed().
+
+Modos (OVERDUE_SCHEDULER):
+
+- ``thread``: un hilo en cada worker web ejecuta mark_overdue() cada
+  OVERDUE_INTERVAL segundos.
+- ``off``: no se ejecuta en el proceso web; se usa
+  ``flask --app main overdue-worker`` como proceso aparte, o
+  ``flask --app main mark-overdue`` desde cron.
+
+El hilo es un scheduler.IntervalScheduler. Es seguro con varios workers de
+gunicorn: cada pasada reclama antes la fila ``overdue_last_run`` de
+``stat_counters`` con scheduler.claim_run(), así que en cada intervalo solo
+trabaja un proceso. Aunque dos coincidieran, el
+``WHERE status = 'active'`` garantiza que cada préstamo cambia y genera su
+evento una sola vez.
+"""
+
+import logging
+from datetime import datetime
+
+import click
+from sqlalchemy import insert, update
+
+from app import app, db
+from models import Loan, LoanEvent
+from scheduler import IntervalScheduler, claim_run
+from stats import adjust_counter
+
+# Fila de stat_counters con la hora (epoch) de la última pasada
+LAST_RUN = 'overdue_last_run'
+
+
+def mark_overdue(now=None):
+    """Marca como vencidos los préstamos activos cuya fecha ya pasó y hace commit."""
+    now = now or datetime.utcnow()
+    statement = (
+        update(Loan)
+        .where(Loan.status == 'active', Loan.due_date < now)
+        .values(status='overdue', updated_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    if db.engine.dialect.update_returning:
+        marked = db.session.execute(statement.returning(Loan.id, Loan.user_id)).all()
+    else:
+        db.session.execute(statement)
+        marked = db.session.query(Loan.id, Loan.user_id).filter(
+            Loan.status == 'overdue', Loan.updated_at == now
+        ).all()
+
+    if marked:
+        db.session.execute(insert(LoanEvent), [
+            {'loan_id': loan_id, 'user_id': user_id, 'kind': 'overdue', 'created_at': now}
+            for loan_id, user_id in marked
+        ])
+        adjust_counter('overdue_loans', len(marked))
+    db.session.commit()
+
+    if marked:
+        logging.info(f"Marked {len(marked)} loans as overdue")
+    return len(marked)
+
+
+def run_once(interval=None):
+    """Una pasada del planificador: reclama el intervalo y marca los vencidos."""
+    interval = interval if interval is not None else app.config['OVERDUE_INTERVAL']
+    if not claim_run(interval, LAST_RUN):
+        return 0
+    return mark_overdue()
+
+
+def pending_events(kind=None, limit=100):
+    """Eventos sin procesar, del más antiguo al más reciente."""
+    query = LoanEvent.query.filter(LoanEvent.processed_at.is_(None))
+    if kind:
+        query = query.filter(LoanEvent.kind == kind)
+    return query.order_by(LoanEvent.id).limit(limit).all()
+
+
+def mark_processed(event_ids):
+    db.session.execute(
+        update(LoanEvent)
+        .where(LoanEvent.id.in_(list(event_ids)), LoanEvent.processed_at.is_(None))
+        .values(processed_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+
+scheduler = IntervalScheduler(app, app.config['OVERDUE_INTERVAL'], run_once, name='overdue-scheduler')
+
+
+@app.before_request
+def _start_scheduler():
+    if app.config['OVERDUE_SCHEDULER'] == 'thread':
+        scheduler.ensure_started()
+
+
+@app.cli.command('mark-overdue')
+def mark_overdue_command():
+    """Marca ahora los préstamos vencidos (para cron)."""
+    print(f"{mark_overdue()} préstamos marcados como vencidos.")
+
+
+@app.cli.command('overdue-worker')
+def overdue_worker_command():
+    """Ejecuta el planificador de vencidos en primer plano (proceso aparte)."""
+    click.echo(f"Planificador de vencidos cada {scheduler.interval}s", err=True)
+    scheduler.run()
@@ -0,0 +1,171 @@
+"""
+Paginación por cursor (keyset) para los listados grandes.
+
+En lugar de OFFSET, cada página continúa a partir de la clave de ordenación
+de la última fila mostrada, de modo que el coste por página no depende de
+cuántas filas haya antes. El cursor es opaco para el cliente.
+"""
+
+import base64
+import binascii
+import heapq
+import json
+from datetime import datetime
+
+from flask import current_app, render_template, request, stream_template, url_for
+from sqlalchemy import tuple_
+
+
+class KeysetPage:
+    """Una página de resultados y el cursor para pedir la siguiente."""
+
+    def __init__(self, items, per_page, cursor=None, next_cursor=None):
+        self.items = items
+        self.per_page = per_page
+        self.cursor = cursor
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def is_first(self):
+        return self.cursor is None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and 'dt' in value:
+        return datetime.fromisoformat(value['dt'])
+    return value
+
+
+def encode_cursor(values):
+    payload = json.dumps([_encode_value(v) for v in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """Devuelve los valores del cursor, o None si está vacío o no es válido."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, binascii.Error):
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    try:
+        return [_decode_value(v) for v in values]
+    except ValueError:
+        return None
+
+
+def get_page_size():
+    """Tamaño de página pedido en ``?per_page=``, acotado por la configuración."""
+    default = current_app.config['PAGE_SIZE']
+    maximum = current_app.config['MAX_PAGE_SIZE']
+    per_page = request.args.get('per_page', default, type=int)
+    return max(1, min(per_page, maximum))
+
+
+def _ordered(query, keys, descending):
+    return query.order_by(*[key.desc() if descending else key.asc() for key in keys])
+
+
+def _keyset_rows(query, keys, values, limit, descending):
+    """Hasta ``limit`` filas de ``query`` tras ``values``, como pares (clave, fila)."""
+    if values is not None:
+        row_key = tuple_(*keys)
+        cursor_key = tuple_(*values)
+        query = query.filter(row_key < cursor_key if descending else row_key > cursor_key)
+    rows = _ordered(query.add_columns(*keys), keys, descending).limit(limit).all()
+    return [(tuple(row[1:]), row[0]) for row in rows]
+
+
+def keyset_paginate(query, keys, cursor=None, per_page=None, descending=False, union=()):
+    """
+    Devuelve una KeysetPage de ``query`` ordenada por ``keys``.
+
+    ``keys`` debe terminar en una columna única (normalmente el id) para que
+    el orden sea total. Todas las claves se ordenan en la misma dirección.
+
+    ``union`` son otros pares ``(query, keys)`` cuyas filas se intercalan en
+    el mismo orden, p.ej. los préstamos archivados. Cada fuente se consulta
+    por separado con el mismo cursor y las filas se mezclan en memoria, así
+    que las claves no deben repetirse entre fuentes.
+    """
+    if per_page is None:
+        per_page = get_page_size()
+
+    values = decode_cursor(cursor, len(keys))
+    if values is None:
+        cursor = None
+
+    rows = []
+    for source_query, source_keys in [(query, keys), *union]:
+        rows.extend(_keyset_rows(source_query, source_keys, values, per_page + 1, descending))
+    if union:
+        rows.sort(key=lambda row: row[0], reverse=descending)
+
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(list(rows[-1][0]))
+
+    return KeysetPage([item for _, item in rows], per_page, cursor, next_cursor)
+
+
+def _stream(query, keys, descending):
+    rows = _ordered(query.add_columns(*keys), keys, descending).yield_per(current_app.config['STREAM_BATCH_SIZE'])
+    return ((tuple(row[1:]), row[0]) for row in rows)
+
+
+def wants_stream():
+    """``?all=1`` pide el listado completo, renderizado en streaming."""
+    return request.args.get('all') == '1'
+
+
+def render_listing(template, name, query, keys, descending=False, union=(), **context):
+    """
+    Renderiza un listado paginado, o completo en streaming con ``?all=1``.
+
+    En modo streaming las filas se leen de la base de datos por lotes
+    (``yield_per``) mientras Jinja va enviando el HTML, así que la memoria por
+    petición no crece con el tamaño de la tabla. La plantilla recibe ``page``
+    como None en ese caso. ``union`` como en keyset_paginate().
+    """
+    if wants_stream():
+        if union:
+            streams = [_stream(source_query, source_keys, descending)
+                       for source_query, source_keys in [(query, keys), *union]]
+            rows = (item for _, item in heapq.merge(*streams, key=lambda row: row[0], reverse=descending))
+        else:
+            rows = _ordered(query, keys, descending).yield_per(current_app.config['STREAM_BATCH_SIZE'])
+        context[name] = rows
+        return stream_template(template, page=None, **context)
+
+    page = keyset_paginate(query, keys, request.args.get('cursor'), descending=descending, union=union)
+    context[name] = page.items
+    return render_template(template, page=page, **context)
+
+
+def page_url(**changes):
+    """URL de la vista actual con los parámetros ``changes`` sustituidos (None = quitar)."""
+    args = request.args.to_dict()
+    args.update(changes)
+    args = {k: v for k, v in args.items() if v is not None}
+    return url_for(request.endpoint, **(request.view_args or {}), **args)
@@ -0,0 +1,328 @@
+"""
+Política de contraseñas: coste del hash, verificación acotada y freno a la
+fuerza bruta.
+
+Cada login calcula un hash lento a propósito (scrypt por defecto en
+Werkzeug). Al empezar el semestre, una ráfaga de logins ocupaba toda la CPU
+de los workers. Este módulo controla ese coste:
+
+- PASSWORD_HASH_METHOD elige algoritmo y coste con la sintaxis de Werkzeug
+  (``scrypt:32768:8:1``, ``scrypt:16384:8:1``, ``pbkdf2:sha256:600000``...).
+  Los hashes con otro método se siguen aceptando. Tras un login correcto se
+  recalculan en segundo plano con el método actual, así que cambiar la
+  política no obliga a nadie a cambiar de contraseña.
+- La verificación se ejecuta en un pool de PASSWORD_HASH_WORKERS hilos por
+  proceso. hashlib libera el GIL durante scrypt/pbkdf2, pero así nunca hay
+  más de ese número de hashes a la vez y el resto de hilos del worker siguen
+  atendiendo peticiones. Si la cola supera PASSWORD_HASH_QUEUE, el login se
+  rechaza como "ocupado" en lugar de esperar.
+- Un contador en memoria de intentos fallidos por usuario
+  (LOGIN_MAX_FAILURES) y por IP (LOGIN_MAX_FAILURES_PER_IP) dentro de
+  LOGIN_FAILURE_WINDOW segundos. Al superarlo, los intentos se rechazan antes
+  de calcular ningún hash. Cada intento se comprueba y se anota como fallo
+  bajo el mismo cerrojo antes de calcular el hash, y se retira si el login es
+  correcto o el pool está ocupado. Así los intentos simultáneos tampoco pasan
+  del límite. Es por proceso; con N workers el límite efectivo es como mucho
+  N veces mayor. La IP es ``request.remote_addr``, que detrás del proxy sale
+  de X-Forwarded-For (TRUSTED_PROXY_HOPS en app.py). Sin ella todos los
+  logins compartirían la IP del proxy y su límite; si no hay una IP de
+  cliente fiable, conviene LOGIN_MAX_FAILURES_PER_IP=0 (sin límite por IP).
+
+Benchmark: ``python -m benchmarks.login_bench``.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+INVALID = 'invalid'
+THROTTLED = 'throttled'
+BUSY = 'busy'
+
+MESSAGES = {
+    INVALID: 'Usuario o contraseña incorrectos.',
+    THROTTLED: 'Demasiados intentos fallidos. Inténtalo de nuevo en unos minutos.',
+    BUSY: 'El servidor está ocupado. Inténtalo de nuevo en unos segundos.',
+}
+
+
+class LoginError(Exception):
+    def __init__(self, reason):
+        super().__init__(MESSAGES[reason])
+        self.reason = reason
+        self.message = MESSAGES[reason]
+
+
+# =======================
+# Método de hash
+# =======================
+
+_method_prefixes = {}
+
+
+def hash_method():
+    return current_app.config['PASSWORD_HASH_METHOD']
+
+
+def _method_prefix(method):
+    """Prefijo que Werkzeug escribe para ``method`` (``scrypt`` -> ``scrypt:32768:8:1``)."""
+    prefix = _method_prefixes.get(method)
+    if prefix is None:
+        prefix = _method_prefixes[method] = generate_password_hash('', method=method).split('$', 1)[0]
+    return prefix
+
+
+def hash_password(password):
+    return generate_password_hash(password, method=hash_method())
+
+
+def needs_rehash(pwhash):
+    return bool(pwhash) and pwhash.split('$', 1)[0] != _method_prefix(hash_method())
+
+
+# =======================
+# Pool de verificación
+# =======================
+
+class HashPool:
+    def __init__(self, workers, max_pending):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_executor(self):
+        # Tras el fork de gunicorn los hilos del padre no existen en el hijo
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hash')
+            self._pid = os.getpid()
+            self.pending = 0
+        return self._executor
+
+    def submit(self, fn, *args):
+        with self._lock:
+            executor = self._ensure_executor()
+            if self.pending >= self.max_pending:
+                raise LoginError(BUSY)
+            self.pending += 1
+        future = executor.submit(fn, *args)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self._lock:
+            self.pending -= 1
+
+    def run(self, fn, *args):
+        return self.submit(fn, *args).result()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    config = current_app.config
+    workers, max_pending = config['PASSWORD_HASH_WORKERS'], config['PASSWORD_HASH_QUEUE']
+    with _pool_lock:
+        if _pool is None or (_pool.workers, _pool.max_pending) != (workers, max_pending):
+            _pool = HashPool(workers, max_pending)
+        return _pool
+
+
+def verify(pwhash, password):
+    """Comprueba ``password`` en el pool. Lanza LoginError(BUSY) si está saturado."""
+    if not pwhash:
+        return False
+    if current_app.config['PASSWORD_HASH_WORKERS'] <= 0:
+        return check_password_hash(pwhash, password)
+    return get_pool().run(check_password_hash, pwhash, password)
+
+
+def _rehash(flask_app, user_id, old_hash, password):
+    from models import User
+    import user_cache
+
+    with flask_app.app_context():
+        from app import db
+        try:
+            new_hash = hash_password(password)
+            # Condicional: si la contraseña cambió mientras tanto, no se pisa
+            result = db.session.execute(
+                User.__table__.update()
+                .where(User.__table__.c.id == user_id, User.__table__.c.password_hash == old_hash)
+                .values(password_hash=new_hash)
+            )
+            db.session.commit()
+            if result.rowcount:
+                user_cache.invalidate(user_id)
+        except Exception:
+            db.session.rollback()
+            logging.exception(f"Password rehash failed for user {user_id}")
+        finally:
+            db.session.remove()
+
+
+def schedule_rehash(user, password):
+    """Recalcula en segundo plano el hash de ``user`` si usa otro método."""
+    if not needs_rehash(user.password_hash):
+        return None
+    try:
+        return get_pool().submit(_rehash, current_app._get_current_object(), user.id, user.password_hash, password)
+    except LoginError:
+        # Pool saturado: se intentará en el próximo login
+        return None
+
+
+# =======================
+# Intentos fallidos
+# =======================
+
+class FailureTracker:
+    """
+    Fallos recientes por clave (usuario o IP) en una ventana deslizante.
+
+    Guarda como mucho ``max_keys`` claves. Nunca descarta una clave con
+    fallos dentro de la ventana: si no hay sitio tras barrer las caducadas,
+    rechaza las claves nuevas. Si no, miles de usuarios inventados
+    desalojarían el contador de una cuenta atacada y le darían intentos
+    ilimitados.
+    """
+
+    def __init__(self, window, max_keys=100000):
+        self.window = window
+        self.max_keys = max_keys
+        self._failures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _recent(self, key, now):
+        times = self._failures.get(key)
+        if times is None:
+            return None
+        while times and times[0] <= now - self.window:
+            times.pop(0)
+        if not times:
+            del self._failures[key]
+            return None
+        return times
+
+    def _sweep(self, now):
+        # Las claves van en orden de último intento: las caducadas están al principio
+        while self._failures:
+            key, times = next(iter(self._failures.items()))
+            if times and times[-1] > now - self.window:
+                break
+            del self._failures[key]
+
+    def count(self, key):
+        with self._lock:
+            times = self._recent(key, time.monotonic())
+            return len(times) if times else 0
+
+    def try_acquire(self, key, limit):
+        """
+        Anota un intento si ``key`` tiene menos de ``limit`` fallos recientes.
+
+        Devuelve la marca del intento (para release()) o None si hay que
+        rechazarlo. Comprobar y anotar bajo el mismo cerrojo impide que
+        varios intentos simultáneos pasen a la vez la comprobación. También
+        devuelve None para una clave nueva si la tabla está llena.
+        """
+        now = time.monotonic()
+        with self._lock:
+            times = self._recent(key, now)
+            if times is None:
+                if len(self._failures) >= self.max_keys:
+                    self._sweep(now)
+                    if len(self._failures) >= self.max_keys:
+                        return None
+                times = self._failures[key] = []
+            elif len(times) >= limit:
+                return None
+            times.append(now)
+            self._failures.move_to_end(key)
+        return now
+
+    def release(self, key, stamp):
+        """Retira un intento de try_acquire() que no ha resultado ser un fallo."""
+        with self._lock:
+            times = self._failures.get(key)
+            if times and stamp in times:
+                times.remove(stamp)
+                if not times:
+                    del self._failures[key]
+
+    def reset(self, key):
+        with self._lock:
+            self._failures.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._failures.clear()
+
+
+_tracker = None
+
+
+def get_tracker():
+    global _tracker
+    window = current_app.config['LOGIN_FAILURE_WINDOW']
+    with _pool_lock:
+        if _tracker is None or _tracker.window != window:
+            _tracker = FailureTracker(window)
+        return _tracker
+
+
+def _keys(username, remote_addr):
+    return f"user:{(username or '').lower()}", f"ip:{remote_addr}"
+
+
+def authenticate(username, password, remote_addr=None):
+    """
+    Devuelve el usuario si las credenciales son válidas.
+
+    Lanza LoginError con ``THROTTLED`` (demasiados fallos, sin calcular el
+    hash), ``BUSY`` (pool saturado) o ``INVALID``.
+    """
+    from models import User
+
+    config = current_app.config
+    tracker = get_tracker()
+    user_key, ip_key = _keys(username, remote_addr)
+    # El intento cuenta como fallo desde ahora; se retira si no lo es
+    user_stamp = tracker.try_acquire(user_key, config['LOGIN_MAX_FAILURES'])
+    if user_stamp is None:
+        raise LoginError(THROTTLED)
+    ip_stamp = None
+    if remote_addr and config['LOGIN_MAX_FAILURES_PER_IP']:
+        ip_stamp = tracker.try_acquire(ip_key, config['LOGIN_MAX_FAILURES_PER_IP'])
+        if ip_stamp is None:
+            tracker.release(user_key, user_stamp)
+            raise LoginError(THROTTLED)
+
+    try:
+        user = User.query.filter_by(username=username).first() if username else None
+        valid = user is not None and verify(user.password_hash, password or '')
+    except Exception:
+        # BUSY o error de la base de datos: no es un intento fallido
+        tracker.release(user_key, user_stamp)
+        if ip_stamp is not None:
+            tracker.release(ip_key, ip_stamp)
+        raise
+    if not valid:
+        raise LoginError(INVALID)
+
+    tracker.reset(user_key)
+    if ip_stamp is not None:
+        tracker.release(ip_key, ip_stamp)
+    schedule_rehash(user, password)
+    return user
@@ -0,0 +1,48 @@
+"""
+Contador de sentencias SQL para detectar consultas N+1.
+
+    with count_queries() as counter:
+        client.get('/admin/loans')
+    assert counter.count <= 4
+
+``assert_num_queries(n)`` hace lo mismo y falla con la lista de sentencias
+ejecutadas si el número no coincide.
+"""
+
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from app import db
+
+
+class QueryCounter:
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+
+@contextmanager
+def count_queries(engine=None):
+    engine = engine or db.engine
+    counter = QueryCounter()
+    event.listen(engine, 'before_cursor_execute', counter)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, 'before_cursor_execute', counter)
+
+
+@contextmanager
+def assert_num_queries(expected, engine=None):
+    with count_queries(engine) as counter:
+        yield counter
+    if counter.count != expected:
+        executed = '\n'.join(counter.statements)
+        raise AssertionError(f"Expected {expected} queries, got {counter.count}:\n{executed}")
@@ -18,12 +18,13 @@ from werkzeug.local import LocalProxy
 
 from app import app, db
 from models import OAuth, User
+import user_cache
 
 login_manager = LoginManager(app)
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(user_id)
+    return user_cache.load_user(user_id)
 
 class UserSessionStorage(BaseStorage):
     def get(self, blueprint):
@@ -93,9 +94,9 @@ def make_replit_blueprint():
 
     @replit_bp.before_app_request
     def set_applocal_session():
+        # Solo escribe la sesión la primera vez
         if '_browser_session_key' not in session:
             session['_browser_session_key'] = uuid.uuid4().hex
-        session.modified = True
         g.browser_session_key = session['_browser_session_key']
         g.flask_dance_replit = replit_bp.session
 
@@ -136,6 +137,7 @@ def save_user(user_claims):
     
     merged_user = db.session.merge(user)
     db.session.commit()
+    user_cache.invalidate(merged_user.id)
     return merged_user
 
 @oauth_authorized.connect
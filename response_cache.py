@@ -0,0 +1,150 @@
+"""
+Caché de respuestas y GET condicional para las páginas del catálogo.
+
+book_details, book_search y student_dashboard volvían a consultar y
+renderizar el mismo HTML en cada visita, aunque los libros cambian poco.
+Con ``@cached_page`` cada respuesta lleva un ETag que depende de:
+
+- la ruta y sus parámetros (libro, búsqueda, categoría, cursor...);
+- el usuario y su rol, porque la página muestra sus préstamos y su menú;
+- el día (UTC), porque los días restantes de un préstamo cambian solos;
+- el estado del catálogo: los valores y la última modificación de las filas
+  de ``stat_counters`` que cambian con cada escritura relevante. Son
+  ``catalog_version`` (alta, edición, borrado e importación de libros), los
+  contadores de préstamos (préstamos y devoluciones, que cambian las copias
+  disponibles) y ``overdue_loans`` (el planificador de vencidos).
+
+Leer ese estado es una sola consulta por clave primaria. upgrade-db crea
+esas filas (stats.seed_counters()). Si falta alguna, la página se sirve sin
+caché ni ETag: la petición no recalcula los contadores. Si el navegador
+envía ``If-None-Match`` con el ETag vigente, se responde 304 sin ejecutar la
+vista. Si no, el HTML se sirve desde un LRU en memoria acotado por tamaño
+(RESPONSE_CACHE_MAX_BYTES). En ambos casos no hay consultas del catálogo ni
+plantillas.
+
+Las peticiones con mensajes flash pendientes no usan la caché, porque esos
+mensajes solo deben mostrarse una vez. Se desactiva con RESPONSE_CACHE=off.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import current_app, make_response, request, session
+from flask.globals import request_ctx
+from flask_login import current_user
+
+from app import app, db
+from models import StatCounter
+from stats import CATALOG_VERSION
+
+# Filas de stat_counters que cambian cuando cambia algo visible en el catálogo
+STATE_COUNTERS = (CATALOG_VERSION, 'total_books', 'total_loans', 'active_loans', 'overdue_loans')
+
+CACHE_CONTROL = 'private, no-cache'
+
+
+class SizedLRUCache:
+    """LRU que desaloja las entradas menos usadas cuando se supera ``max_bytes``."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key, body, mimetype):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous[0])
+            self._entries[key] = (body, mimetype)
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+def catalog_state():
+    """``(token, última modificación)`` del estado visible del catálogo, o ``(None, None)`` si no se puede cachear."""
+    rows = db.session.query(StatCounter.name, StatCounter.value, StatCounter.updated_at).filter(
+        StatCounter.name.in_(STATE_COUNTERS)
+    ).order_by(StatCounter.name).all()
+    if not set(STATE_COUNTERS) - {CATALOG_VERSION} <= {name for name, _, _ in rows}:
+        # Base sin upgrade-db: sin los contadores el ETag no cambiaría con los préstamos
+        return None, None
+    token = ';'.join(f"{name}={value}@{updated_at.isoformat() if updated_at else ''}"
+                     for name, value, updated_at in rows)
+    modified = [updated_at for _, _, updated_at in rows if updated_at]
+    last_modified = max(modified).replace(tzinfo=timezone.utc) if modified else None
+    return token, last_modified
+
+
+def page_etag(state_token):
+    user = f"{current_user.id}:{current_user.role}" if current_user.is_authenticated else 'anonymous'
+    args = sorted(request.args.items(multi=True))
+    key = f"{request.path}|{args}|{user}|{datetime.utcnow().date()}|{state_token}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def _conditional_headers(response, etag, last_modified):
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = CACHE_CONTROL
+    return response
+
+
+cache = SizedLRUCache(app.config['RESPONSE_CACHE_MAX_BYTES'])
+
+
+def cached_page(view):
+    """Sirve la vista con ETag, 304 y caché de HTML en memoria."""
+
+    @wraps(view)
+    def decorated_function(*args, **kwargs):
+        if current_app.config['RESPONSE_CACHE'] != 'on' or request.method != 'GET' or session.get('_flashes'):
+            return view(*args, **kwargs)
+
+        state_token, last_modified = catalog_state()
+        if state_token is None:
+            return view(*args, **kwargs)
+        etag = page_etag(state_token)
+
+        if request.if_none_match.contains(etag):
+            return _conditional_headers(make_response('', 304), etag, last_modified)
+
+        entry = cache.get(etag)
+        if entry is not None:
+            body, mimetype = entry
+            return _conditional_headers(make_response(body, 200, {'Content-Type': mimetype}), etag, last_modified)
+
+        response = make_response(view(*args, **kwargs))
+        # Una página que ha mostrado mensajes flash de esta petición no se reutiliza
+        if response.status_code == 200 and not response.is_streamed and not request_ctx.flashes:
+            cache.set(etag, response.get_data(), response.content_type)
+            _conditional_headers(response, etag, last_modified)
+        return response
+
+    return decorated_function
@@ -1,11 +1,31 @@
-from datetime import datetime, timedelta
-from flask import session, render_template, request, redirect, url_for, flash
+from datetime import datetime
+import hmac
+import io
+from flask import render_template, request, redirect, url_for, flash, abort, Response, stream_with_context
 from flask_login import login_user, logout_user, login_required, current_user, LoginManager
-from sqlalchemy import or_
 from functools import wraps
+from sqlalchemy.orm import joinedload
 from create_users import User  # cambia esto según tu archivo real
 from app import app, db
-from models import Book, Loan, User, ActionLog
+from models import OUTSTANDING_STATUSES, Book, Loan, User, ActionLog
+from search import search_books, search_rank
+from pagination import keyset_paginate, render_listing, page_url
+from loading import loan_options
+from stats import get_counters
+import loan_service
+from loan_service import LoanError
+import passwords
+from passwords import LoginError
+import audit
+import audit_retention  # noqa: F401
+import user_cache
+import facets
+import catalog_io
+import instrumentation
+import overdue
+import loan_archive
+from response_cache import cached_page
+import api  # noqa: F401
 
 
 # Initialize Flask-Login
@@ -14,9 +34,14 @@ login_manager.init_app(app)
 login_manager.login_view = 'login'
 login_manager.login_message = 'Please log in to access this page.'
 
+app.add_template_global(page_url)
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return user_cache.load_user(user_id)
+
+# Código HTTP de cada rechazo del login
+LOGIN_ERROR_STATUS = {passwords.INVALID: 200, passwords.THROTTLED: 429, passwords.BUSY: 503}
 
 def require_admin(f):
     @wraps(f)
@@ -27,11 +52,6 @@ def require_admin(f):
         return f(*args, **kwargs)
     return decorated_function
 
-# Make session permanent
-@app.before_request
-def make_session_permanent():
-    session.permanent = True
-
 @app.route('/')
 def index():
     if current_user.is_authenticated:
@@ -49,15 +69,17 @@ def login():
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
-        user = User.query.filter_by(username=username).first()
         
-        if user and user.check_password(password):
-            login_user(user, remember=bool(request.form.get('remember')))
-            next_page = request.args.get('next')
-            flash(f'Bienvenido, {user.full_name}!', 'success')
-            return redirect(next_page) if next_page else redirect(url_for('index'))
-        else:
-            flash('Usuario o contraseña incorrectos.', 'error')
+        try:
+            user = passwords.authenticate(username, password, request.remote_addr)
+        except LoginError as e:
+            flash(e.message, 'error')
+            return render_template('login.html'), LOGIN_ERROR_STATUS[e.reason]
+        
+        login_user(user, remember=bool(request.form.get('remember')))
+        next_page = request.args.get('next')
+        flash(f'Bienvenido, {user.full_name}!', 'success')
+        return redirect(next_page) if next_page else redirect(url_for('index'))
     
     return render_template('login.html')
 
@@ -70,12 +92,15 @@ def logout():
 
 @app.route('/student/dashboard')
 @login_required
+@cached_page
 def student_dashboard():
     if current_user.is_admin:
         return redirect(url_for('admin_dashboard'))
     
     # Get user's active loans
-    active_loans = Loan.query.filter_by(user_id=current_user.id, status='active').all()
+    active_loans = Loan.query.options(*loan_options('student_dashboard')).filter(
+        Loan.user_id == current_user.id, Loan.status.in_(OUTSTANDING_STATUSES)
+    ).all()
     
     # Get recently added books
     recent_books = Book.query.order_by(Book.created_at.desc()).limit(5).all()
@@ -86,46 +111,54 @@ def student_dashboard():
 
 @app.route('/books/search')
 @login_required
+@cached_page
 def book_search():
     search_query = request.args.get('q', '')
     category = request.args.get('category', '')
     
     query = Book.query
+    keys = [Book.title, Book.id]
     
     if search_query:
-        query = query.filter(
-            or_(
-                Book.title.ilike(f'%{search_query}%'),
-                Book.author.ilike(f'%{search_query}%'),
-                Book.isbn.ilike(f'%{search_query}%')
-            )
-        )
+        query = search_books(query, search_query, ranked=False)
+        rank = search_rank(search_query)
+        if rank is not None:
+            keys = [rank, Book.id]
+    
+    # Facet counts: whole catalog from cache, or within the current search results
+    category_facets = facets.category_facets()
+    if search_query:
+        category_counts = facets.result_facets(query)
+    else:
+        category_counts = {facet.name: facet.books for facet in category_facets}
     
     if category:
         query = query.filter(Book.category == category)
     
-    books = query.all()
-    categories = db.session.query(Book.category).distinct().all()
-    categories = [cat[0] for cat in categories if cat[0]]
+    page = keyset_paginate(query, keys, request.args.get('cursor'))
     
     return render_template('book_search.html', 
-                         books=books, 
-                         categories=categories,
+                         books=page.items, 
+                         page=page,
+                         categories=[facet.name for facet in category_facets],
+                         category_facets=category_facets,
+                         category_counts=category_counts,
                          search_query=search_query,
                          selected_category=category)
 
 @app.route('/books/<int:book_id>')
 @login_required
+@cached_page
 def book_details(book_id):
     book = Book.query.get_or_404(book_id)
     
     # Check if user already has this book on loan
     user_loan = None
     if not current_user.is_admin:
-        user_loan = Loan.query.filter_by(
-            user_id=current_user.id,
-            book_id=book_id,
-            status='active'
+        user_loan = Loan.query.filter(
+            Loan.user_id == current_user.id,
+            Loan.book_id == book_id,
+            Loan.status.in_(OUTSTANDING_STATUSES)
         ).first()
     
     return render_template('book_details.html', book=book, user_loan=user_loan)
@@ -137,78 +170,35 @@ def loan_book(book_id):
         flash('Administrators cannot loan books.', 'warning')
         return redirect(url_for('book_details', book_id=book_id))
     
-    book = Book.query.get_or_404(book_id)
-    
-    if not book.is_available:
-        flash('This book is not available for loan.', 'error')
+    try:
+        loan_service.checkout_book(current_user.id, book_id)
+    except LoanError as e:
+        if e.reason == loan_service.BOOK_NOT_FOUND:
+            abort(404)
+        flash(e.message, 'error')
         return redirect(url_for('book_details', book_id=book_id))
 
-    existing_loan = Loan.query.filter_by(
-        user_id=current_user.id,
-        book_id=book_id,
-        status='active'
-    ).first()
-
-    if existing_loan:
-        flash('You already have this book on loan.', 'error')
-        return redirect(url_for('book_details', book_id=book_id))
-
-    # Crear el préstamo
-    loan = Loan(
-        user_id=current_user.id,
-        book_id=book.id,
-        loan_date=datetime.utcnow(),
-        due_date=datetime.utcnow() + timedelta(days=14)
-    )
-
-    book.available_copies -= 1
-
-    db.session.add(loan)
-    db.session.commit()
-
     flash('Préstamo realizado exitosamente.', 'success')
     return redirect(url_for('my_loans'))
 
-    
-   
-    
-    # Acción para crear préstamo
+# Acción para crear préstamo
 @app.route('/create-loan', methods=['POST'])
 @login_required
 def create_loan():
-    book_id = request.form.get('book_id')
-    book = Book.query.get(book_id)
+    book_id = request.form.get('book_id', type=int)
 
-    if not book:
+    if book_id is None:
         flash('El libro no fue encontrado.', 'danger')
         return redirect(url_for('my_loans'))
 
-    if book.available_copies < 1:
-        flash('Este libro no está disponible actualmente.', 'danger')
+    try:
+        loan_service.checkout_book(current_user.id, book_id)
+    except LoanError as e:
+        flash(e.message, 'danger')
         return redirect(url_for('my_loans'))
 
-    # Crear préstamo y actualizar disponibilidad
-    loan = Loan(
-        user_id=current_user.id,
-        book_id=book.id,
-        loan_date=datetime.utcnow(),
-        due_date=datetime.utcnow() + timedelta(days=14)
-    )
-    book.available_copies -= 1
-
-    db.session.add(loan)
-    db.session.commit()
-
     flash('Préstamo realizado exitosamente.', 'success')
     return redirect(url_for('my_loans'))
-    # Update available copies
-    book.available_copies -= 1
-    
-    db.session.add(loan)
-    db.session.commit()
-    
-    flash('Book loaned successfully!', 'success')
-    return redirect(url_for('my_loans'))
 
 @app.route('/loans/my')
 @login_required
@@ -216,8 +206,9 @@ def my_loans():
     if current_user.is_admin:
         return redirect(url_for('admin_dashboard'))
     
-    active_loans = Loan.query.filter_by(user_id=current_user.id, status='active').all()
-    returned_loans = Loan.query.filter_by(user_id=current_user.id, status='returned').order_by(Loan.return_date.desc()).limit(10).all()
+    query = Loan.query.options(*loan_options('my_loans'))
+    active_loans = query.filter(Loan.user_id == current_user.id, Loan.status.in_(OUTSTANDING_STATUSES)).all()
+    returned_loans = loan_archive.recent_returns(current_user.id, 10, 'my_loans')
     
     return render_template('my_loans.html', 
                          active_loans=active_loans,
@@ -226,24 +217,17 @@ def my_loans():
 @app.route('/loans/<int:loan_id>/return', methods=['POST'])
 @login_required
 def return_book(loan_id):
-    loan = Loan.query.get_or_404(loan_id)
-    
-    # Check permissions
-    if not current_user.is_admin and loan.user_id != current_user.id:
-        flash('You can only return your own books.', 'error')
-        return redirect(url_for('my_loans'))
-    
-    if loan.status != 'active':
-        flash('This book has already been returned.', 'error')
+    # Students can only return their own books
+    owner_id = None if current_user.is_admin else current_user.id
+    
+    try:
+        loan_service.return_book(loan_id, user_id=owner_id)
+    except LoanError as e:
+        if e.reason == loan_service.LOAN_NOT_FOUND:
+            abort(404)
+        flash(e.message, 'error')
         return redirect(url_for('my_loans'))
     
-    # Return the book
-    loan.status = 'returned'
-    loan.return_date = datetime.now()
-    loan.book.available_copies += 1
-    
-    db.session.commit()
-    
     flash('Book returned successfully!', 'success')
     
     if current_user.is_admin:
@@ -259,16 +243,10 @@ def manage_books():
     
     query = Book.query
     if search_query:
-        query = query.filter(
-            or_(
-                Book.title.ilike(f'%{search_query}%'),
-                Book.author.ilike(f'%{search_query}%'),
-                Book.isbn.ilike(f'%{search_query}%')
-            )
-        )
+        query = search_books(query, search_query, ranked=False)
     
-    books = query.order_by(Book.title).all()
-    return render_template('manage_books.html', books=books, search_query=search_query)
+    return render_listing('manage_books.html', 'books', query, [Book.title, Book.id],
+                          search_query=search_query)
 
 @app.route('/admin/books/add', methods=['GET', 'POST'])
 @require_admin
@@ -287,6 +265,7 @@ def add_book():
         
         db.session.add(book)
         db.session.commit()
+        facets.invalidate()
 
         log_action(current_user, f"Agregó el libro '{book.title}'")
         flash('Book added successfully!', 'success')
@@ -315,6 +294,7 @@ def edit_book(book_id):
         book.available_copies = max(0, book.available_copies + difference)
         
         db.session.commit()
+        facets.invalidate()
 
         log_action(current_user, f"Editó el libro '{book.title}'")
         flash('Book updated successfully!', 'success')
@@ -328,35 +308,90 @@ def delete_book(book_id):
     book = Book.query.get_or_404(book_id)
     
     # Check if book has active loans
-    active_loans = Loan.query.filter_by(book_id=book_id, status='active').count()
+    active_loans = Loan.query.filter(Loan.book_id == book_id, Loan.status.in_(OUTSTANDING_STATUSES)).count()
     if active_loans > 0:
         flash('Cannot delete book with active loans.', 'error')
         return redirect(url_for('manage_books'))
     
     db.session.delete(book)
     db.session.commit()
+    facets.invalidate()
     
     log_action(current_user, f"Eliminó el libro '{book.title}'")
     flash('Book deleted successfully!', 'success')
     return redirect(url_for('manage_books'))
 
+@app.route('/admin/books/import', methods=['GET', 'POST'])
+@require_admin
+def import_books():
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('Selecciona un fichero para importar.', 'error')
+            return redirect(url_for('import_books'))
+        
+        fmt = request.form.get('format') or catalog_io.detect_format(upload.filename)
+        if fmt not in catalog_io.FORMATS:
+            flash('Formato de fichero no soportado.', 'error')
+            return redirect(url_for('import_books'))
+        
+        stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+        stats = catalog_io.import_books(stream, fmt)
+        
+        log_action(current_user, f"Importó el catálogo '{upload.filename}': {stats}")
+        flash(f'Importación completada: {stats}.', 'success')
+        for error in stats.errors[:10]:
+            flash(error, 'warning')
+        return redirect(url_for('manage_books'))
+    
+    return render_template('import_books.html', formats=catalog_io.FORMATS)
+
+@app.route('/admin/books/export')
+@require_admin
+def export_books():
+    fmt = request.args.get('format', 'csv')
+    if fmt not in catalog_io.FORMATS:
+        abort(400)
+    
+    filename = f"catalogo-{datetime.now():%Y%m%d}.{fmt}"
+    return Response(
+        stream_with_context(catalog_io.export_books(fmt)),
+        mimetype='text/csv' if fmt == 'csv' else 'text/plain',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
 @app.route('/admin/loans')
 @require_admin
 def manage_loans():
     status_filter = request.args.get('status', 'all')
     
-    query = Loan.query
-    if status_filter != 'all':
-        if status_filter == 'overdue':
-            query = query.filter(
-                Loan.status == 'active',
-                Loan.due_date < datetime.now()
-            )
-        else:
-            query = query.filter(Loan.status == status_filter)
-    
-    loans = query.order_by(Loan.created_at.desc()).all()
-    return render_template('manage_loans.html', loans=loans, status_filter=status_filter)
+    query = Loan.query.options(*loan_options('manage_loans'))
+    if status_filter == 'active':
+        # Sin devolver, estén o no vencidos
+        query = query.filter(Loan.status.in_(OUTSTANDING_STATUSES))
+    elif status_filter != 'all':
+        query = query.filter(Loan.status == status_filter)
+    
+    # El historial antiguo está en loans_archive; se intercala en el mismo orden
+    union = ()
+    if status_filter in ('all', 'returned'):
+        union = [loan_archive.archived_history('manage_loans')]
+
+    summary = None
+    if status_filter == 'all' and not request.args.get('cursor'):
+        summary = loan_summary()
+
+    return render_listing('manage_loans.html', 'loans', query, [Loan.created_at, Loan.id],
+                          descending=True, union=union, status_filter=status_filter, summary=summary)
+
+def loan_summary():
+    counters = get_counters()
+    return {
+        'active': counters['active_loans'],
+        'overdue': counters['overdue_loans'],
+        'returned': counters['total_loans'] - counters['active_loans'],
+        'total': counters['total_loans'],
+    }
 
 @app.route('/admin/users/<int:user_id>/toggle-role', methods=['POST'])
 @require_admin
@@ -380,14 +415,14 @@ def toggle_user_role(user_id):
         flash(f'{user.full_name} ahora es un administrador.', 'success')
 
     db.session.commit()
+    user_cache.invalidate(user.id)
     return redirect(url_for('manage_users'))
 
 
 @app.route('/admin/users')
 @require_admin
 def manage_users():
-    users = User.query.all()
-    return render_template('manage_users.html', users=users)
+    return render_listing('manage_users.html', 'users', User.query, [User.id])
 
 
 @app.route('/admin/users/delete/<int:user_id>', methods=['POST'])
@@ -396,6 +431,7 @@ def delete_user(user_id):
     user = User.query.get_or_404(user_id)
     db.session.delete(user)
     db.session.commit()
+    user_cache.invalidate(user_id)
     log_action(current_user, f"Eliminó al usuario '{user.full_name}'")
     flash('Usuario eliminado correctamente.', 'success')
     return redirect(url_for('manage_users'))
@@ -426,6 +462,7 @@ def add_user():
 
         db.session.add(user)
         db.session.commit()
+        user_cache.invalidate(user.id)
 
         log_action(current_user, f"Agregó al usuario '{user.full_name}'")
         flash('Usuario agregado exitosamente.', 'success')
@@ -434,64 +471,57 @@ def add_user():
     return render_template('add_user.html')
 
 def log_action(user, description):
-    from models import ActionLog
-    log = ActionLog(user_id=user.id if user else None, action=description)
-    db.session.add(log)
-    db.session.commit()
-
-from models import ActionLog
+    audit.record(user.id if user else None, description)
 
 @app.route('/admin/dashboard')
 @require_admin
 def admin_dashboard():
-    total_books = Book.query.count()
-    total_users = User.query.count()
-    active_loans = Loan.query.filter_by(status='active').count()
-    overdue_loans = Loan.query.filter(
-        Loan.status == 'active',
-        Loan.due_date < datetime.now()
-    ).count()
-    recent_logs = ActionLog.query.order_by(ActionLog.timestamp.desc()).limit(5).all()
+    counters = get_counters()
+    # Recorre 5 entradas de ix_action_logs_timestamp, y el autor en el mismo SELECT
+    recent_logs = ActionLog.query.options(joinedload(ActionLog.user)).order_by(ActionLog.timestamp.desc()).limit(5).all()
 
     return render_template(
         'admin_dashboard.html',
-        total_books=total_books,
-        total_users=total_users,
-        active_loans=active_loans,
-        overdue_loans=overdue_loans,
+        total_books=counters['total_books'],
+        total_users=counters['total_users'],
+        active_loans=counters['active_loans'],
+        overdue_loans=counters['overdue_loans'],
         recent_logs=recent_logs
     )
 
+@app.route('/admin/metrics')
+def metrics():
+    # Prometheus scrapes with a bearer token; admins can open it from the browser
+    token = app.config['METRICS_TOKEN']
+    authorization = request.headers.get('Authorization', '')
+    has_token = token and hmac.compare_digest(authorization, f'Bearer {token}')
+    if not has_token and not (current_user.is_authenticated and current_user.is_admin):
+        abort(403)
+    
+    return Response(instrumentation.render_prometheus(instrumentation.metrics, user_cache.prometheus_counters()),
+                    mimetype='text/plain; version=0.0.4')
+
 @app.route('/admin/loans/add', methods=['GET', 'POST'])
 @require_admin
 def admin_add_loan():
-    users = User.query.filter_by(role='student').all()
-    books = Book.query.filter(Book.available_copies > 0).all()
-
+    # Usuarios y libros se buscan desde el formulario con /api/lookup
     if request.method == 'POST':
-        user_id = request.form.get('user_id')
-        book_id = request.form.get('book_id')
-
-        user = User.query.get(user_id)
-        book = Book.query.get(book_id)
+        user_id = request.form.get('user_id', type=int)
+        book_id = request.form.get('book_id', type=int)
 
-        if not user or not book:
+        if user_id is None or book_id is None:
             flash("Usuario o libro no válido.", 'error')
             return redirect(url_for('admin_add_loan'))
 
-        loan = Loan(
-            user_id=user.id,
-            book_id=book.id,
-            loan_date=datetime.utcnow(),
-            due_date=datetime.utcnow() + timedelta(days=14)
-        )
-        book.available_copies -= 1
-        db.session.add(loan)
-        db.session.commit()
+        try:
+            result = loan_service.checkout_book(user_id, book_id)
+        except LoanError as e:
+            flash(e.message, 'error')
+            return redirect(url_for('admin_add_loan'))
 
-        log_action(current_user, f"Agregó un préstamo para el usuario '{user.full_name}' y el libro '{book.title}'")
+        log_action(current_user, f"Agregó un préstamo para el usuario '{result.user.full_name}' y el libro '{result.book.title}'")
         flash("Préstamo creado exitosamente.", 'success')
         return redirect(url_for('manage_loans'))
 
-    return render_template('admin_add_loan.html', users=users, books=books)
+    return render_template('admin_add_loan.html')
 
@@ -0,0 +1,116 @@
+"""
+Tareas periódicas en los procesos web.
+
+IntervalScheduler ejecuta una tarea cada ``interval`` segundos en un hilo
+del worker. Lo usan el planificador de vencidos (overdue.py), el archivado de
+préstamos (loan_archive.py) y la retención del historial
+(audit_retention.py).
+
+Con varios workers de gunicorn, cada tarea reclama antes su pasada con
+claim_run(). Es un UPDATE condicional sobre una fila de ``stat_counters`` con
+la hora (epoch) de la última pasada, así que en cada intervalo solo trabaja
+un proceso.
+
+Si la base de datos aún no tiene el esquema (falta ``flask --app main
+upgrade-db``), el hilo lo avisa una vez en el log y no hace nada hasta que
+exista ``stat_counters``.
+"""
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import inspect
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from models import StatCounter
+
+counter_table = StatCounter.__table__
+
+
+def claim_run(interval, name):
+    """
+    Reclama la pasada de este intervalo para el proceso actual.
+
+    Devuelve False si otro proceso ya la hizo hace menos de ``interval``
+    segundos. ``name`` es la fila de stat_counters de cada tarea periódica.
+    """
+    now = int(time.time())
+    # Un segundo de margen para que el propio hilo no se salte pasadas por desfase del sleep
+    result = db.session.execute(
+        counter_table.update()
+        .where(counter_table.c.name == name, counter_table.c.value <= now - interval + 1)
+        .values(value=now, updated_at=datetime.utcnow())
+    )
+    if result.rowcount == 1:
+        db.session.commit()
+        return True
+
+    if db.session.get(StatCounter, name) is not None:
+        db.session.rollback()
+        return False
+    try:
+        db.session.add(StatCounter(name=name, value=now))
+        db.session.commit()
+        return True
+    except IntegrityError:
+        db.session.rollback()
+        return False
+
+
+class IntervalScheduler:
+    """Hilo que ejecuta ``task(interval)`` cada ``interval`` segundos."""
+
+    def __init__(self, flask_app, interval, task, name):
+        self.app = flask_app
+        self.interval = interval
+        self.task = task
+        self.name = name
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._schema_ready = False
+        self._schema_warned = False
+
+    def schema_ready(self):
+        """True si existe ``stat_counters``; si no, lo avisa una sola vez."""
+        if not self._schema_ready:
+            self._schema_ready = inspect(db.engine).has_table(counter_table.name)
+            if not self._schema_ready and not self._schema_warned:
+                self._schema_warned = True
+                logging.warning(f"Scheduled task {self.name} skipped: table {counter_table.name} does not exist, "
+                                f"run 'flask --app main upgrade-db'")
+        return self._schema_ready
+
+    def ensure_started(self):
+        # Tras el fork de gunicorn el hilo del proceso padre no existe en el hijo
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def run(self):
+        while True:
+            with self.app.app_context():
+                try:
+                    if self.schema_ready():
+                        self.task(self.interval)
+                except Exception:
+                    db.session.rollback()
+                    logging.exception(f"Scheduled task {self.name} failed")
+                finally:
+                    db.session.remove()
+            if self._stopping.wait(self.interval):
+                return
+
+    def stop(self):
+        self._stopping.set()
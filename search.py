@@ -0,0 +1,213 @@
+"""
+Búsqueda de texto completo sobre el catálogo de libros.
+
+En SQLite se usa una tabla virtual FTS5 (``books_fts``) con contenido externo
+sobre ``books``, sincronizada por triggers. En PostgreSQL se usa un índice GIN
+sobre una expresión ``tsvector``. Ambos ignoran acentos, de modo que "Garcia"
+encuentra "García". Cualquier otro motor usa el ILIKE de siempre.
+"""
+
+import logging
+import re
+
+from sqlalchemy import event, literal_column, or_, table, column, text
+from sqlalchemy.exc import DBAPIError
+
+from app import db
+from models import Book
+
+FTS_TABLE = 'books_fts'
+
+# Columnas de ``books`` indexadas para búsqueda
+SEARCH_COLUMNS = ('title', 'author', 'isbn')
+
+_SQLITE_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, author, isbn,
+        content='books', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS books_fts_ai AFTER INSERT ON books BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, author, isbn)
+        VALUES (new.id, new.title, new.author, new.isbn);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS books_fts_ad AFTER DELETE ON books BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author, isbn)
+        VALUES ('delete', old.id, old.title, old.author, old.isbn);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS books_fts_au AFTER UPDATE OF title, author, isbn ON books BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author, isbn)
+        VALUES ('delete', old.id, old.title, old.author, old.isbn);
+        INSERT INTO {FTS_TABLE}(rowid, title, author, isbn)
+        VALUES (new.id, new.title, new.author, new.isbn);
+    END""",
+]
+
+# La expresión debe ser idéntica en el índice y en la consulta para que
+# PostgreSQL use el índice GIN.
+_PG_DOCUMENT = (
+    "to_tsvector('simple', books_unaccent("
+    "coalesce(title, '') || ' ' || coalesce(author, '') || ' ' || coalesce(isbn, '')))"
+)
+
+_PG_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    # unaccent() no es IMMUTABLE, así que no puede usarse directamente en un índice
+    """CREATE OR REPLACE FUNCTION books_unaccent(text) RETURNS text AS
+        $$ SELECT public.unaccent('public.unaccent', $1) $$
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT""",
+    f"CREATE INDEX IF NOT EXISTS ix_books_search ON books USING gin ({_PG_DOCUMENT})",
+]
+
+# Única instancia: SQLAlchemy trata cada table() como un FROM distinto
+books_fts = table(FTS_TABLE, column('rowid'), column('rank'), column(FTS_TABLE))
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Motor de búsqueda instalado o detectado; None = aún sin comprobar
+_backend = None
+
+
+def tokenize(search_query):
+    """Divide la búsqueda en términos alfanuméricos (sin sintaxis FTS)."""
+    return _TOKEN_RE.findall(search_query or '')
+
+
+# Motor por dialecto y objeto de la base de datos que indica que está instalado
+_DIALECT_BACKENDS = {
+    'sqlite': ('fts5', "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name", FTS_TABLE),
+    'postgresql': ('tsvector', "SELECT 1 FROM pg_proc WHERE proname = :name", 'books_unaccent'),
+}
+
+
+def _installed_backend(dialect_name):
+    """Comprueba qué dejó instalado ``upgrade-db``: una consulta por proceso, en la primera búsqueda."""
+    if dialect_name not in _DIALECT_BACKENDS:
+        return 'like'
+    backend, check, name = _DIALECT_BACKENDS[dialect_name]
+    try:
+        with db.engine.connect() as connection:
+            installed = connection.execute(text(check), {'name': name}).first() is not None
+    except DBAPIError:
+        installed = False
+    return backend if installed else 'like'
+
+
+def backend_for(dialect_name):
+    global _backend
+    if _backend is None:
+        _backend = _installed_backend(dialect_name)
+    return _backend
+
+
+def install_search_index(connection):
+    """Crea el índice de búsqueda si no existe y lo llena con los libros actuales."""
+    global _backend
+    dialect = connection.dialect.name
+
+    try:
+        if dialect == 'sqlite':
+            exists = connection.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                {'name': FTS_TABLE}
+            ).first()
+            for statement in _SQLITE_DDL:
+                connection.exec_driver_sql(statement)
+            if not exists:
+                connection.exec_driver_sql(
+                    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+                )
+        elif dialect == 'postgresql':
+            for statement in _PG_DDL:
+                connection.exec_driver_sql(statement)
+    except DBAPIError as e:
+        logging.warning(f"Full-text search unavailable, falling back to ILIKE: {e}")
+        _backend = 'like'
+        return
+
+    _backend = _DIALECT_BACKENDS[dialect][0] if dialect in _DIALECT_BACKENDS else 'like'
+
+
+def drop_search_index(connection):
+    if connection.dialect.name == 'sqlite':
+        connection.exec_driver_sql(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def rebuild_search_index():
+    """Reconstruye el índice FTS5 desde cero (p.ej. tras una carga masiva)."""
+    with db.engine.begin() as connection:
+        if connection.dialect.name == 'sqlite' and backend_for('sqlite') == 'fts5':
+            connection.exec_driver_sql(
+                f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+            )
+
+
+def ensure_search_index():
+    """Instala el índice en bases de datos creadas antes de existir la búsqueda."""
+    with db.engine.begin() as connection:
+        install_search_index(connection)
+
+
+# Mantener el índice en create_all()/drop_all(), incluido create_users.py
+event.listen(Book.__table__, 'after_create', lambda target, connection, **kw: install_search_index(connection))
+event.listen(Book.__table__, 'before_drop', lambda target, connection, **kw: drop_search_index(connection))
+
+
+def _like_filter(query, search_query):
+    return query.filter(
+        or_(
+            Book.title.ilike(f'%{search_query}%'),
+            Book.author.ilike(f'%{search_query}%'),
+            Book.isbn.ilike(f'%{search_query}%')
+        )
+    )
+
+
+def _pg_tsquery(terms):
+    return db.func.to_tsquery(
+        'simple',
+        db.func.books_unaccent(' & '.join(f'{term}:*' for term in terms))
+    )
+
+
+def search_rank(search_query):
+    """
+    Expresión de relevancia (menor = más relevante) para ordenar o paginar
+    resultados de search_books(), o None si el motor no calcula relevancia.
+    """
+    terms = tokenize(search_query)
+    backend = backend_for(db.engine.dialect.name)
+
+    if not terms or backend == 'like':
+        return None
+    if backend == 'fts5':
+        # rank es bm25(): valores más bajos = más relevantes
+        return books_fts.c.rank
+    return -db.func.ts_rank(literal_column(_PG_DOCUMENT), _pg_tsquery(terms))
+
+
+def search_books(query, search_query, ranked=True):
+    """
+    Filtra ``query`` (sobre Book) por ``search_query``.
+
+    Cada término se busca como prefijo y todos deben aparecer. Con
+    ``ranked=True`` los resultados se ordenan por relevancia; si no, el
+    llamador decide el orden (p.ej. con search_rank()).
+    """
+    terms = tokenize(search_query)
+    backend = backend_for(db.engine.dialect.name)
+
+    if not terms or backend == 'like':
+        return _like_filter(query, search_query)
+
+    if backend == 'fts5':
+        match = ' '.join('"{}"*'.format(term) for term in terms)
+        query = query.join(books_fts, books_fts.c.rowid == Book.id).filter(
+            books_fts.c[FTS_TABLE].op('MATCH')(match)
+        )
+    else:
+        query = query.filter(literal_column(_PG_DOCUMENT).op('@@')(_pg_tsquery(terms)))
+
+    if ranked:
+        query = query.order_by(search_rank(search_query))
+    return query
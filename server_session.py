@@ -0,0 +1,374 @@
+"""
+Sesiones en el servidor.
+
+La sesión por defecto de Flask viaja entera en una cookie firmada. Con
+``session.permanent = True`` en cada petición (y ``session.modified = True``
+en replit_auth), cada respuesta volvía a firmar y enviar la cookie. Aquí la
+cookie solo lleva un identificador aleatorio y los datos se guardan en un
+almacén (SESSION_BACKEND):
+
+- ``sqlite``: fichero SQLite compartido por los workers de la máquina
+  (SESSION_PATH, por defecto ``instance/sessions.db``).
+- ``filesystem``: un fichero por sesión en el directorio SESSION_PATH.
+- ``redis``: servidor Redis en SESSION_REDIS_URL (requiere el paquete ``redis``).
+- ``memory``: diccionario en el proceso con la misma semántica de caducidad
+  que Redis; sustituto local para desarrollo, no se comparte entre workers.
+- ``cookie``: la sesión firmada de Flask, como antes.
+
+La sesión solo se escribe, y la cookie solo se envía, cuando:
+
+- los datos cambian;
+- la sesión es nueva;
+- le queda menos de la mitad de PERMANENT_SESSION_LIFETIME. Así la
+  caducidad es deslizante sin escribir en cada petición.
+
+Las sesiones vacías no se guardan. Al cambiar el usuario identificado
+(login/logout) se emite un identificador nuevo, para evitar la fijación de
+sesión.
+
+Crear el almacén no toca el disco: el fichero SQLite, su tabla y el
+directorio de sesiones se crean en el primer uso, no al importar la
+aplicación.
+
+Las sesiones caducadas se borran en lotes de SESSION_GC_BATCH, como mucho
+una vez cada SESSION_GC_INTERVAL segundos por proceso, o a mano con
+``flask --app main gc-sessions``.
+"""
+
+import json
+import os
+import re
+import secrets
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+from flask.sessions import SessionInterface, SessionMixin, session_json_serializer
+from werkzeug.datastructures import CallbackDict
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+_SID_RE = re.compile(r'^[A-Za-z0-9_-]{32,64}$')
+
+
+def new_sid():
+    return secrets.token_urlsafe(32)
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, expires_at=None, had_cookie=False):
+        def on_update(session):
+            session.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.had_cookie = had_cookie
+        self.new = sid is None
+        self.modified = False
+        # Para rotar el identificador cuando cambia el usuario
+        self.initial_user_id = self.get('_user_id')
+
+    # Todas las sesiones duran PERMANENT_SESSION_LIFETIME; asignar permanent
+    # no modifica la sesión.
+    @property
+    def permanent(self):
+        return True
+
+    @permanent.setter
+    def permanent(self, value):
+        pass
+
+
+# =======================
+# Almacenes
+# =======================
+
+class MemoryStore:
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        with self._lock:
+            entry = self._entries.get(sid)
+        if entry is None or entry[0] < time.time():
+            return None
+        return entry
+
+    def set(self, sid, expires_at, payload):
+        with self._lock:
+            self._entries[sid] = (expires_at, payload)
+
+    def delete(self, sid):
+        with self._lock:
+            self._entries.pop(sid, None)
+
+    def collect(self, now, batch_size):
+        with self._lock:
+            expired = [sid for sid, (expires_at, _) in self._entries.items() if expires_at < now]
+            for sid in expired:
+                del self._entries[sid]
+        return len(expired)
+
+
+class SQLiteStore:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            # Primer uso en este hilo: la tabla puede no existir todavía
+            with connection:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS sessions ("
+                    "sid TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)"
+                )
+                connection.execute("CREATE INDEX IF NOT EXISTS ix_sessions_expires_at ON sessions (expires_at)")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get(self, sid):
+        return self._connection().execute(
+            "SELECT expires_at, data FROM sessions WHERE sid = ? AND expires_at >= ?",
+            (sid, time.time())
+        ).fetchone()
+
+    def set(self, sid, expires_at, payload):
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO sessions (sid, data, expires_at) VALUES (?, ?, ?)",
+                (sid, payload, expires_at)
+            )
+
+    def delete(self, sid):
+        with self._connection() as connection:
+            connection.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+    def collect(self, now, batch_size):
+        deleted = 0
+        while True:
+            # Un lote por transacción, para no bloquear a los demás workers
+            with self._connection() as connection:
+                count = connection.execute(
+                    "DELETE FROM sessions WHERE sid IN "
+                    "(SELECT sid FROM sessions WHERE expires_at < ? LIMIT ?)",
+                    (now, batch_size)
+                ).rowcount
+            deleted += count
+            if count < batch_size:
+                return deleted
+
+
+class FilesystemStore:
+    """Un fichero por sesión; su mtime es la hora de caducidad."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._created = False
+
+    def _path(self, sid):
+        return os.path.join(self.directory, sid)
+
+    def get(self, sid):
+        path = self._path(sid)
+        try:
+            expires_at = os.stat(path).st_mtime
+            if expires_at < time.time():
+                return None
+            with open(path, encoding='utf-8') as f:
+                return expires_at, f.read()
+        except FileNotFoundError:
+            return None
+
+    def set(self, sid, expires_at, payload):
+        if not self._created:
+            os.makedirs(self.directory, exist_ok=True)
+            self._created = True
+        path = self._path(sid)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(payload)
+        os.utime(tmp_path, (expires_at, expires_at))
+        os.replace(tmp_path, path)
+
+    def delete(self, sid):
+        try:
+            os.remove(self._path(sid))
+        except FileNotFoundError:
+            pass
+
+    def collect(self, now, batch_size):
+        if not os.path.isdir(self.directory):
+            return 0
+        deleted = 0
+        batch = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file() and entry.stat().st_mtime < now:
+                        batch.append(entry.path)
+                except FileNotFoundError:
+                    continue
+                if len(batch) >= batch_size:
+                    deleted += self._remove(batch)
+                    batch = []
+        return deleted + self._remove(batch)
+
+    @staticmethod
+    def _remove(paths):
+        removed = 0
+        for path in paths:
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+
+class RedisStore:
+    PREFIX = 'session:'
+
+    def __init__(self, url):
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, sid):
+        value = self.client.get(self.PREFIX + sid)
+        if value is None:
+            return None
+        entry = json.loads(value)
+        return entry['expires_at'], entry['data']
+
+    def set(self, sid, expires_at, payload):
+        ttl = max(1, int(expires_at - time.time()))
+        self.client.setex(self.PREFIX + sid, ttl, json.dumps({'expires_at': expires_at, 'data': payload}))
+
+    def delete(self, sid):
+        self.client.delete(self.PREFIX + sid)
+
+    def collect(self, now, batch_size):
+        # Redis borra las claves al caducar
+        return 0
+
+
+# =======================
+# Interfaz de sesión de Flask
+# =======================
+
+class ServerSessionInterface(SessionInterface):
+    serializer = session_json_serializer
+
+    def __init__(self, store, gc_interval=300, gc_batch=500):
+        self.store = store
+        self.gc_interval = gc_interval
+        self.gc_batch = gc_batch
+        self._next_gc = 0.0
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if not sid:
+            return ServerSession()
+        if _SID_RE.match(sid):
+            entry = self.store.get(sid)
+            if entry is not None:
+                expires_at, payload = entry
+                return ServerSession(self.serializer.loads(payload), sid=sid, expires_at=expires_at)
+        return ServerSession(had_cookie=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.sid is not None or session.had_cookie:
+            response.vary.add('Cookie')
+
+        if not session:
+            if session.sid is not None:
+                self.store.delete(session.sid)
+            if session.sid is not None or session.had_cookie:
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app),
+                                       samesite=self.get_cookie_samesite(app),
+                                       httponly=self.get_cookie_httponly(app))
+            return
+
+        now = time.time()
+        lifetime = app.permanent_session_lifetime.total_seconds()
+
+        if session.sid is not None and session.get('_user_id') != session.initial_user_id:
+            # Login o cambio de usuario: identificador nuevo
+            self.store.delete(session.sid)
+            session.sid = None
+
+        refresh = session.expires_at is not None and session.expires_at - now < lifetime / 2
+        if session.sid is not None and not session.modified and not refresh:
+            return
+
+        session.sid = session.sid or new_sid()
+        expires_at = now + lifetime
+        self.store.set(session.sid, expires_at, self.serializer.dumps(dict(session)))
+        response.set_cookie(
+            name, session.sid,
+            expires=datetime.fromtimestamp(expires_at, tz=timezone.utc),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+        if now >= self._next_gc:
+            self._next_gc = now + self.gc_interval
+            self.collect(now)
+
+    def collect(self, now=None):
+        return self.store.collect(now or time.time(), self.gc_batch)
+
+
+def make_store(flask_app):
+    backend = flask_app.config['SESSION_BACKEND']
+    path = flask_app.config['SESSION_PATH']
+    if backend == 'sqlite':
+        return SQLiteStore(path or os.path.join(flask_app.instance_path, 'sessions.db'))
+    if backend == 'filesystem':
+        return FilesystemStore(path or os.path.join(flask_app.instance_path, 'sessions'))
+    if backend == 'redis':
+        if redis is None:
+            raise ValueError("SESSION_BACKEND=redis requires the 'redis' package")
+        return RedisStore(flask_app.config['SESSION_REDIS_URL'])
+    if backend == 'memory':
+        return MemoryStore()
+    raise ValueError(f"Unknown SESSION_BACKEND {backend!r}")
+
+
+def install(flask_app):
+    """Sustituye la sesión por cookie de Flask según SESSION_BACKEND."""
+    if flask_app.config['SESSION_BACKEND'] == 'cookie':
+        return None
+
+    interface = ServerSessionInterface(
+        make_store(flask_app),
+        gc_interval=flask_app.config['SESSION_GC_INTERVAL'],
+        gc_batch=flask_app.config['SESSION_GC_BATCH'],
+    )
+    flask_app.session_interface = interface
+
+    @flask_app.cli.command('gc-sessions')
+    def gc_sessions_command():
+        """Borra las sesiones caducadas."""
+        print(f"{interface.collect()} sesiones caducadas borradas.")
+
+    return interface
@@ -0,0 +1,75 @@
+"""
+Perfil de conexión para SQLite en producción.
+
+Las opciones de pool de create_app() están pensadas para PostgreSQL. Con
+SQLite y varios workers de gunicorn, el modo de journal por defecto bloquea
+a los lectores mientras alguien escribe y aparece ``database is locked``.
+Este perfil se aplica en cada conexión nueva mediante un listener
+``connect``:
+
+- ``busy_timeout``: espera al bloqueo en lugar de fallar al instante.
+- ``journal_mode=WAL``: los lectores no bloquean a los escritores ni al revés.
+- ``synchronous=NORMAL``: con WAL sigue siendo seguro ante caídas del
+  proceso. Solo un corte de energía puede perder las últimas transacciones.
+- ``mmap_size``, ``cache_size``, ``temp_store=MEMORY``: menos E/S por consulta.
+
+Se elige con SQLITE_PROFILE (``production`` por defecto, ``none`` para
+dejar SQLite como viene).
+"""
+
+import os
+
+from sqlalchemy import event
+
+PROFILES = {
+    'none': {},
+    'production': {
+        # Primero busy_timeout, para que el cambio a WAL también espere al bloqueo
+        'busy_timeout': 5000,
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64 * 1024,  # negativo = KiB
+        'temp_store': 'MEMORY',
+    },
+}
+
+# Variables de entorno que ajustan valores sueltos del perfil
+OVERRIDES = {
+    'busy_timeout': 'SQLITE_BUSY_TIMEOUT_MS',
+    'mmap_size': 'SQLITE_MMAP_SIZE',
+    'cache_size': 'SQLITE_CACHE_SIZE',
+    'synchronous': 'SQLITE_SYNCHRONOUS',
+}
+
+
+def profile_pragmas(name):
+    if name not in PROFILES:
+        raise ValueError(f"Unknown SQLite profile {name!r}, expected one of {sorted(PROFILES)}")
+    pragmas = dict(PROFILES[name])
+    for pragma, variable in OVERRIDES.items():
+        if pragma in pragmas and os.environ.get(variable):
+            pragmas[pragma] = os.environ[variable]
+    return pragmas
+
+
+def apply_pragmas(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma, value in pragmas.items():
+            cursor.execute(f"PRAGMA {pragma}={value}")
+    finally:
+        cursor.close()
+
+
+def install(engine, name):
+    """Aplica el perfil ``name`` a cada conexión nueva de ``engine`` si es SQLite."""
+    if engine.dialect.name != 'sqlite':
+        return
+    pragmas = profile_pragmas(name)
+    if not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        apply_pragmas(dbapi_connection, pragmas)
@@ -10,6 +10,9 @@ document.addEventListener('DOMContentLoaded', function() {
     // Initialize search functionality
     initializeSearch();
     
+    // Initialize select2 typeahead lookups
+    initializeTypeahead();
+    
     // Initialize confirmation dialogs
     initializeConfirmations();
     
@@ -110,6 +113,89 @@ function initializeSearch() {
                 removeClearButton(input);
             }
         });
+        
+        // Title suggestions while typing
+        if (input.dataset.typeaheadUrl) {
+            addSuggestions(input);
+        }
+    });
+}
+
+/**
+ * Fill a datalist with matches from a typeahead endpoint, one request per pause in typing
+ */
+function addSuggestions(input) {
+    const datalist = document.createElement('datalist');
+    datalist.id = input.id + '-suggestions';
+    input.setAttribute('list', datalist.id);
+    input.setAttribute('autocomplete', 'off');
+    input.parentElement.appendChild(datalist);
+    
+    let timer = null;
+    let controller = null;
+    input.addEventListener('input', function() {
+        clearTimeout(timer);
+        const term = input.value.trim();
+        if (term.length < 2) {
+            datalist.innerHTML = '';
+            return;
+        }
+        timer = setTimeout(function() {
+            // Only the latest keystroke's response matters
+            if (controller) controller.abort();
+            controller = new AbortController();
+            const url = input.dataset.typeaheadUrl + (input.dataset.typeaheadUrl.includes('?') ? '&' : '?') + 'q=' + encodeURIComponent(term);
+            fetch(url, { signal: controller.signal, credentials: 'same-origin' })
+                .then(function(response) { return response.ok ? response.json() : { results: [] }; })
+                .then(function(data) {
+                    datalist.innerHTML = '';
+                    data.results.forEach(function(result) {
+                        const option = document.createElement('option');
+                        option.value = result.title || result.text;
+                        datalist.appendChild(option);
+                    });
+                })
+                .catch(function() {});
+        }, 250);
+    });
+}
+
+/**
+ * Initialize select2 inputs that search a typeahead endpoint instead of listing every option
+ */
+function initializeTypeahead() {
+    if (typeof $ === 'undefined' || !$.fn.select2) return;
+    
+    $('select[data-typeahead-url]').each(function() {
+        const select = $(this);
+        select.select2({
+            width: '100%',
+            placeholder: select.find('option[value=""]').text() || 'Selecciona una opción',
+            allowClear: true,
+            minimumInputLength: 1,
+            ajax: {
+                url: select.data('typeahead-url'),
+                dataType: 'json',
+                delay: 250,  // debounce: one request per pause in typing
+                data: function(params) {
+                    return { q: params.term };
+                },
+                processResults: function(data) {
+                    return data;
+                }
+            },
+            language: {
+                searching: function() {
+                    return 'Buscando...';
+                },
+                inputTooShort: function() {
+                    return 'Escribe para buscar...';
+                },
+                noResults: function() {
+                    return 'No se encontraron resultados';
+                }
+            }
+        });
     });
 }
 
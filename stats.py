@@ -0,0 +1,223 @@
+"""
+Contadores materializados para el panel de administración.
+
+admin_dashboard ejecutaba cuatro COUNT(*) por visita. Ahora los totales
+viven en la tabla ``stat_counters`` y se actualizan con eventos del ORM en
+la misma transacción que el cambio que los provoca (alta/baja de libros y
+usuarios, creación y devolución de préstamos), así que leerlos es O(1).
+
+Las escrituras masivas que no pasan por el ORM (INSERT de Core, SQL a mano)
+no disparan los eventos: reconcile_counters() recalcula todo desde cero y
+registra cualquier desviación (``flask --app main reconcile-stats``).
+
+``active_loans`` cuenta los préstamos sin devolver (``active`` y
+``overdue``). ``overdue_loans`` cuenta los vencidos; el planificador de
+overdue.py lo ajusta al cambiar el estado en bloque.
+"""
+
+import logging
+from datetime import datetime
+
+from sqlalchemy import event, inspect
+
+from app import app, db
+from models import OUTSTANDING_STATUSES, Book, Loan, LoanArchive, StatCounter, User
+
+counter_table = StatCounter.__table__
+
+# Cómo recalcular cada contador desde cero
+COUNTER_QUERIES = {
+    'total_books': lambda: Book.query.count(),
+    'total_users': lambda: User.query.count(),
+    # Incluye los archivados (loan_archive.py): archivar no cambia el total
+    'total_loans': lambda: Loan.query.count() + LoanArchive.query.count(),
+    'active_loans': lambda: Loan.query.filter(Loan.status.in_(OUTSTANDING_STATUSES)).count(),
+    'overdue_loans': lambda: Loan.query.filter_by(status='overdue').count(),
+}
+
+
+# No es un recuento: solo crece, para invalidar cachés del catálogo
+CATALOG_VERSION = 'catalog_version'
+
+
+def _increment_statement(name, delta):
+    return (
+        counter_table.update()
+        .where(counter_table.c.name == name)
+        .values(value=counter_table.c.value + delta, updated_at=datetime.utcnow())
+    )
+
+
+def _bump(connection, name, delta):
+    connection.execute(_increment_statement(name, delta))
+
+
+def adjust_counter(name, delta):
+    """Ajusta un contador en la sesión actual, para escrituras que no pasan por el ORM."""
+    db.session.execute(_increment_statement(name, delta))
+
+
+def _status_counters(status):
+    """Contadores de préstamos en los que cuenta un préstamo con ``status``."""
+    status = status or 'active'
+    counters = set()
+    if status in OUTSTANDING_STATUSES:
+        counters.add('active_loans')
+    if status == 'overdue':
+        counters.add('overdue_loans')
+    return counters
+
+
+@event.listens_for(Book, 'after_insert')
+def _book_inserted(mapper, connection, target):
+    _bump(connection, 'total_books', 1)
+
+
+@event.listens_for(Book, 'after_delete')
+def _book_deleted(mapper, connection, target):
+    _bump(connection, 'total_books', -1)
+
+
+@event.listens_for(User, 'after_insert')
+def _user_inserted(mapper, connection, target):
+    _bump(connection, 'total_users', 1)
+
+
+@event.listens_for(User, 'after_delete')
+def _user_deleted(mapper, connection, target):
+    _bump(connection, 'total_users', -1)
+
+
+@event.listens_for(Loan, 'after_insert')
+def _loan_inserted(mapper, connection, target):
+    _bump(connection, 'total_loans', 1)
+    for name in _status_counters(target.status):
+        _bump(connection, name, 1)
+
+
+@event.listens_for(Loan, 'after_update')
+def _loan_updated(mapper, connection, target):
+    history = inspect(target).attrs.status.history
+    if not history.has_changes():
+        return
+    before = set().union(*(_status_counters(status) for status in history.deleted))
+    after = _status_counters(target.status)
+    for name in before - after:
+        _bump(connection, name, -1)
+    for name in after - before:
+        _bump(connection, name, 1)
+
+
+@event.listens_for(Loan, 'after_delete')
+def _loan_deleted(mapper, connection, target):
+    _bump(connection, 'total_loans', -1)
+    for name in _status_counters(target.status):
+        _bump(connection, name, -1)
+
+
+def catalog_version():
+    """Versión del catálogo; cambia cada vez que se crea, edita o borra un libro."""
+    counter = db.session.get(StatCounter, CATALOG_VERSION)
+    return counter.value if counter else 0
+
+
+def bump_catalog_version():
+    result = db.session.execute(_increment_statement(CATALOG_VERSION, 1))
+    if result.rowcount == 0:
+        set_counters({CATALOG_VERSION: 1})
+    db.session.commit()
+
+
+def _counter_insert(dialect_name):
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return None
+    return dialect_insert(StatCounter)
+
+
+def set_counters(values, overwrite=True):
+    """
+    Fija el valor de los contadores ``{nombre: valor}`` en la sesión actual.
+
+    Es un ``INSERT ... ON CONFLICT DO UPDATE``: dos procesos que crean la misma
+    fila a la vez no fallan con una clave primaria duplicada. Con
+    ``overwrite=False`` (``DO NOTHING``) solo crea las filas que falten.
+    """
+    now = datetime.utcnow()
+    rows = [{'name': name, 'value': value, 'updated_at': now} for name, value in values.items()]
+    statement = _counter_insert(db.engine.dialect.name)
+    if statement is None:
+        for row in rows:
+            if overwrite or db.session.get(StatCounter, row['name']) is None:
+                db.session.merge(StatCounter(**row))
+        return
+    if overwrite:
+        statement = statement.on_conflict_do_update(
+            index_elements=[StatCounter.name],
+            set_={'value': statement.excluded.value, 'updated_at': statement.excluded.updated_at},
+        )
+    else:
+        statement = statement.on_conflict_do_nothing(index_elements=[StatCounter.name])
+    db.session.execute(statement, rows)
+
+
+def seed_counters():
+    """
+    Crea con su valor real los contadores que falten y hace commit.
+
+    Lo ejecuta upgrade-db: las peticiones no recalculan contadores.
+    """
+    existing = {name for name, in db.session.query(StatCounter.name)}
+    missing = {name: recompute() for name, recompute in COUNTER_QUERIES.items() if name not in existing}
+    if CATALOG_VERSION not in existing:
+        missing[CATALOG_VERSION] = 0
+    if missing:
+        set_counters(missing, overwrite=False)
+    db.session.commit()
+    return missing
+
+
+def reconcile_counters():
+    """
+    Recalcula todos los contadores y corrige los que se hayan desviado.
+
+    Devuelve ``{nombre: (guardado, real)}`` con las desviaciones encontradas.
+    """
+    stored = {counter.name: counter.value for counter in StatCounter.query.all()}
+    drift = {}
+    for name, recompute in COUNTER_QUERIES.items():
+        actual = recompute()
+        if stored.get(name) != actual:
+            drift[name] = (stored.get(name), actual)
+    if drift:
+        set_counters({name: actual for name, (_, actual) in drift.items()})
+    db.session.commit()
+
+    for name, (old, new) in drift.items():
+        if old is None:
+            logging.info(f"Stat counter {name} initialized to {new}")
+        else:
+            logging.warning(f"Stat counter {name} drifted: stored={old} actual={new}")
+    return drift
+
+
+def get_counters():
+    """Lee los contadores; si falta alguno (base nueva o recreada) los recalcula."""
+    counters = {counter.name: counter.value for counter in StatCounter.query.all()}
+    if not set(COUNTER_QUERIES) <= set(counters):
+        reconcile_counters()
+        counters = {counter.name: counter.value for counter in StatCounter.query.all()}
+    return counters
+
+
+@app.cli.command('reconcile-stats')
+def reconcile_stats_command():
+    """Recalcula los contadores del panel y muestra las desviaciones."""
+    drift = reconcile_counters()
+    if not drift:
+        print("Contadores correctos.")
+    for name, (old, new) in drift.items():
+        print(f"{name}: {old} -> {new}")
@@ -0,0 +1,245 @@
+"""
+Caché del user_loader de Flask-Login.
+
+Cada petición autenticada hacía un SELECT por clave primaria solo para
+reconstruir ``current_user``. Aquí se guardan los valores de las columnas
+del usuario durante USER_CACHE_TTL segundos. En un acierto, el User se
+reconstruye y se adjunta a la sesión con ``merge(load=False)``, sin tocar la
+base de datos. Los cambios en las relaciones (``loans``...) siguen
+cargándose de forma perezosa como siempre.
+
+Backends (USER_CACHE_BACKEND):
+
+- ``memory``: LRU por proceso, acotado a USER_CACHE_SIZE entradas.
+- ``sqlite``: fichero SQLite compartido por todos los workers de la máquina,
+  de modo que invalidar en un worker vale para todos. Los valores se guardan
+  como JSON (fechas en ISO 8601). El fichero y la tabla se crean en el primer
+  uso, no al importar.
+
+No se guarda ``password_hash``: ``current_user`` no lo necesita, y si algo
+lo pide (check_password) se carga de la base de datos.
+- ``none``: sin caché.
+
+Las vistas que modifican usuarios llaman a invalidate(). Con el backend
+``memory`` los demás workers ven el cambio cuando expira el TTL.
+
+Aciertos, fallos e invalidaciones de cada proceso salen en ``/admin/metrics``
+como ``user_cache_hits_total``, ``user_cache_misses_total`` y
+``user_cache_invalidations_total``.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app import app, db
+from models import User
+
+
+class MemoryBackend:
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, values = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return values
+
+    def set(self, key, values):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, values)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _decode(obj):
+    if '__datetime__' in obj:
+        return datetime.fromisoformat(obj['__datetime__'])
+    return obj
+
+
+class SQLiteBackend:
+    """Caché compartida entre procesos de la misma máquina, en un fichero SQLite."""
+
+    def __init__(self, path, ttl):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")
+            # Primer uso en este hilo: la tabla puede no existir todavía
+            with connection:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS user_cache ("
+                    "key INTEGER PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)"
+                )
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get(self, key):
+        row = self._connection().execute(
+            "SELECT value FROM user_cache WHERE key = ? AND expires_at >= ?",
+            (key, time.time())
+        ).fetchone()
+        if row is None:
+            return None
+        try:
+            return json.loads(row[0], object_hook=_decode)
+        except ValueError:
+            # Entrada de una versión anterior (pickle): cuenta como fallo y se reescribe
+            return None
+
+    def set(self, key, values):
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO user_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(values, default=_encode), time.time() + self.ttl)
+            )
+
+    def delete(self, key):
+        with self._connection() as connection:
+            connection.execute("DELETE FROM user_cache WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._connection() as connection:
+            connection.execute("DELETE FROM user_cache")
+
+
+class UserCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        # Los workers gthread atienden varias peticiones a la vez
+        self._lock = threading.Lock()
+
+    def stats(self):
+        with self._lock:
+            hits, misses, invalidations = self.hits, self.misses, self.invalidations
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'invalidations': invalidations,
+            'hit_ratio': hits / total if total else 0.0,
+        }
+
+    def prometheus_counters(self):
+        """Contadores para instrumentation.render_prometheus()."""
+        stats = self.stats()
+        return [
+            ('user_cache_hits_total', 'user_loader lookups served from the cache.', stats['hits']),
+            ('user_cache_misses_total', 'user_loader lookups that queried the database.', stats['misses']),
+            ('user_cache_invalidations_total', 'Users invalidated after a change.', stats['invalidations']),
+        ]
+
+    def load_user(self, user_id):
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            return None
+
+        values = self.backend.get(user_id) if self.backend else None
+        if values is None:
+            with self._lock:
+                self.misses += 1
+            user = db.session.get(User, user_id)
+            if user is not None and self.backend:
+                self.backend.set(user_id, column_values(user))
+            return user
+
+        with self._lock:
+            self.hits += 1
+        return attach(values)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self.invalidations += 1
+        if self.backend:
+            self.backend.delete(int(user_id))
+
+
+# Columnas que no se guardan en caché
+EXCLUDED_COLUMNS = {'password_hash'}
+
+
+def column_values(user):
+    return {attr.key: getattr(user, attr.key) for attr in User.__mapper__.column_attrs
+            if attr.key not in EXCLUDED_COLUMNS}
+
+
+def attach(values):
+    """Reconstruye un User desde caché y lo adjunta a la sesión sin consultar."""
+    user = User()
+    for key, value in values.items():
+        set_committed_value(user, key, value)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+def make_backend(flask_app):
+    name = flask_app.config['USER_CACHE_BACKEND']
+    ttl = flask_app.config['USER_CACHE_TTL']
+    if name == 'memory':
+        return MemoryBackend(flask_app.config['USER_CACHE_SIZE'], ttl)
+    if name == 'sqlite':
+        path = flask_app.config['USER_CACHE_PATH'] or os.path.join(flask_app.instance_path, 'user_cache.db')
+        return SQLiteBackend(path, ttl)
+    if name == 'none':
+        return None
+    raise ValueError(f"Unknown USER_CACHE_BACKEND {name!r}")
+
+
+user_cache = UserCache(make_backend(app))
+
+
+def load_user(user_id):
+    return user_cache.load_user(user_id)
+
+
+def invalidate(user_id):
+    user_cache.invalidate(user_id)
+
+
+def prometheus_counters():
+    return user_cache.prometheus_counters()